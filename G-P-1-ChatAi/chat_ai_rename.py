@@ -1,19 +1,23 @@
+import asyncio
 import os
-import random
+import threading
 import time
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
+from langchain_core.exceptions import OutputParserException
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from openai import RateLimitError
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+from prompt_trim import trim_text
 
 
 # --- 1. 定义 Pydantic 输出模型 ---
 # 这个模型定义了我们希望从发票中提取的所有信息结构
 class InvoiceInfo(BaseModel):
     """从发票中提取的结构化信息模型"""
-    invoice_number: Optional[str] = Field(default=None, description="发票上的唯一号码（如：2511700000321326035）")
+    invoice_number: Optional[str] = Field(default=None, description="发票上的唯一号码（如：25117000000321326035）")
     issue_date: Optional[str] = Field(default=None, description="发票开票日期，格式为YYYY年MM月DD日（如：2025年02月27日）")
     buyer_name: Optional[str] = Field(default=None, description="购买方公司名称（如：武汉东湖学院）")
     buyer_tax_id: Optional[str] = Field(default=None, description="购买方统一社会信用代码/纳税人识别号")
@@ -26,6 +30,59 @@ class InvoiceInfo(BaseModel):
     preparer: Optional[str] = Field(default=None, description="开票人姓名（如：王丽丽）")
 
 
+class BatchInvoiceInfo(InvoiceInfo):
+    """批量提取时带编号的单张发票信息"""
+    index: int = Field(description="该发票在本次请求中的编号，即【发票 N】中的 N")
+
+
+class InvoiceBatch(BaseModel):
+    """一次请求中多张发票的提取结果"""
+    invoices: List[BatchInvoiceInfo] = Field(description="每张发票一条记录，与输入的编号一一对应")
+
+
+class RateLimiter:
+    """
+    大模型请求的流量控制：按每分钟请求数均匀放行；遇到 429 时让所有请求一起暂停，
+    取代原来每个文件固定随机 sleep 的做法。同步调用和异步协程共用一个实例。
+    """
+
+    def __init__(self, requests_per_minute: int = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def _reserve(self) -> float:
+        """预约下一个可用的发送时间，返回还需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+            return start - now
+
+    def pause(self, seconds: float):
+        """服务端限流时调用，seconds 秒内不再放行任何请求。"""
+        with self._lock:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_slot(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _retry_after(error: RateLimitError, default: float) -> float:
+    """优先使用服务端返回的 Retry-After 头。"""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
 # --- 2. 创建封装类 ---
 class InvoiceExtractor:
     """
@@ -50,7 +107,11 @@ class InvoiceExtractor:
             self,
             model_name: str = 'moonshot-v1-8k',
             api_key: str = None,
-            temperature: float = 0.0
+            temperature: float = 0.0,
+            max_concurrency: int = None,
+            requests_per_minute: int = None,
+            batch_size: int = None,
+            max_batch_chars: int = None
         ):
         """
         初始化提取器。
@@ -58,40 +119,104 @@ class InvoiceExtractor:
         :param model_name: 要使用的模型名称，例如 'moonshot-v1-8k' 或 'deepseek-chat'。
         :param api_key: OpenAI API Key。如果为 None，将从环境变量 OPENAI_API_KEY 读取。
         :param temperature: 模型的温度参数。
+        :param max_concurrency: 异步批量提取时同时在途的请求数，默认读环境变量 LLM_MAX_CONCURRENCY（4）。
+        :param requests_per_minute: 每分钟最多发送的请求数，默认读环境变量 LLM_REQUESTS_PER_MINUTE（0 表示不限制）。
+        :param batch_size: 批量提取时一次请求最多打包几张发票，默认读环境变量 LLM_BATCH_SIZE（4，1 表示不打包）。
+        :param max_batch_chars: 一次请求打包的发票文本总字数上限，默认读环境变量 LLM_BATCH_CHARS（4000），
+                                避免超出模型上下文长度。
         """
         # 设置 API Key（如果提供了的话）
         if api_key:
             os.environ["OPENAI_API_KEY"] = api_key
 
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+        if requests_per_minute is None:
+            requests_per_minute = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 0))
+        if batch_size is None:
+            batch_size = int(os.environ.get("LLM_BATCH_SIZE", 4))
+        if max_batch_chars is None:
+            max_batch_chars = int(os.environ.get("LLM_BATCH_CHARS", 4000))
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_batch_chars = max_batch_chars
+        self.limiter = RateLimiter(requests_per_minute)
+        # 请求计数，供耗时统计使用：requests 实际发出的请求数，retries 429 重试次数，
+        # failed 最终没拿到结果的发票数，batch_splits 批量结果不完整而拆分的次数
+        self.stats = {"requests": 0, "retries": 0, "failed": 0, "batch_splits": 0}
+        self._loop = None  # 异步批量提取用的后台事件循环，第一次用到时才创建
+        # 多个线程同时调用 extract_partial 时共用同一个并发上限
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop_lock = threading.Lock()
+        self._partial_chains = {}  # 只提取部分字段时用的链，按字段组合缓存
+        self._chain_lock = threading.Lock()
+
         # 初始化模型和提示
         self.model = ChatOpenAI(model_name=model_name, temperature=temperature)
 
+        system_prompt = (
+            "你是一个专业的发票信息提取算法。请仅从用户提供的发票文本中提取相关信息，"
+            "并填充到预定义的JSON结构中。如果某个字段的值在文本中找不到，请不要编造，"
+            "让该字段的值为null。"
+            "如果遇到 下面这样的"
+            "'名称：武汉东湖学院"
+            " 名称：中国移动通信集团湖北有限公司武汉分公司"
+            " 一社会信用代码/纳税人识别号：52420000123406283C"
+            " 一社会信用代码/纳税人识别号：91420100717918134N'"
+            "切记 购方税号 和 销方税号是按照 单位名称顺序对应"
+            "即：武汉东湖学院-52420000123406283C"
+        )
         self.prompt = ChatPromptTemplate.from_messages([
-            ("system",
-             "你是一个专业的发票信息提取算法。请仅从用户提供的发票文本中提取相关信息，"
-             "并填充到预定义的JSON结构中。如果某个字段的值在文本中找不到，请不要编造，"
-             "让该字段的值为null。"
-             "如果遇到 下面这样的"
-             "'名称：武汉东湖学院"
-             " 名称：中国移动通信集团湖北有限公司武汉分公司"
-             " 一社会信用代码/纳税人识别号：52420000123406283N"
-             " 一社会信用代码/纳税人识别号：91420100717918134N'"
-             "切记 购方税号 和 销方税号是按照 单位名称顺序对应"
-             "即：武汉东湖学院-52420000123406283N"
-             ),
+            ("system", system_prompt),
             ("human", "{invoice_text}")
         ])
+        # 批量模式：多张发票共用一份系统提示，按编号分别返回
+        self.batch_prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt +
+             "用户会一次提供{count}张发票，每张以【发票 编号】开头。请为每张发票分别输出一条记录，"
+             "index 填该发票的编号，不同发票之间的信息不要混用。"),
+            ("human", "{invoice_texts}")
+        ])
 
         # 创建结构化输出链
         # 注意：根据之前的讨论，如果模型不支持 json_schema，需要显式指定 method="function_calling"
         # 对于 moonshot 和 deepseek，通常需要这样做。
         self.extraction_chain = self.prompt | self.model.with_structured_output(InvoiceInfo, method="function_calling")
+        self.batch_chain = self.batch_prompt | self.model.with_structured_output(InvoiceBatch, method="function_calling")
 
-    def extract(self, invoice_text: str) -> Dict[str, Optional[str]]:
+    def _chains(self, keys: tuple = None):
+        """
+        返回 (单张, 批量) 结构化输出链。keys 为英文字段名时输出结构里只有这些字段，
+        只补几个字段时模型不用再把全部 11 个字段输出一遍。
+        """
+        if not keys:
+            return self.extraction_chain, self.batch_chain
+        with self._chain_lock:
+            chains = self._partial_chains.get(keys)
+            if chains is None:
+                info = create_model("PartialInvoiceInfo", __doc__=InvoiceInfo.__doc__,
+                                    **{key: (Optional[str], InvoiceInfo.model_fields[key]) for key in keys})
+                batch_info = create_model("PartialBatchInvoiceInfo", __base__=info, __doc__=BatchInvoiceInfo.__doc__,
+                                          index=(int, BatchInvoiceInfo.model_fields["index"]))
+                batch = create_model("PartialInvoiceBatch", __doc__=InvoiceBatch.__doc__,
+                                     invoices=(List[batch_info], InvoiceBatch.model_fields["invoices"]))
+                chains = self._partial_chains[keys] = (
+                    self.prompt | self.model.with_structured_output(info, method="function_calling"),
+                    self.batch_prompt | self.model.with_structured_output(batch, method="function_calling"),
+                )
+            return chains
+
+    def _keys(self, fields: list[str]) -> tuple:
+        """中文字段列表 -> 按 InvoiceInfo 中顺序排列的英文字段名。"""
+        wanted = {self._FIELD_MAP.get(key) for key in fields}
+        return tuple(key for key in InvoiceInfo.model_fields if key in wanted)
+
+    def extract(self, invoice_text: str, keys: tuple = None) -> Dict[str, Optional[str]]:
         """
         从给定的发票文本中提取信息，包含自动重试逻辑。
 
         :param invoice_text: 发票的完整原始文本。
+        :param keys: 只提取这些英文字段名（见 _keys），默认提取全部字段。
         :return: 一个字典，包含提取的字段和值。如果字段未找到，值为 None。
         """
         max_retries = 3
@@ -102,7 +227,9 @@ class InvoiceExtractor:
         while retries <= max_retries:
             try:
                 # 尝试调用API
-                extracted_info: InvoiceInfo = self.extraction_chain.invoke({"invoice_text": invoice_text})
+                self.limiter.wait()
+                self.stats["requests"] += 1
+                extracted_info: InvoiceInfo = self._chains(keys)[0].invoke({"invoice_text": invoice_text})
                 return extracted_info.model_dump()
 
             except RateLimitError as e:
@@ -110,22 +237,163 @@ class InvoiceExtractor:
                 retries += 1
                 if retries > max_retries:
                     print(f"❌ 达到最大重试次数 {max_retries}，放弃重试。最终错误：{e}")
+                    self.stats["failed"] += 1
                     # --- 修复点：使用 .keys() 获取字段名 ---
                     return {key: None for key in InvoiceInfo.model_fields.keys()}
 
-                print(f"⚠️ API 速率限制 (429)，将在 {wait_time} 秒后进行第 {retries} 次重试...")
-                time.sleep(wait_time)
+                delay = _retry_after(e, wait_time)
+                print(f"⚠️ API 速率限制 (429)，将在 {delay} 秒后进行第 {retries} 次重试...")
+                self.stats["retries"] += 1
+                self.limiter.pause(delay)
                 wait_time *= 1.5  # 指数退避：下次等待时间翻倍 (2s, 4s, 8s...)
 
             except Exception as e:
                 # 对于其他类型的错误（如网络问题、API密钥错误），直接返回失败
                 print(f"❌ 处理过程中发生非速率限制错误：{e}")
+                self.stats["failed"] += 1
                 # --- 修复点：使用 .keys() 获取字段名 ---
                 return {key: None for key in InvoiceInfo.model_fields.keys()}
 
         # 理论上不会执行到这里，但为了代码完整性
         return {key: None for key in InvoiceInfo.model_fields.keys()}
 
+    async def _ainvoke(self, chain, payload):
+        """带限流和 429 重试地异步调用 chain，重试用尽或遇到其他错误时抛出异常。"""
+        max_retries = 3
+        wait_time = 60
+        for retries in range(max_retries + 1):
+            await self.limiter.await_slot()
+            self.stats["requests"] += 1
+            try:
+                return await chain.ainvoke(payload)
+            except RateLimitError as e:
+                if retries >= max_retries:
+                    print(f"❌ 达到最大重试次数 {max_retries}，放弃重试。最终错误：{e}")
+                    raise
+                delay = _retry_after(e, wait_time)
+                print(f"⚠️ API 速率限制 (429)，将在 {delay} 秒后进行第 {retries + 1} 次重试...")
+                self.stats["retries"] += 1
+                self.limiter.pause(delay)
+                wait_time *= 1.5
+
+    async def aextract(self, invoice_text: str, keys: tuple = None) -> Optional[Dict[str, Optional[str]]]:
+        """
+        extract 的异步版本，重试和限流逻辑相同，等待期间不占用线程。
+        请求失败（重试用尽、网络、密钥等错误）时返回 None，与“请求成功但字段没找到”区分开。
+        """
+        try:
+            extracted_info: InvoiceInfo = await self._ainvoke(self._chains(keys)[0], {"invoice_text": invoice_text})
+            return extracted_info.model_dump()
+        except RateLimitError:
+            pass
+        except Exception as e:
+            print(f"❌ 处理过程中发生非速率限制错误：{e}")
+        self.stats["failed"] += 1
+        return None
+
+    async def aextract_batch(self, invoice_texts: list[str], keys: tuple = None) -> list[Optional[Dict[str, Optional[str]]]]:
+        """
+        把多张发票打包进一次请求提取，结果按编号还原成与 invoice_texts 相同的顺序，请求失败的发票为 None。
+        返回结果缺张、编号对不上或无法解析时，对半拆分后分别重试，拆到单张时退回 aextract。
+        """
+        if len(invoice_texts) == 1:
+            return [await self.aextract(invoice_texts[0], keys)]
+        packed = "\n\n".join(f"【发票 {i}】\n{text}" for i, text in enumerate(invoice_texts))
+        try:
+            batch: InvoiceBatch = await self._ainvoke(
+                self._chains(keys)[1], {"invoice_texts": packed, "count": len(invoice_texts)}
+            )
+        except (OutputParserException, ValidationError) as e:
+            # 模型输出的结构不对才拆分重试；网络、密钥、额度等错误拆开也一样失败，整批只失败一次
+            print(f"⚠️ 批量结果解析失败（{e}），拆分后重试...")
+        except Exception as e:
+            if not isinstance(e, RateLimitError):
+                print(f"❌ 批量请求失败：{e}")
+            self.stats["failed"] += len(invoice_texts)
+            return [None] * len(invoice_texts)
+        else:
+            invoices = batch.invoices if batch is not None else []
+            by_index = {item.index: item for item in invoices}
+            if len(invoices) == len(invoice_texts) and sorted(by_index) == list(range(len(invoice_texts))):
+                return [by_index[i].model_dump(exclude={"index"}) for i in range(len(invoice_texts))]
+            print(f"⚠️ 批量结果不完整（返回 {len(invoices)}/{len(invoice_texts)} 张），拆分后重试...")
+        self.stats["batch_splits"] += 1
+        mid = len(invoice_texts) // 2
+        return (await self.aextract_batch(invoice_texts[:mid], keys)
+                + await self.aextract_batch(invoice_texts[mid:], keys))
+
+    def _pack(self, invoice_texts: list[str]) -> list[list[int]]:
+        """按 batch_size 和 max_batch_chars 把发票编号分组，每组一次请求。"""
+        groups, chars = [], 0
+        for i, text in enumerate(invoice_texts):
+            size = len(text or "")
+            if not groups or len(groups[-1]) >= self.batch_size or chars + size > self.max_batch_chars:
+                groups.append([])
+                chars = 0
+            groups[-1].append(i)
+            chars += size
+        return groups
+
+    async def aextract_many(self, invoice_texts: list[str], fields: list[str] = None,
+                            semaphore: asyncio.Semaphore = None, partial: bool = False) -> list[Optional[Dict[str, Optional[str]]]]:
+        """
+        并发提取多张发票，同时在途的请求不超过 max_concurrency，结果顺序与 invoice_texts 一致，请求失败的为 None。
+        短发票按 batch_size 打包进同一次请求，系统提示只发送一次。
+
+        :param fields: 传入中文字段列表时按 format_by_fields 返回，否则返回英文字段名的原始字典。
+        :param semaphore: 与其他调用共用的并发上限，默认本次调用单独限制为 max_concurrency。
+        :param partial: 为 True 时只让模型输出 fields 中的字段（用于补全本地解析失败的几个字段）。
+        """
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        results = [None] * len(invoice_texts)
+        keys = self._keys(fields) if partial and fields else None
+
+        async def extract_group(group):
+            async with semaphore:
+                values = await self.aextract_batch([invoice_texts[i] for i in group], keys)
+            for i, data in zip(group, values):
+                results[i] = self.format_by_fields(data, fields) if fields and data is not None else data
+
+        await asyncio.gather(*(extract_group(group) for group in self._pack(invoice_texts)))
+        return results
+
+    def _get_loop(self):
+        # 所有异步请求都跑在同一个后台事件循环里，HTTP 连接池可以跨批次复用
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    async def aextract_partial(self, invoice_texts: list[str], field_lists: list[list[str]],
+                               semaphore: asyncio.Semaphore = None) -> list[Optional[Dict[str, Optional[str]]]]:
+        """
+        每张发票只提取各自 field_lists[i] 中的中文字段，返回按中文字段名的字典，顺序与 invoice_texts 一致，
+        请求失败的发票为 None。
+        要提取的字段相同的发票打包在一起，各组并发请求。
+        """
+        groups = {}
+        for i, fields in enumerate(field_lists):
+            groups.setdefault(tuple(fields), []).append(i)
+        results = [None] * len(invoice_texts)
+
+        async def extract_group(fields, indexes):
+            values = await self.aextract_many([invoice_texts[i] for i in indexes], list(fields), semaphore, True)
+            for i, data in zip(indexes, values):
+                results[i] = data
+
+        await asyncio.gather(*(extract_group(fields, indexes) for fields, indexes in groups.items()))
+        return results
+
+    def extract_partial(self, invoice_texts: list[str],
+                        field_lists: list[list[str]]) -> list[Optional[Dict[str, Optional[str]]]]:
+        """aextract_partial 的同步包装。"""
+        if not invoice_texts:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self.aextract_partial(invoice_texts, field_lists, self._semaphore),
+                                                  self._get_loop())
+        return future.result()
+
     # --- 新增函数 ---
     def format_by_fields(self, extracted_data: Dict[str, Optional[str]], fields: list[str]) -> Dict[str, Optional[str]]:
         """
@@ -151,49 +419,105 @@ class InvoiceExtractor:
 
         return formatted_result
 
+    def extract_by_fields(self, invoice_text: str, fields: list[str]) -> Dict[str, Optional[str]]:
+        """
+        提取发票信息并按中文字段名返回。
+
+        :param invoice_text: 发票的完整原始文本。
+        :param fields: 中文字段列表，例如 ['开票日期', '总税额']。
+        :return: 键是中文字段名的字典，找不到的字段值为 None。
+        """
+        # 1. 只发送这些字段标签附近的文本（见 prompt_trim），只让模型输出这些字段
+        trimmed_text = trim_text(invoice_text, fields)
+        full_data_dict = self.extract(trimmed_text, self._keys(fields))
+
+        # 2. 调用新函数，按需格式化（请求间隔由 self.limiter 控制）
+        formatted = self.format_by_fields(full_data_dict, fields)
+        # 3. 裁剪后的文本里有字段没找到时，用全文再问一次
+        if trimmed_text != invoice_text and any(value is None for value in formatted.values()):
+            formatted = self.format_by_fields(self.extract(invoice_text, self._keys(fields)), fields)
+        return formatted
+
     # 调用ai方法 文本专用
     def get_rename_by_chat_ai(self, invoice_text, fields, split):
-        # 1. 先提取所有信息
-        full_data_dict = self.extract(invoice_text)
-
-        # 2. 调用新函数，按需格式化
-        formatted_data = self.format_by_fields(full_data_dict, fields)
-        time.sleep(random.randint(1, 3))
-        # 3. 改成文件命名
-        return split.join(formatted_data.values())
+        formatted_data = self.extract_by_fields(invoice_text, fields)
+        # 改成文件命名，找不到的字段用空字符串占位
+        return split.join(value or "" for value in formatted_data.values())
 
 ######################### 下面是用ocr识别图片，不太准 #########################
-from typing import Union, List
-import numpy as np
-from PIL import Image
-from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
+# numpy / PIL / paddleocr / pypdfium2 在创建 ImageOcrExtractor 时才导入，只用大模型时不加载
+from typing import Union, List, Tuple
 import logging
 logging.getLogger('ppocr').setLevel(logging.ERROR)   # 只显示错误
 
+# 扫描件 PDF 先用低分辨率渲染识别，平均置信度低于阈值时再提高分辨率重新识别这一页
+OCR_DPI_STEPS = (150, 300)
+OCR_MIN_CONFIDENCE = 0.85
+# 扫描件 PDF 最多识别的页数；识别到“价税合计”说明发票主体已经读完，不再渲染后面的页
+OCR_MAX_PAGES = 5
+OCR_STOP_ANCHOR = "价税合计"
+
+# 增值税发票版面固定，各字段所在区域（按整张发票宽高的比例：左, 上, 右, 下）。
+# 传入要识别的字段时只裁出这些区域识别，不再整页检测；区域里没识别出文字时整页重新识别。
+OCR_REGIONS = {
+    "发票号码": (0.62, 0.00, 1.00, 0.18),
+    "开票日期": (0.62, 0.00, 1.00, 0.18),
+    "购方名称": (0.00, 0.14, 0.52, 0.36),
+    "购方税号": (0.00, 0.14, 0.52, 0.36),
+    "销方名称": (0.48, 0.14, 1.00, 0.36),
+    "销方税号": (0.48, 0.14, 1.00, 0.36),
+    "合计": (0.00, 0.58, 1.00, 0.72),
+    "总税额": (0.00, 0.58, 1.00, 0.72),
+    "价税合计": (0.00, 0.68, 1.00, 0.80),
+    "价税合计大写": (0.00, 0.68, 1.00, 0.80),
+    "开票人": (0.00, 0.86, 0.60, 1.00),
+}
+
+
+def field_regions(fields):
+    """返回 fields 需要识别的区域（去重，按版面从上到下），有字段不在模板里时返回 None。"""
+    if not fields or any(field not in OCR_REGIONS for field in fields):
+        return None
+    return sorted({OCR_REGIONS[field] for field in fields}, key=lambda box: (box[1], box[0]))
+
 # --- 1. 创建封装类 ---
 class ImageOcrExtractor:
     """
     一个用于从图片或PDF文件中提取文本的封装类。
     """
 
-    def __init__(self, use_angle_cls: bool = True, lang: str = 'ch'):
+    def __init__(self, use_angle_cls: bool = True, lang: str = 'ch', server_address: str = None):
         """
         初始化OCR提取器，并加载PaddleOCR模型。
 
         :param use_angle_cls: 是否使用文字方向分类器。
         :param lang: 指定OCR的语言，'ch'代表中文。
+        :param server_address: 常驻 OCR 服务地址（见 ocr_server.py），传 "" 表示使用默认地址。
+                               连得上时识别请求交给服务中已加载好的模型，不在本进程加载；None 表示不使用服务。
         """
+        self.use_angle_cls = use_angle_cls
+        self.lang = lang
+        self.ocr = None
+        self.client = None
+        if server_address is not None:
+            from ocr_server import connect
+            self.client = connect(server_address)
+        if self.client is None:
+            self._load_model()
+
+    def _load_model(self):
+        from paddleocr import PaddleOCR
+
         # 在实际项目中，请使用下面这行
-        self.ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang)
+        self.ocr = PaddleOCR(use_angle_cls=self.use_angle_cls, lang=self.lang)
 
-    def _extract_text_from_single_image(self, image: Union[np.ndarray, Image.Image]) -> str:
+    def _ocr_lines(self, image: Union["np.ndarray", "Image.Image"]) -> Tuple[List[str], float]:
         """
-        从单个图像对象（PIL.Image 或 np.ndarray）中提取文本。
-
-        :param image: 图像对象。
-        :return: 提取出的合并文本字符串。
+        识别单个图像，返回 (文本行列表, 平均置信度)，没有识别到文字时置信度为 0。
         """
+        import numpy as np
+        from PIL import Image
+
         # 如果是PIL图像，转换为numpy数组
         if isinstance(image, Image.Image):
             image = np.array(image)
@@ -203,47 +527,126 @@ class ImageOcrExtractor:
 
         # 检查结果是否为空
         if not result or not result[0]:
-            return ""
+            return [], 0.0
 
-        # 提取所有文本行并合并
+        # 提取所有文本行和置信度
         text_lines = [line[1][0] for line in result[0]]
+        confidence = sum(line[1][1] for line in result[0]) / len(result[0])
+        return text_lines, confidence
+
+    def _ocr_regions(self, image: "Image.Image", regions) -> Optional[Tuple[List[str], float]]:
+        """
+        只识别 regions 对应的裁剪区域，返回 (文本行列表, 平均置信度)；有区域没识别出文字时返回 None。
+        """
+        width, height = image.size
+        text_lines, confidences = [], []
+        for left, top, right, bottom in regions:
+            crop = image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+            lines, confidence = self._ocr_lines(crop)
+            if not lines:
+                return None
+            text_lines += lines
+            confidences.append(confidence)
+        return text_lines, sum(confidences) / len(confidences)
+
+    def _ocr_image(self, image: "Image.Image", regions=None) -> Tuple[List[str], float, bool]:
+        """
+        regions 不为空时先只识别这些区域，识别不出来再整页识别。
+        返回 (文本行列表, 平均置信度, 是否只识别了区域)。
+        """
+        if regions:
+            result = self._ocr_regions(image, regions)
+            if result is not None:
+                return result[0], result[1], True
+        text_lines, confidence = self._ocr_lines(image)
+        return text_lines, confidence, False
+
+    def _extract_text_from_single_image(self, image: Union["np.ndarray", "Image.Image"]) -> str:
+        """
+        从单个图像对象（PIL.Image 或 np.ndarray）中提取文本。
+
+        :param image: 图像对象。
+        :return: 提取出的合并文本字符串。
+        """
+        text_lines, _ = self._ocr_lines(image)
         return '\n'.join(text_lines)
 
-    def extract_from_path(self, file_path: str) -> str:
+    def _extract_text_from_pdf(self, file_path: str, max_pages: int = OCR_MAX_PAGES, fields: list[str] = None) -> str:
+        """
+        在本进程内用 pdfium 逐页渲染扫描件 PDF 并识别，同一时间只有一页图像在内存中。
+        先按 OCR_DPI_STEPS[0] 渲染，平均置信度不够时依次提高分辨率重新识别，取置信度最高的结果。
+        传入 fields 时第一页只识别这些字段所在的区域，区域识别成功就不再看后面的页。
+        """
+        regions = field_regions(fields)
+        import pypdfium2 as pdfium
+
+        pages_text = []
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            for index in range(min(len(pdf), max_pages) if max_pages else len(pdf)):
+                page = pdf[index]
+                best_lines, best_confidence, best_cropped = [], -1.0, False
+                for dpi in OCR_DPI_STEPS:
+                    image = page.render(scale=dpi / 72).to_pil()
+                    text_lines, confidence, cropped = self._ocr_image(image, regions if index == 0 else None)
+                    image.close()
+                    if confidence > best_confidence:
+                        best_lines, best_confidence, best_cropped = text_lines, confidence, cropped
+                    if confidence >= OCR_MIN_CONFIDENCE:
+                        break
+                page.close()
+                pages_text.append('\n'.join(best_lines))
+                if best_cropped or any(OCR_STOP_ANCHOR in line for line in best_lines):
+                    break
+        finally:
+            pdf.close()
+        return "\n\n".join(pages_text)  # 在不同页面之间添加分隔
+
+    def extract_from_path(self, file_path: str, fields: list[str] = None) -> str:
         """
         从图片文件或PDF文件的路径中提取所有文本。
 
         :param file_path: 文件的路径。
+        :param fields: 只需要这些字段时传入（如 FieldSelector 中选中的字段），按 OCR_REGIONS 只识别对应区域，
+                       比整页识别快很多；None 表示整页识别。
         :return: 提取出的完整文本字符串。
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件未找到: {file_path}")
 
+        if self.client is not None:
+            from ocr_server import OcrServerError
+            try:
+                return self.client.extract_from_path(file_path, fields)
+            except OcrServerError as e:
+                # 只是这个文件识别失败，与本地识别出错时一样当作没有识别出文字，不影响其他文件
+                print(f"⚠️ {e}")
+                return ""
+            except (EOFError, OSError):
+                # 服务中途退出，改用本进程的模型
+                print("⚠️ OCR 服务连接已断开，改为本地加载模型...")
+                self.client = None
+                self._load_model()
+
+        from PIL import Image
+
         ext = os.path.splitext(file_path)[1].lower()
-        images: List[Image.Image] = []
 
         # 根据文件扩展名处理
         if ext == '.pdf':
             try:
-                # 将PDF转换为PIL图像列表
-                images = convert_from_path(file_path, dpi=300)
+                # 按需逐页渲染，不再用 pdf2image 一次性把所有页转成 300DPI 图片
+                return self._extract_text_from_pdf(file_path, fields=fields)
             except Exception as e:
                 return f"处理PDF文件时出错: {e}"
         elif ext in ['.png', '.jpg', '.jpeg', '.bmp', '.gif']:
             try:
                 # 打开单个图片文件
-                images = [Image.open(file_path)]
+                image = Image.open(file_path)
             except Exception as e:
                 return f"打开图片文件时出错: {e}"
+            with image:
+                text_lines, _, _ = self._ocr_image(image.convert("RGB"), field_regions(fields))
+                return '\n'.join(text_lines)
         else:
             return f"不支持的文件类型: {ext}"
-
-        # 遍历所有图像页，提取文本并合并
-        image_text = ''
-        for i, img in enumerate(images):
-            # print(f"正在处理第 {i + 1}/{len(images)} 页...")
-            image_text += self._extract_text_from_single_image(img)
-            if i < len(images) - 1:
-                image_text += "\n\n"  # 在不同页面之间添加分隔
-
-        return image_text
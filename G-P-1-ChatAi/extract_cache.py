@@ -0,0 +1,159 @@
+"""
+按文件内容哈希缓存字段提取结果（SQLite，默认放在程序同目录）。
+
+键为 (内容 sha256, 后端版本)，值为该文件全部字段的字典。
+同一文件再次处理、或同一批次里出现重复文件时，直接复用结果，不再解析 PDF / OCR / 调用大模型。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+CACHE_FILENAME = "extract_cache.sqlite3"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 缓存内容超过 64MB 时按最近使用时间淘汰
+EVICT_EVERY = 100   # 每写入这么多条检查一次大小，长时间监视目录时缓存也不会无限增长
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def default_cache_path():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, CACHE_FILENAME)
+
+
+def file_hash(file_path):
+    """分块计算文件内容的 sha256，不把整个文件读进内存。"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractCache:
+    """
+    字段提取结果缓存，可在流水线的多个线程中共用（内部加锁）。
+
+    用法：
+        with ExtractCache(path) as cache:
+            values = cache.get(content_hash, backend)
+            cache.put(content_hash, backend, values)
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction ("
+            " content_hash TEXT NOT NULL,"
+            " backend TEXT NOT NULL,"
+            " fields TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, backend))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_last_used ON extraction (last_used)")
+        self.conn.commit()
+        self.puts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, content_hash, backend):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fields FROM extraction WHERE content_hash = ? AND backend = ?",
+                (content_hash, backend),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE extraction SET last_used = ? WHERE content_hash = ? AND backend = ?",
+                (time.time(), content_hash, backend),
+            )
+            # 立即提交，程序没有正常退出时最近使用顺序也不会丢
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, content_hash, backend, field_values):
+        data = json.dumps(field_values, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extraction (content_hash, backend, fields, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, backend, data, len(data.encode("utf-8")), now, now),
+            )
+            self.conn.commit()
+            self.puts += 1
+            if self.puts >= EVICT_EVERY:
+                self.evict()
+                self.puts = 0
+
+    def evict(self):
+        """按最近使用时间淘汰，直到缓存内容总大小不超过 max_bytes，返回删除条数。"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM extraction").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            rows = self.conn.execute(
+                "SELECT content_hash, backend, size FROM extraction ORDER BY last_used").fetchall()
+            for content_hash, backend, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute(
+                    "DELETE FROM extraction WHERE content_hash = ? AND backend = ?", (content_hash, backend)
+                )
+                total -= size
+                removed += 1
+            self.conn.commit()
+            return removed
+
+    def invalidate(self, content_hash=None, backend=None):
+        """
+        删除缓存：不传参数清空全部，也可以只删某个文件哈希或某个后端的记录。返回删除条数。
+        backend 为完整的后端版本（如 "ai:gpt-4o:2"）或它冒号分隔的前缀（如 "ai"）。
+        """
+        sql = "DELETE FROM extraction"
+        conditions, params = [], []
+        if content_hash:
+            conditions.append("content_hash = ?")
+            params.append(content_hash)
+        if backend:
+            # 按前缀逐字比较，不用 LIKE，后端名里的 % 和 _ 不会被当成通配符
+            prefix = backend + ":"
+            conditions.append("(backend = ? OR substr(backend, 1, ?) = ?)")
+            params += [backend, len(prefix), prefix]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        removed = self.conn.execute(sql, params).rowcount
+        self.conn.commit()
+        if not conditions:
+            self.conn.execute("VACUUM")
+        return removed
+
+    def stats(self):
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction").fetchone()
+        backends = dict(self.conn.execute("SELECT backend, COUNT(*) FROM extraction GROUP BY backend").fetchall())
+        return {"path": self.path, "entries": count, "bytes": total, "max_bytes": self.max_bytes, "backends": backends}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.evict()
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
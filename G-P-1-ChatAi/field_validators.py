@@ -0,0 +1,149 @@
+"""
+字段校验：判断 pdf 文本解析出的字段值是否可信，只有没找到或校验不通过的字段才交给大模型补全。
+
+- 税号：18 位统一社会信用代码按 GB 32100-2015 验证最后一位校验码，15 / 17 / 20 位的旧纳税人识别号只检查字符；
+- 发票号码：8 位（纸质发票）或 20 位（数电发票）数字；
+- 开票日期：能解析成真实存在的日期；
+- 金额：合计 + 总税额 = 价税合计（允许 0.01 的舍入误差）；
+- 价税合计大写：能解析，且与价税合计的数字一致。
+
+用法：
+    extract_fields = fields + check_fields(fields)         # 交叉校验需要的字段一并从文本中解析
+    failed = failed_fields(values, fields)                 # [] 表示选中的字段都可信
+"""
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+# 统一社会信用代码用到的字符（不含 I、O、Z、S、V）和前 17 位的加权因子
+_CREDIT_CODE_CHARS = "0123456789ABCDEFGHJKLMNPQRTUWXY"
+_CREDIT_CODE_WEIGHTS = (1, 3, 9, 27, 19, 26, 16, 17, 20, 29, 25, 13, 8, 24, 10, 30, 28)
+_OLD_TAX_ID = re.compile(r"^[0-9A-Z]{15}$|^[0-9A-Z]{17}$|^[0-9A-Z]{20}$")
+_INVOICE_NUMBER = re.compile(r"^\d{8}$|^\d{20}$")   # 纸质发票 8 位，数电发票 20 位
+_DATE = re.compile(r"^(\d{4})(?:年|-|/|\.)(\d{1,2})(?:月|-|/|\.)(\d{1,2})日?$")
+_AMOUNT = re.compile(r"^-?\d+(\.\d{1,2})?$")
+
+_DIGITS = {c: i for i, c in enumerate("零壹贰叁肆伍陆柒捌玖")}
+_UNITS = {"拾": 10, "佰": 100, "仟": 1000}
+_AMOUNT_FIELDS = ("合计", "总税额", "价税合计")
+_WORDS_FIELDS = ("价税合计", "价税合计大写")
+TOLERANCE = Decimal("0.01")
+
+
+def credit_code_check_char(code):
+    """统一社会信用代码前 17 位 -> 第 18 位校验码。"""
+    total = sum(_CREDIT_CODE_CHARS.index(c) * w for c, w in zip(code[:17], _CREDIT_CODE_WEIGHTS))
+    return _CREDIT_CODE_CHARS[(31 - total % 31) % 31]
+
+
+def tax_id_valid(value):
+    value = (value or "").strip().upper()
+    if len(value) == 18 and all(c in _CREDIT_CODE_CHARS for c in value):
+        return credit_code_check_char(value) == value[17]
+    return bool(_OLD_TAX_ID.match(value))
+
+
+def parse_date(value):
+    """把 "2025年07月15日"、"2025-7-15" 等写法解析成 date，格式不对或日期不存在时返回 None。"""
+    m = _DATE.match((value or "").strip())
+    if not m:
+        return None
+    try:
+        return datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def parse_amount(value):
+    """把 "¥1,234.50" 等写法解析成 Decimal("1234.50")，不是金额时返回 None。"""
+    value = (value or "").replace("¥", "").replace("￥", "").replace(",", "").strip()
+    if not _AMOUNT.match(value):
+        return None
+    return Decimal(value)
+
+
+def _parse_integer(words):
+    total, section, digit = 0, 0, 0
+    for ch in words:
+        if ch in _DIGITS:
+            digit = _DIGITS[ch]
+        elif ch in _UNITS:
+            section += (digit or 1) * _UNITS[ch]
+            digit = 0
+        elif ch == "万":
+            total += (section + digit) * 10000
+            section = digit = 0
+        elif ch == "亿":
+            total = (total + section + digit) * 100000000
+            section = digit = 0
+        else:
+            raise ValueError(ch)
+    return total + section + digit
+
+
+def words_to_amount(words):
+    """中文大写金额转数字，如 "壹佰零伍圆叁角整" -> Decimal("105.30")，认不出时返回 None。"""
+    words = (words or "").strip().replace("元", "圆")
+    negative = words[:1] in ("负", "⊗")
+    if negative:
+        words = words[1:]
+    if not words or "圆" not in words and "角" not in words and "分" not in words:
+        return None
+    integer, _, fraction = words.rpartition("圆") if "圆" in words else ("", "", words)
+    fraction = fraction.rstrip("整正")
+    try:
+        amount = Decimal(_parse_integer(integer))
+        m = re.fullmatch(r"零?(?:(.)角)?零?(?:(.)分)?", fraction)
+        if m is None:
+            return None
+        for ch, scale in ((m.group(1), Decimal("0.1")), (m.group(2), Decimal("0.01"))):
+            if ch is not None:
+                amount += _DIGITS[ch] * scale
+    except (KeyError, ValueError, InvalidOperation):
+        return None
+    return -amount if negative else amount
+
+
+def check_fields(fields):
+    """交叉校验 fields 时还需要从文本中解析的字段（选了金额类字段时带上其余金额字段和大写金额）。"""
+    if not any(key in fields for key in _AMOUNT_FIELDS + _WORDS_FIELDS):
+        return []
+    return [key for key in _AMOUNT_FIELDS + ("价税合计大写",) if key not in fields]
+
+
+_FORMAT_CHECKS = {
+    "购方税号": tax_id_valid,
+    "销方税号": tax_id_valid,
+    "发票号码": lambda v: bool(_INVOICE_NUMBER.match(v.strip())),
+    "开票日期": lambda v: parse_date(v) is not None,
+    "合计": lambda v: parse_amount(v) is not None,
+    "总税额": lambda v: parse_amount(v) is not None,
+    "价税合计": lambda v: parse_amount(v) is not None,
+    "价税合计大写": lambda v: words_to_amount(v) is not None,
+}
+
+
+def failed_fields(values, fields):
+    """
+    返回需要重新提取的字段：fields 中没找到或格式不对的字段，以及交叉校验不一致、且涉及 fields 的一组字段
+    （不知道一组里哪个错了，整组重新提取）。values 中 fields 以外的字段只用来交叉校验。
+    """
+    failed = []
+    for key in fields:
+        value = values.get(key) or ""
+        check = _FORMAT_CHECKS.get(key)
+        if not value.strip() or (check is not None and not check(value)):
+            failed.append(key)
+
+    def mismatch(keys):
+        if any(key in fields for key in keys):
+            failed.extend(key for key in keys if key not in failed)
+
+    amounts = {key: parse_amount(values.get(key)) for key in _AMOUNT_FIELDS}
+    if all(v is not None for v in amounts.values()) \
+            and abs(amounts["合计"] + amounts["总税额"] - amounts["价税合计"]) > TOLERANCE:
+        mismatch(_AMOUNT_FIELDS)
+    in_words = words_to_amount(values.get("价税合计大写"))
+    if amounts["价税合计"] is not None and in_words is not None and abs(in_words - amounts["价税合计"]) > TOLERANCE:
+        mismatch(_WORDS_FIELDS)
+    return failed
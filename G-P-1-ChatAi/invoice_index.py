@@ -0,0 +1,260 @@
+"""
+发票台账（SQLite，默认放在程序同目录的 invoice_index.sqlite3）。
+
+每次重命名时把提取出的字段写进来，发票号码、销方税号、开票日期上都建了索引：
+- 同一张发票重新下载、重新扫描后文件内容不同（哈希不同），按发票号码 + 销方税号认出是同一张，标记为重复；
+- 按销方、购方、日期范围查询发票，不用再打开任何 PDF。
+
+用法：
+    with InvoiceIndex() as index:
+        duplicate_of = index.record(content_hash, field_values, path)
+        rows = index.query(seller="某某公司", date_from="2025-07-01", date_to="2025-09-30")
+"""
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+INDEX_FILENAME = "invoice_index.sqlite3"
+COMMIT_EVERY = 100  # 每写入这么多条提交一次
+
+# 建台账需要的字段，选中的命名字段里没有时也一并提取
+INDEX_FIELDS = ["发票号码", "开票日期", "销方名称", "销方税号", "购方名称", "购方税号", "价税合计"]
+
+# 字段 -> 表中的列
+_COLUMNS = {
+    "发票号码": "invoice_number",
+    "开票日期": "issue_date",
+    "销方名称": "seller_name",
+    "销方税号": "seller_tax_id",
+    "购方名称": "buyer_name",
+    "购方税号": "buyer_tax_id",
+    "价税合计": "total",
+}
+
+_DATE = re.compile(r"(\d{4})\D{1,3}(\d{1,2})\D{1,3}(\d{1,2})")
+_QUARTER = re.compile(r"^(\d{4})\s*-?\s*[Qq]([1-4])$")
+
+
+def default_invoice_index_path():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, INDEX_FILENAME)
+
+
+def normalize_date(value):
+    """把 "2025年07月15日"、"2025-7-15" 等写法统一成 "2025-07-15"，认不出时返回 None。"""
+    m = _DATE.search(value or "")
+    if not m:
+        return None
+    return f"{m.group(1)}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
+
+
+def parse_amount(value):
+    try:
+        return float(str(value).replace("¥", "").replace("￥", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def quarter_range(value):
+    """季度转日期范围，如 "2025Q3" -> ("2025-07-01", "2025-09-30")，格式不对时抛出 ValueError。"""
+    m = _QUARTER.match(value.strip())
+    if not m:
+        raise ValueError(f"季度格式应为 2025Q3: {value}")
+    year, quarter = m.group(1), int(m.group(2))
+    last_day = {1: "03-31", 2: "06-30", 3: "09-30", 4: "12-31"}[quarter]
+    return f"{year}-{quarter * 3 - 2:02d}-01", f"{year}-{last_day}"
+
+
+class InvoiceIndex:
+    """发票台账，可在流水线的多个线程中共用（内部加锁）。read_only 时只读打开已有的台账，不存在时抛出 sqlite3.Error。"""
+
+    def __init__(self, path=None, read_only=False):
+        self.path = path or default_invoice_index_path()
+        self.lock = threading.RLock()
+        self.pending = 0
+        if read_only:
+            uri = pathlib.Path(os.path.abspath(self.path)).as_uri() + "?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            return
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS invoice ("
+            " id INTEGER PRIMARY KEY,"
+            " invoice_number TEXT,"
+            " issue_date TEXT,"
+            " seller_name TEXT,"
+            " seller_tax_id TEXT,"
+            " buyer_name TEXT,"
+            " buyer_tax_id TEXT,"
+            " total REAL,"
+            " fields TEXT NOT NULL,"
+            " first_seen REAL NOT NULL,"
+            " last_seen REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_invoice_number ON invoice (invoice_number);"
+            "CREATE INDEX IF NOT EXISTS idx_invoice_seller_tax_id ON invoice (seller_tax_id, issue_date);"
+            "CREATE INDEX IF NOT EXISTS idx_invoice_seller_name ON invoice (seller_name, issue_date);"
+            "CREATE INDEX IF NOT EXISTS idx_invoice_issue_date ON invoice (issue_date);"
+            # 一张发票可能对应多个文件（重新下载、重新扫描），按文件内容哈希记录
+            "CREATE TABLE IF NOT EXISTS invoice_file ("
+            " content_hash TEXT PRIMARY KEY,"
+            " invoice_id INTEGER NOT NULL,"
+            " path TEXT NOT NULL,"
+            " seen REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_invoice_file_invoice ON invoice_file (invoice_id);"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _find(self, columns):
+        """按发票号码找同一张发票，双方都有销方税号时还要求税号相同。"""
+        if not columns["invoice_number"]:
+            return None
+        for row in self.conn.execute(
+                "SELECT * FROM invoice WHERE invoice_number = ?", (columns["invoice_number"],)):
+            if not columns["seller_tax_id"] or not row["seller_tax_id"] \
+                    or row["seller_tax_id"] == columns["seller_tax_id"]:
+                return row
+        return None
+
+    def record(self, content_hash, field_values, path):
+        """
+        写入一个文件的提取结果。
+
+        :return: 该文件与台账里已有的另一个文件是同一张发票（内容不同）时，返回那个文件的路径，否则返回 None。
+                 台账字段一个都没提取到时不写入，返回 None。
+        """
+        columns = {column: (field_values.get(key) or "").strip() for key, column in _COLUMNS.items()}
+        if not any(columns.values()):
+            return None
+        columns["issue_date"] = normalize_date(columns["issue_date"])
+        columns["total"] = parse_amount(columns["total"]) if columns["total"] else None
+        data = json.dumps(field_values, ensure_ascii=False)
+        now = time.time()
+        path = os.path.abspath(path)
+        with self.lock:
+            known = self.conn.execute(
+                "SELECT invoice_id FROM invoice_file WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            duplicate_of = None
+            if known is not None:
+                invoice_id = known["invoice_id"]
+            else:
+                row = self._find(columns)
+                if row is not None:
+                    invoice_id = row["id"]
+                    other = self.conn.execute(
+                        "SELECT path FROM invoice_file WHERE invoice_id = ? ORDER BY seen DESC LIMIT 1",
+                        (invoice_id,),
+                    ).fetchone()
+                    duplicate_of = other["path"] if other else None
+                else:
+                    invoice_id = self.conn.execute(
+                        "INSERT INTO invoice (invoice_number, issue_date, seller_name, seller_tax_id, buyer_name,"
+                        " buyer_tax_id, total, fields, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*(columns[c] or None for c in _COLUMNS.values()), data, now, now),
+                    ).lastrowid
+            # 已有记录时只补上之前缺的字段
+            self.conn.execute(
+                "UPDATE invoice SET " + ", ".join(f"{c} = COALESCE({c}, ?)" for c in _COLUMNS.values())
+                + ", last_seen = ? WHERE id = ?",
+                (*(columns[c] or None for c in _COLUMNS.values()), now, invoice_id),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO invoice_file (content_hash, invoice_id, path, seen) VALUES (?, ?, ?, ?)",
+                (content_hash, invoice_id, path, now),
+            )
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self.pending = 0
+        return duplicate_of
+
+    def move(self, old_path, new_path):
+        """文件改名后（如 undo 回滚）更新台账里记的路径，返回更新条数。"""
+        with self.lock:
+            count = self.conn.execute("UPDATE invoice_file SET path = ? WHERE path = ?",
+                                      (os.path.abspath(new_path), os.path.abspath(old_path))).rowcount
+            self.conn.commit()
+        return count
+
+    def query(self, seller=None, buyer=None, invoice_number=None, date_from=None, date_to=None, limit=None):
+        """
+        按条件查询发票，条件之间是“并且”的关系，按开票日期排序。
+
+        :param seller: 销方名称或销方税号，含 % 时按 LIKE 模糊匹配。
+        :param buyer: 购方名称或购方税号，含 % 时按 LIKE 模糊匹配。
+        :param date_from: 开票日期下限（含），格式同 normalize_date。
+        :param date_to: 开票日期上限（含）。
+        :return: [{"id", 各字段..., "files": [路径...]}]
+        """
+        conditions, params = [], []
+        for value, name_col, tax_col in ((seller, "seller_name", "seller_tax_id"),
+                                         (buyer, "buyer_name", "buyer_tax_id")):
+            if value:
+                op = "LIKE" if "%" in value else "="
+                conditions.append(f"({name_col} {op} ? OR {tax_col} {op} ?)")
+                params += [value, value]
+        if invoice_number:
+            conditions.append("invoice_number = ?")
+            params.append(invoice_number)
+        if date_from:
+            conditions.append("issue_date >= ?")
+            params.append(normalize_date(date_from))
+        if date_to:
+            conditions.append("issue_date <= ?")
+            params.append(normalize_date(date_to))
+        sql = "SELECT * FROM invoice"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY issue_date, id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+            return [self._row(row) for row in rows]
+
+    def duplicates(self):
+        """列出对应多个文件的发票。"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM invoice WHERE id IN"
+                " (SELECT invoice_id FROM invoice_file GROUP BY invoice_id HAVING COUNT(*) > 1)"
+                " ORDER BY issue_date, id"
+            ).fetchall()
+            return [self._row(row) for row in rows]
+
+    def _row(self, row):
+        result = {"id": row["id"]}
+        result.update({key: row[column] for key, column in _COLUMNS.items()})
+        result["files"] = [r["path"] for r in self.conn.execute(
+            "SELECT path FROM invoice_file WHERE invoice_id = ? ORDER BY seen", (row["id"],))]
+        return result
+
+    def stats(self):
+        with self.lock:
+            invoices = self.conn.execute("SELECT COUNT(*) FROM invoice").fetchone()[0]
+            files = self.conn.execute("SELECT COUNT(*) FROM invoice_file").fetchone()[0]
+        return {"path": self.path, "invoices": invoices, "files": files}
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
@@ -10,6 +10,7 @@
 #         root.destroy()
 #         return
 import json
+import multiprocessing
 import os
 import sys
 
@@ -51,4 +52,5 @@ def start_config():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包成 exe 后进程池需要
     start_config()
@@ -0,0 +1,148 @@
+"""
+常驻 OCR 服务：每个工作进程启动时加载一次 PaddleOCR 模型，之后通过本机 socket 接收识别请求。
+开机后启动一次，之后每次重命名、多个程序同时调用都共用已经加载好的模型，不用每次重新加载。
+
+启动：
+    python cli.py ocr-server --workers 2
+
+ImageOcrExtractor(server_address=...) 连得上服务时把识别请求转发过来，连不上时在本进程加载模型。
+地址默认 127.0.0.1:17863，可用环境变量 OCR_SERVER 修改。
+连接口令取环境变量 OCR_SERVER_AUTHKEY；没设置时服务第一次启动会随机生成一个，保存在用户配置目录下
+（Windows 为 %APPDATA%\\invoice-rename\\ocr_authkey，其他系统为 ~/.config/invoice-rename/ocr_authkey，权限 0600），
+同一用户的客户端从这个文件读取。连接上传的是 pickle 数据，不能用公开的固定口令。
+"""
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 17863
+
+
+def server_address(value=None):
+    """解析 "host:port"，默认读环境变量 OCR_SERVER。"""
+    value = value or os.environ.get("OCR_SERVER", f"{DEFAULT_HOST}:{DEFAULT_PORT}")
+    host, _, port = value.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+
+AUTHKEY_FILENAME = "ocr_authkey"
+
+
+def authkey_path():
+    if sys.platform == "win32":
+        base_dir = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        base_dir = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base_dir, "invoice-rename", AUTHKEY_FILENAME)
+
+
+def server_authkey(create=False):
+    """
+    返回连接口令：优先用环境变量 OCR_SERVER_AUTHKEY，其次读口令文件。
+    口令文件不存在时，create 为 True（服务端）则随机生成并以 0600 权限保存，否则返回 None。
+    """
+    value = os.environ.get("OCR_SERVER_AUTHKEY")
+    if value:
+        return value.encode("utf-8")
+    path = authkey_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            value = f.read().strip()
+    except FileNotFoundError:
+        value = None
+    if value:
+        return value.encode("utf-8")
+    if not create:
+        return None
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    value = secrets.token_hex(32)
+    # O_EXCL：两个服务同时启动时只有一个能写入，另一个读它写好的口令
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return server_authkey()
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(value)
+    return value.encode("utf-8")
+
+
+class OcrServerError(RuntimeError):
+    """服务端识别某个文件时出错（文件打不开、格式不支持等），连接本身仍然可用。"""
+
+
+class OcrClient:
+    """OCR 服务的连接，extract_from_path 与 ImageOcrExtractor 用法相同，可在多个线程中共用。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def extract_from_path(self, file_path, fields=None):
+        with self.lock:
+            self.conn.send((os.path.abspath(file_path), fields))
+            status, value = self.conn.recv()
+        if status != "ok":
+            raise OcrServerError(f"OCR 服务识别失败: {value}")
+        return value
+
+    def close(self):
+        self.conn.close()
+
+
+def connect(address=None):
+    """连接 OCR 服务，服务没启动、没有口令或口令不对时返回 None。"""
+    authkey = server_authkey()
+    if authkey is None:
+        return None
+    try:
+        conn = Client(server_address(address), authkey=authkey)
+    except (OSError, AuthenticationError):
+        return None
+    return OcrClient(conn)
+
+
+# --- 服务端 ---
+_extractor = None
+
+
+def _init_worker():
+    # 每个工作进程只加载一次模型
+    global _extractor
+    from chat_ai_rename import ImageOcrExtractor
+    _extractor = ImageOcrExtractor()
+
+
+def _ocr(file_path, fields):
+    return _extractor.extract_from_path(file_path, fields)
+
+
+def _serve_connection(conn, pool):
+    with conn:
+        while True:
+            try:
+                file_path, fields = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                conn.send(("ok", pool.apply(_ocr, (file_path, fields))))
+            except Exception as e:
+                conn.send(("error", str(e)))
+
+
+def serve(address=None, workers=1, log=print):
+    """启动 workers 个工作进程并一直接收连接，每个连接一个线程，请求交给进程池里空闲的模型处理。"""
+    address = server_address(address)
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool, \
+            Listener(address, authkey=server_authkey(create=True)) as listener:
+        log(f"OCR 服务已启动：{address[0]}:{address[1]}，工作进程 {workers} 个\n")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError) as e:
+                log(f"拒绝连接: {e}\n")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, pool), daemon=True).start()
@@ -0,0 +1,64 @@
+"""
+发给大模型前裁剪发票文本：只保留要提取的字段的标签（如“开票日期”“价税合计”）所在行及其前后几行，
+去掉明细行、备注和页脚，减少输入 token，缩短请求耗时。
+
+任何一个字段的标签在文本里找不到（OCR 识别走样、非标准版式等）或裁剪后没短多少时，原样返回全文；
+ask_ai 中模型在裁剪后的文本里没找到的字段，还会用全文再问一次，保证不会因为裁剪漏掉字段。
+
+用法：
+    text_to_send = trim_text(full_text, ["开票日期", "价税合计"])
+    saved = estimate_tokens(full_text) - estimate_tokens(text_to_send)
+"""
+import re
+
+# 字段 -> 标签（在去掉空白的行上匹配），有一个匹配上就算找到
+FIELD_LABELS = {
+    "发票号码": [r"发票号码"],
+    "开票日期": [r"开票日期"],
+    # 带冒号，避免匹配到明细表头里的“项目名称”
+    "购方名称": [r"名称[：:]"],
+    "销方名称": [r"名称[：:]"],
+    # 税号按购销方名称的先后对应，名称行也要保留
+    "购方税号": [r"纳税人识别号", r"信用代码", r"名称[：:]"],
+    "销方税号": [r"纳税人识别号", r"信用代码", r"名称[：:]"],
+    "合计": [r"合计"],
+    "总税额": [r"合计"],
+    "价税合计": [r"价税合计", r"小写"],
+    "价税合计大写": [r"价税合计", r"大写"],
+    "开票人": [r"开票人"],
+}
+_PATTERNS = {key: [re.compile(label) for label in labels] for key, labels in FIELD_LABELS.items()}
+
+CONTEXT_BEFORE = 1   # 标签行之前保留的行数（OCR 文本里值可能在标签上一行）
+CONTEXT_AFTER = 2    # 标签行之后保留的行数（OCR 文本里值常在标签下一行，购销方信息跨好几行）
+MIN_SAVING = 0.2     # 裁剪后至少短 20% 才用裁剪结果
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数：中文按 1 字 1 个，其余按 4 个字符 1 个，只用于统计节省比例。"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def trim_text(text, fields):
+    """返回只含 fields 标签附近几行的文本，做不到可靠裁剪时返回原文。"""
+    if not text or not fields:
+        return text
+    lines = text.splitlines()
+    compact = ["".join(line.split()) for line in lines]
+    keep = set()
+    for key in fields:
+        patterns = _PATTERNS.get(key)
+        if patterns is None:
+            return text
+        hits = [i for i, line in enumerate(compact) if any(p.search(line) for p in patterns)]
+        if not hits:
+            return text
+        for i in hits:
+            keep.update(range(max(0, i - CONTEXT_BEFORE), min(len(lines), i + CONTEXT_AFTER + 1)))
+    trimmed = "\n".join(lines[i] for i in sorted(keep))
+    if len(trimmed) > len(text) * (1 - MIN_SAVING):
+        return text
+    return trimmed
@@ -0,0 +1,676 @@
+"""
+发票重命名核心逻辑，不依赖 tkinter。
+界面（rename_function.py）和命令行（cli.py）共用这里的提取与重命名流程。
+"""
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# pdfplumber、chat_ai_rename（langchain / paddleocr 等）导入很慢，放到第一次用到时再导入，
+# 配置窗口可以立即弹出，全是文本 PDF 时也不会加载 OCR 和大模型
+from extract_cache import ExtractCache, file_hash
+from field_validators import check_fields, failed_fields
+from file_walk import FileEntry, walk_files
+from invoice_index import INDEX_FIELDS, InvoiceIndex
+from metrics import RunMetrics
+from pipeline import Stage, run_pipeline
+from prompt_trim import estimate_tokens, trim_text
+from rename_journal import JOURNAL_FILENAME, RenameJournal
+
+# extract_fields_from_text / InvoiceExtractor 支持的字段
+FIELD_KEYS = [
+    "发票号码", "开票日期", "购方名称", "购方税号", "销方名称", "销方税号",
+    "合计", "总税额", "价税合计", "价税合计大写", "开票人",
+]
+
+# 默认并行进程数：pdf 文本提取是纯 Python 的 CPU 密集任务，按核数开进程
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# 每个 PDF 默认最多读取的页数，发票抬头字段都在第 1 页，后面多是明细附件
+DEFAULT_MAX_PAGES = 5
+
+# 字段解析规则的版本，修改 extract_fields_from_text 后递增，使旧的缓存结果失效
+EXTRACTOR_VERSION = "2"
+
+
+def get_backup_dir(pdf_dir):
+    parent_dir = os.path.dirname(pdf_dir.rstrip(os.sep))
+    base_bak_dir = os.path.join(parent_dir, 'rename')
+
+    # 生成随机后缀，取uuid的前8位，确保唯一
+    random_suffix = uuid.uuid4().hex[:8]
+
+    bak_dir = base_bak_dir + "_" + random_suffix
+
+    # 如果刚好存在（概率极低），循环生成新的
+    while os.path.abspath(bak_dir) == os.path.abspath(pdf_dir) or os.path.exists(bak_dir):
+        random_suffix = uuid.uuid4().hex[:8]
+        bak_dir = base_bak_dir + "_" + random_suffix
+
+    os.makedirs(bak_dir, exist_ok=True)
+    return bak_dir
+
+def sanitize_filename(name):
+    # 替换Windows文件名非法字符为下划线
+    return re.sub(r'[\\/:*?"<>|]', '_', name)
+
+
+def extract_projects(text):
+    # 先定位“项目名称”后面跟的项目数据起始位置
+    # 这里假设“项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额”是表头
+    table_header_pattern = r"项目名称\s*规格型号\s*单\s*位\s*数\s*量\s*单\s*价\s*金\s*额\s*税率/征收率\s*税\s*额"
+
+    header_match = re.search(table_header_pattern, text)
+    if not header_match:
+        return []  # 找不到表头，返回空列表
+
+    start_pos = header_match.end()  # 表头结束位置
+    # 截取表头之后的文本，假设项目行以换行或“合计”之类结束
+    project_text = text[start_pos:]
+    # 一般项目以“合计”开始或者“价税合计”开始结束
+    end_match = re.search(r"合\s*计|价税合计", project_text)
+    end_pos = end_match.start() if end_match else len(project_text)
+    project_text = project_text[:end_pos]
+
+    # 定义项目行的正则，按字段顺序捕获，假设字段间空格或星号分隔
+    # 这里示范一条项目行匹配：项目名称、规格型号、单位、数量、单价、金额、税率、税额
+    # 注意项目名称可能包含空格和星号，我们用非贪婪匹配
+    project_line_pattern = re.compile(
+        r"(\*?.*?\*?)\s+"      # 项目名称，可能带*号
+        r"(\S*?)\s+"           # 规格型号，允许为空
+        r"(\S+)\s+"            # 单位
+        r"([\d\.]+)\s+"        # 数量
+        r"([\d\.]+)\s+"        # 单价
+        r"([\d\.]+)\s+"        # 金额
+        r"([\d\*%]+)\s+"       # 税率或征收率，允许*或%
+        r"([\d\*\.]+)"         # 税额，允许*或数字
+    )
+
+    projects = []
+    for match in project_line_pattern.finditer(project_text):
+        project = {
+            "项目名称": match.group(1).strip(),
+            "规格型号": match.group(2).strip(),
+            "单位": match.group(3).strip(),
+            "数量": match.group(4).strip(),
+            "单价": match.group(5).strip(),
+            "金额": match.group(6).strip(),
+            "税率": match.group(7).strip(),
+            "税额": match.group(8).strip(),
+        }
+        projects.append(project)
+
+    return projects
+
+
+# 超长文本只解析前面这部分，限制病态输入下的最坏耗时（发票抬头字段都在前几千字内）
+MAX_TEXT_CHARS = 50000
+
+# 字段规则表，导入时编译一次：规则名 -> (正则, 先用 in 快速判断的锚点文字, 是否 findall)
+# 原先的 .* / .*? 都改成了有上限的 .{0,N}?，避免找不到时在整篇文本上回溯
+_RULES = {
+    # 统一提取所有“统一社会信用代码/纳税人识别号”后的号码（按顺序），第一个是购方，第二个是销方
+    "tax_id": (re.compile(r"统一社会信用代码/纳税人识别号[：:]\s*(\w+)"), "纳税人识别号", True),
+    # 购方名称 + 销方名称 （一行内）
+    "party_name": (re.compile(r"购\s*名称[：:]\s*(.{0,200}?)\s+销\s*名称[：:]\s*(.{0,200}?)\s"), "名称", False),
+    "invoice_number": (re.compile(r"发票号码[：:]\s*(\w+)"), "发票号码", False),
+    "issue_date": (re.compile(r"开票日期[：:]\s*([\d年月日\-]+)"), "开票日期", False),
+    "total_amount": (re.compile(r"合\s*计\s*¥?([\d\.]+)"), "计", False),
+    # 合计行后紧跟的两个金额，第二个是总税额
+    "total_tax": (re.compile(r"合\s*计.{0,100}?¥?([\d\.]+)\s*\*?\s*¥?([\d\.]+)"), "计", False),
+    "total_with_tax": (re.compile(r"价税合计.{0,200}?（小写）¥([\d\.]+)"), "（小写）", False),
+    "total_with_tax_words": (re.compile(r"价税合计（大写）\s*(\S+)"), "价税合计（大写）", False),
+    "preparer": (re.compile(r"开票人[:：]\s*(\S+)"), "开票人", False),
+}
+
+
+def _group(n):
+    return lambda m: m.group(n).strip() if m else ""
+
+
+def _nth(n):
+    return lambda found: found[n] if len(found) > n else ""
+
+
+# 字段 -> (规则名, 从匹配结果取值的函数)，共用一条规则的字段只匹配一次
+FIELD_SPECS = {
+    "购方税号": ("tax_id", _nth(0)),
+    "销方税号": ("tax_id", _nth(1)),
+    "购方名称": ("party_name", _group(1)),
+    "销方名称": ("party_name", _group(2)),
+    "发票号码": ("invoice_number", _group(1)),
+    "开票日期": ("issue_date", _group(1)),
+    "合计": ("total_amount", _group(1)),
+    "总税额": ("total_tax", _group(2)),
+    "价税合计": ("total_with_tax", _group(1)),
+    "价税合计大写": ("total_with_tax_words", _group(1)),
+    "开票人": ("preparer", _group(1)),
+}
+
+
+def extract_fields_from_text(text, fields):
+    """
+    按 FIELD_SPECS 只解析 fields 里选中的字段，返回 {字段: 值}，找不到的字段值为空字符串。
+    """
+    # 合并多余空白，比 re.sub(r'\s+', ' ', text) 快
+    text = " ".join(text[:MAX_TEXT_CHARS].split())
+
+    matched = {}
+    results = {}
+    for key in fields:
+        spec = FIELD_SPECS.get(key)
+        if spec is None:
+            continue
+        rule_name, getter = spec
+        if rule_name not in matched:
+            pattern, anchor, find_all = _RULES[rule_name]
+            if anchor not in text:
+                matched[rule_name] = [] if find_all else None
+            elif find_all:
+                matched[rule_name] = pattern.findall(text)
+            else:
+                matched[rule_name] = pattern.search(text)
+        results[key] = getter(matched[rule_name])
+    return results
+
+
+# 提取pdf文本
+def get_full_text(file_path, log=print, fields=None, max_pages=DEFAULT_MAX_PAGES, timings=None):
+    """
+    从 PDF 文件中提取文本内容。
+    如果提取失败或文件打不开，返回 None，并通过 log 输出错误信息。
+
+    :param fields: 传入时每读完一页就解析一次，选中的字段都找到后不再读后面的页。
+    :param max_pages: 最多读取的页数，None 或 0 表示不限制。
+    :param timings: 传入字典时写入打开文件（pdf_open）和提取文本（pdf_text）的耗时（秒）。
+    """
+    page_numbers = range(1, max_pages + 1) if max_pages else None
+    import pdfplumber
+
+    parts = []
+    start = time.perf_counter()
+    try:
+        with pdfplumber.open(file_path, pages=page_numbers) as pdf:
+            opened = time.perf_counter()
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                page.close()  # 释放这一页解析出的对象，长附件不会越读越占内存
+                if not page_text:  # 如果页面没有提取到文本
+                    continue
+                parts.append(page_text)
+                if fields and all(extract_fields_from_text("\n".join(parts), fields).values()):
+                    break
+    except Exception as e:
+        log(f"打开PDF失败: {e}\n")
+        return None
+    if timings is not None:
+        timings["pdf_open"] = opened - start
+        timings["pdf_text"] = time.perf_counter() - opened
+    full_text = "".join(part + "\n" for part in parts)
+    # 如果整个文档没有提取到任何文本，返回 None
+    if not full_text.strip():
+        log("PDF 中未提取到有效文本。\n")
+        return None
+    return full_text
+
+
+def extract_file(file_path, fields, max_pages=DEFAULT_MAX_PAGES):
+    """
+    读取单个 PDF 并解析字段，可在子进程中执行（不写日志、不抛异常）。
+    先读第 1 页，字段不全时才继续读后面的页，最多读 max_pages 页。
+
+    :return: (full_text, field_values, error, timings)，提取不到文本时前两项为 None，error 为提示信息；
+             timings 为各步骤耗时（秒）：pdf_open / pdf_text / parse。
+    """
+    messages = []
+    timings = {}
+    full_text = get_full_text(file_path, log=messages.append, fields=fields, max_pages=max_pages, timings=timings)
+    if full_text is None:
+        return None, None, "".join(messages), timings
+    start = time.perf_counter()
+    field_values = extract_fields_from_text(full_text, fields)
+    timings["parse"] = time.perf_counter() - start
+    return full_text, field_values, None, timings
+
+
+def backup_file(entry, bak_dir, flatten=False):
+    """
+    把一个文件复制到 bak_dir 中，返回副本路径。默认保持相对 pdf_dir 的子文件夹结构，
+    flatten 时都放在 bak_dir 顶层，与已有文件重名时加序号。
+    """
+    if flatten:
+        name = os.path.basename(entry.path)
+        base, ext = os.path.splitext(name)
+        dst = os.path.join(bak_dir, name)
+        n = 1
+        while os.path.exists(dst):
+            dst = os.path.join(bak_dir, f"{base}_{n}{ext}")
+            n += 1
+    else:
+        dst = os.path.join(bak_dir, *entry.rel_path.split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copy2(entry.path, dst)
+    return dst
+
+
+class _RenameRun:
+    """一次 process_folder 运行的状态：重命名日志和缓存，在流水线最后一步（调用方线程）中使用。"""
+
+    def __init__(self, fields, split, journal, cache, cache_backend, index, metrics, log):
+        self.fields = fields
+        self.split = split
+        self.journal = journal
+        self.cache = cache
+        self.cache_backend = cache_backend
+        self.index = index
+        self.metrics = metrics
+        self.log = log
+
+    def remember(self, h, values, stored):
+        if self.cache is None or h is None:
+            return
+        # 与缓存中已有的字段合并，换一个命名模板时也能继续复用
+        merged = dict(stored)
+        merged.update({k: values.get(k, "") for k in self.fields})
+        merged.update(values)
+        self.cache.put(h, self.cache_backend, merged)
+
+    def apply(self, filename, file_path, out_dir, values, result, content_hash=None):
+        """按字段拼出新文件名并在 out_dir 中重命名，填好 result 后返回。content_hash 为已算好的文件哈希，记日志时不用再读一遍文件。"""
+        log = self.log
+        result["fields"] = {k: values.get(k) for k in self.fields}
+        new_name_base = self.split.join(values.get(key) or "" for key in self.fields)
+        # 提取原始文件的后缀名
+        _, original_ext = os.path.splitext(filename)
+        # 将新的文件名基础部分与原始后缀名拼接
+        new_name = sanitize_filename(new_name_base) + original_ext
+        new_path = os.path.join(out_dir, new_name)
+        if os.path.exists(new_path):
+            log(f"文件名冲突，加个随机数: {new_name}\n")
+            result["status"] = "conflict"
+            # 同一秒内可能有多个文件重名，时间戳后再加序号，直到找到没被占用的文件名
+            base = sanitize_filename(new_name_base) + time.strftime("%Y%m%d%H%M%S")
+            new_name = base + original_ext
+            n = 1
+            while os.path.exists(os.path.join(out_dir, new_name)):
+                new_name = f"{base}_{n}{original_ext}"
+                n += 1
+            new_path = os.path.join(out_dir, new_name)
+        result["new_name"] = new_name
+
+        try:
+            with self.metrics.time("rename", file_path):
+                if self.journal is not None:
+                    self.journal.rename(file_path, new_path, content_hash=content_hash)
+                else:
+                    os.rename(file_path, new_path)
+            log(f"重命名成功: {filename} -> {new_name}\n")
+            if result["status"] != "conflict":
+                result["status"] = "renamed"
+        except Exception as e:
+            log(f"重命名失败: {e}\n")
+            result["status"] = "failed"
+            result["error"] = f"重命名失败: {e}"
+        return result
+
+    def finish(self, item):
+        """流水线最后一步：有字段就重命名，没有就记为跳过。"""
+        filename, file_path, source = item["filename"], item["file_path"], item["source"]
+        self.log(f"\n处理文件：{filename}\n")
+        if source == "cache":
+            self.log("命中缓存，跳过解析\n")
+        elif source == "duplicate":
+            self.log("与前面的文件内容相同，复用解析结果\n")
+        result = {"file": file_path, "status": "failed", "new_name": None, "fields": None, "error": None,
+                  "source": source, "duplicate_of": None}
+        if item["values"] is None:
+            self.log("未提取到有效字段，跳过重命名\n")
+            result["status"] = "skipped" if item["error"] is None else "failed"
+            result["error"] = item["error"]
+            return result
+        if not any(item["values"].get(key) for key in self.fields):
+            # 字段全空时拼出的文件名只剩分隔符，不重命名，记为失败
+            self.log("选中的字段都没有提取到，跳过重命名\n")
+            result["status"] = "failed"
+            result["error"] = "选中的字段都没有提取到"
+            return result
+        return self.apply(filename, file_path, item["out_dir"], item["values"], result, item["hash"])
+
+    def done(self, item, result):
+        """记下这个文件的结果计数和从扫描到处理完的总耗时。"""
+        self.metrics.count(f"status_{result['status']}")
+        self.metrics.count(f"source_{result['source']}")
+        self.metrics.add("total", time.perf_counter() - item["start"], item["file_path"],
+                         "error" if result["status"] == "failed" else "ok")
+        return result
+
+    def record(self, item, result):
+        """把提取结果写进发票台账，是已有发票的另一个文件时填上 duplicate_of。"""
+        if self.index is None or item["values"] is None or item["source"] == "duplicate":
+            return result
+        path = result["file"]
+        if result["new_name"] and not os.path.exists(path):
+            path = os.path.join(item["out_dir"], result["new_name"])
+        with self.metrics.time("index", item["file_path"]):
+            result["duplicate_of"] = self.index.record(item["hash"], item["values"], path)
+        self.metrics.count("invoice_duplicate", result["duplicate_of"] is not None)
+        if result["duplicate_of"]:
+            self.log(f"与已处理过的发票重复（发票号码 {item['values'].get('发票号码')}）：{result['duplicate_of']}\n")
+        return result
+
+
+class _Extractors:
+    """第一次访问 ai / ocr 时才导入 chat_ai_rename 并创建对应的提取器（OCR 连不上服务时会加载 PaddleOCR 模型）。"""
+
+    def __init__(self, model_name, log):
+        self.model_name = model_name
+        self.log = log
+        self.lock = threading.Lock()
+        self._ai = None
+        self._ocr = None
+
+    @property
+    def ai(self):
+        with self.lock:
+            if self._ai is None:
+                from chat_ai_rename import InvoiceExtractor
+                self._ai = InvoiceExtractor(model_name=self.model_name)
+            return self._ai
+
+    @property
+    def ocr(self):
+        with self.lock:
+            if self._ocr is None:
+                from chat_ai_rename import ImageOcrExtractor
+                # 优先使用常驻 OCR 服务（python cli.py ocr-server）中已加载好的模型
+                self._ocr = ImageOcrExtractor(server_address="")
+                if self._ocr.client is None:
+                    self.log("\n未连接到 OCR 服务，已在本进程加载 OCR 模型\n")
+            return self._ocr
+
+
+# 流水线各阶段的线程数：计算哈希、查缓存是磁盘 I/O；OCR 模型同一时间只能处理一张；
+# 大模型阶段每个线程一次取出最多 AI_BATCH_SIZE 张并发提交，两个线程让一批在等网络时下一批可以开始攒
+IO_WORKERS = 4
+OCR_WORKERS = 1
+AI_WORKERS = 2
+AI_BATCH_SIZE = 32
+
+
+def process_folder(pdf_dir, fields, split, backend="ai", workers=1, cache_path=None, max_pages=DEFAULT_MAX_PAGES,
+                   in_place=False, index_path=None, metrics=None, filenames=None,
+                   recursive=False, include=None, exclude=None, flatten=False, log=print):
+    """
+    把 pdf_dir 中的发票复制到备份目录后在备份目录中重命名（in_place 时直接在 pdf_dir 中重命名）。
+
+    处理过程是一条流水线，各阶段有自己的线程数，之间用有界队列连接，读盘、解析、OCR、网络请求同时进行：
+    扫描 → 计算内容哈希/查缓存（IO_WORKERS）→ 读取 PDF 并解析字段（workers 个进程）
+    → OCR（OCR_WORKERS）→ 大模型（AI_WORKERS，每次最多 AI_BATCH_SIZE 张）→ 重命名（当前线程串行，保证冲突判断正确）。
+
+    :param backend: "ai" 时字段没找到或校验不通过（见 field_validators）的文件只让大模型补全这几个字段，
+                    pdf 中没有文本的走 OCR + 大模型；
+                    "local" 时只做 pdf 文本解析，跳过非 pdf 文件，不调用任何模型。
+    :param workers: 提取 pdf 文本和解析字段的进程数。
+    :param cache_path: 提取结果缓存（SQLite）路径，None 表示不使用缓存。
+                       命中缓存或与本批次前面文件内容相同时，跳过 pdf 解析、OCR 和大模型。
+    :param max_pages: 每个 PDF 最多读取的页数，选中的字段在前面的页找全后就不再往后读。
+    :param in_place: 不复制备份目录，直接在 pdf_dir 中重命名，并写入 rename_journal 日志，可用 undo 回滚。
+    :param index_path: 发票台账（SQLite）路径，None 表示不写台账。写台账时 pdf 解析会额外提取 INDEX_FIELDS，
+                       内容不同但发票号码相同的文件在结果的 duplicate_of 中给出已有文件的路径。
+    :param metrics: RunMetrics，记录各步骤耗时和结果计数，不传时新建一个；运行结束时把各步骤的 p50/p95/p99 写进日志。
+    :param filenames: 只处理 pdf_dir 中的这些文件（watch 模式每次只处理新到的文件），None 表示全部。
+    :param recursive: 包含子文件夹（如按 年/月/部门 分文件夹存放的归档），边遍历边处理，不先列出整棵目录树。
+    :param include: 通配符列表，只处理匹配的文件，如 ["*.pdf"]；exclude：跳过匹配的文件和子文件夹（见 file_walk）。
+    :param flatten: 子文件夹中的文件重命名后都放到输出目录（备份目录，in_place 时为 pdf_dir）的顶层；
+                    默认保持原来的子文件夹结构，在各自的子文件夹中重命名。
+    :param log: 接收一行状态文本的回调（会在多个线程中调用），界面传入 UiLog，命令行传入写 stderr 的函数。
+    :return: 生成器，每处理完一个文件产出一个结果字典（按处理完成的顺序）：
+             {"file", "status", "new_name", "fields", "error", "source", "duplicate_of"}，
+             status 取值 renamed / skipped / conflict / failed，source 取值 extract / cache / duplicate。
+    """
+    log(f"开始处理目录：{pdf_dir}\n")
+    metrics = metrics or RunMetrics()
+
+    journal = None
+    if in_place:
+        bak_dir = pdf_dir
+        journal = RenameJournal(pdf_dir)
+        log(f"原地重命名，日志编号：{journal.run_id}\n")
+    else:
+        bak_dir = get_backup_dir(pdf_dir)
+        log(f"备份目录为：{bak_dir}\n")
+
+    model_name = os.environ.get("MODEL_NAME", 'moonshot-v1-8k')
+    extractors = _Extractors(model_name, log)
+
+    cache = ExtractCache(cache_path) if cache_path else None
+    index = InvoiceIndex(index_path) if index_path else None
+    # 交叉校验金额需要的字段、写台账时台账需要的字段也一并提取（只影响 pdf 解析和 OCR 区域，不会因此多调用大模型）
+    extract_fields = fields + check_fields(fields)
+    if index is not None:
+        extract_fields += [k for k in INDEX_FIELDS if k not in extract_fields]
+    cache_backend = f"local:{EXTRACTOR_VERSION}" if backend == "local" else f"ai:{model_name}:{EXTRACTOR_VERSION}"
+    run = _RenameRun(fields, split, journal, cache, cache_backend, index, metrics, log)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    seen = set()
+    seen_lock = threading.Lock()
+
+    backed_up = 0
+
+    def scan():
+        # 边遍历边备份、边交给后面的步骤，不先列出整个目录；walk_files 每次读完一个目录的清单才产出，
+        # 重命名过程中目录内容会变，也不会读到改名后的文件
+        nonlocal backed_up
+        if filenames is not None:
+            entries = (FileEntry(os.path.join(pdf_dir, f), f, None, None) for f in filenames)
+        else:
+            entries = walk_files(pdf_dir, recursive, include, exclude)
+        for entry in entries:
+            name = os.path.basename(entry.path)
+            if not (name != JOURNAL_FILENAME and (backend != "local" or name.lower().endswith('.pdf'))):
+                continue
+            if in_place:
+                file_path = entry.path
+            else:
+                file_path = backup_file(entry, bak_dir, flatten)
+                backed_up += 1
+            yield {"filename": entry.rel_path, "file_path": file_path,
+                   "out_dir": bak_dir if flatten else os.path.dirname(file_path), "hash": None,
+                   "source": "extract", "stored": {}, "text": None, "values": None, "error": None,
+                   "ocr": False, "ai": False, "ask": None, "start": time.perf_counter()}
+
+    def lookup(item):
+        if cache is None and index is None:
+            return item
+        with metrics.time("hash", item["file_path"]):
+            h = item["hash"] = file_hash(item["file_path"])
+        with seen_lock:
+            if h in seen:
+                item["source"] = "duplicate"
+                return item
+            seen.add(h)
+        if cache is None:
+            return item
+        with metrics.time("cache", item["file_path"]):
+            values = cache.get(h, cache_backend)
+        if values is not None and all(k in values for k in extract_fields):
+            item["values"] = values
+            item["source"] = "cache"
+        else:
+            item["stored"] = values or {}
+        return item
+
+    def fail(item, step, e):
+        # 单个文件在某一步出错（文件读不了、OCR 失败、大模型连不上等）只把这个文件记为失败，
+        # 其余文件继续处理；流水线本身的错误仍由 run_pipeline 抛出
+        log(f"\n{step}失败（{item['filename']}）: {e}\n")
+        metrics.count(f"{step}_error")
+        item["values"], item["error"], item["text"] = None, f"{step}失败: {e}", None
+        item["ai"] = item["ocr"] = False
+        return item
+
+    def per_file(step, func):
+        def run(item):
+            try:
+                return func(item)
+            except Exception as e:
+                return fail(item, step, e)
+        return run
+
+    def extract(item):
+        if item["source"] != "extract" or item["error"] is not None:
+            return item
+        if item["file_path"].lower().endswith('.pdf'):
+            if executor is not None:
+                future = executor.submit(extract_file, item["file_path"], extract_fields, max_pages)
+                full_text, field_values, error, timings = future.result()
+            else:
+                full_text, field_values, error, timings = extract_file(item["file_path"], extract_fields, max_pages)
+            for stage, seconds in timings.items():
+                metrics.add(stage, seconds, item["file_path"])
+        else:
+            full_text, field_values, error = None, None, None
+        if error:
+            metrics.count("pdf_error")
+            log(error)
+        has_fields = full_text is not None and field_values and any(field_values.values())
+        failed = failed_fields(field_values, fields) if has_fields else None
+        if has_fields and (backend == "local" or not failed):
+            item["values"] = field_values
+        elif backend == "local":
+            item["error"] = error
+        elif has_fields:
+            # 只让大模型补全没找到或校验不通过的字段，其余字段沿用 pdf 文本解析的结果
+            log(f"\n字段校验未通过：{'、'.join(failed)}，交给AI补全（{item['filename']}）")
+            metrics.count("validation_failed")
+            item["text"], item["ai"], item["values"], item["ask"] = full_text, True, field_values, failed
+        else:
+            item["text"], item["ai"], item["ocr"], item["ask"] = full_text, True, True, extract_fields
+        return item
+
+    def ocr(item):
+        if item["ocr"]:
+            # 不是pdf，就走图片识别；先只识别选中字段所在的版面区域
+            log(f"\n未提取到有效字段，图片识别发票中，请稍候...（{item['filename']}）")
+            with metrics.time("ocr", item["file_path"]):
+                item["text"] = extractors.ocr.extract_from_path(item["file_path"], extract_fields)
+        return item
+
+    def ask_ai(items):
+        jobs = [item for item in items if item["ai"]]
+        if not jobs:
+            return items
+        try:
+            ask_ai_batch(jobs)
+        except Exception as e:
+            # 整批一起提交，不知道是哪张出的错（多半是密钥、网络问题），这一批都记为失败
+            for item in jobs:
+                fail(item, "AI处理", e)
+        return items
+
+    def ask_ai_batch(jobs):
+        ai = extractors.ai
+        log(f"\nAI处理发票中（{len(jobs)}张，同时处理{ai.max_concurrency}张），请稍候...\n")
+        stats_before = dict(ai.stats)
+        # 只发送要问的字段标签附近的文本
+        texts = [trim_text(item["text"], item["ask"]) for item in jobs]
+        for item, text in zip(jobs, texts):
+            metrics.count("prompt_tokens_full", estimate_tokens(item["text"]))
+            metrics.count("prompt_tokens_sent", estimate_tokens(text))
+        start = time.perf_counter()
+        # 每张发票只让模型输出 ask 中的字段：pdf 文本解析过的只补失败的几个，OCR 的是全部要提取的字段
+        results = ai.extract_partial(texts, [item["ask"] for item in jobs])
+        # 同一批一起提交，每张发票的等待时间都是整批的耗时
+        elapsed = time.perf_counter() - start
+        for item in jobs:
+            metrics.add("ai", elapsed, item["file_path"])
+            metrics.count("ai_fields", len(item["ask"]))
+        # 裁剪后的文本里没找到的字段，用全文再问一次
+        untrimmed = [i for i, item in enumerate(jobs) if texts[i] != item["text"] and results[i] is not None
+                     and any(results[i].get(k) is None for k in item["ask"])]
+        if untrimmed:
+            start = time.perf_counter()
+            retried = ai.extract_partial([jobs[i]["text"] for i in untrimmed], [jobs[i]["ask"] for i in untrimmed])
+            elapsed = time.perf_counter() - start
+            for i, values in zip(untrimmed, retried):
+                results[i] = values if values is not None else results[i]
+                metrics.add("ai_full_text", elapsed, jobs[i]["file_path"])
+                metrics.count("prompt_tokens_sent", estimate_tokens(jobs[i]["text"]))
+        # 按区域识别的文本没提取全（版面和模板对不上等），整页重新识别后再扔给ai识别一次
+        retry = [i for i, item in enumerate(jobs)
+                 if item["ocr"] and results[i] is not None and failed_fields(results[i], fields)]
+        if retry:
+            for i in list(retry):
+                log(f"\n字段未识别完整，整页重新识别：{jobs[i]['filename']}")
+                try:
+                    with metrics.time("ocr_full_page", jobs[i]["file_path"]):
+                        jobs[i]["text"] = extractors.ocr.extract_from_path(jobs[i]["file_path"])
+                except Exception as e:
+                    # 整页识别失败时保留按区域识别的结果
+                    log(f"\n整页识别失败（{jobs[i]['filename']}）: {e}\n")
+                    retry.remove(i)
+            start = time.perf_counter()
+            retried = ai.extract_partial([jobs[i]["text"] for i in retry], [jobs[i]["ask"] for i in retry])
+            elapsed = time.perf_counter() - start
+            for i, values in zip(retry, retried):
+                results[i] = values if values is not None else results[i]
+                metrics.add("ai_retry", elapsed, jobs[i]["file_path"])
+                metrics.count("prompt_tokens_sent", estimate_tokens(jobs[i]["text"]))
+        for item, values in zip(jobs, results):
+            if values is None:
+                # 请求失败（重试用尽、网络、密钥等），不能用空字段去重命名
+                fail(item, "AI处理", "大模型请求失败")
+                continue
+            # 模型没给出的字段保留 pdf 文本解析的值
+            merged = dict(item["values"] or {})
+            merged.update({k: v for k, v in values.items() if v is not None or k not in merged})
+            item["values"], item["text"] = merged, None
+        for key, value in ai.stats.items():
+            metrics.count(f"ai_{key}", value - stats_before.get(key, 0))
+
+    stages = [
+        Stage("lookup", per_file("读取文件", lookup), workers=IO_WORKERS),
+        Stage("extract", per_file("解析PDF", extract), workers=workers),
+        Stage("ocr", per_file("OCR识别", ocr), workers=OCR_WORKERS),
+        Stage("ai", ask_ai, workers=AI_WORKERS, batch_size=AI_BATCH_SIZE, queue_size=AI_BATCH_SIZE * 2),
+    ]
+    memo = {}       # 内容哈希 -> (字段, error)，供后面内容相同的文件复用
+    waiting = {}    # 内容哈希 -> 先于原文件到达的重复文件
+    try:
+        for item in run_pipeline(scan(), stages):
+            h = item["hash"]
+            if item["source"] == "duplicate":
+                if h not in memo:
+                    waiting.setdefault(h, []).append(item)
+                    continue
+                item["values"], item["error"] = memo[h]
+            elif h is not None:
+                if item["source"] == "extract" and item["values"] and any(item["values"].values()):
+                    run.remember(h, item["values"], item["stored"])
+                memo[h] = (item["values"], item["error"])
+            yield run.done(item, run.record(item, run.finish(item)))
+            for duplicate in waiting.pop(h, []):
+                duplicate["values"], duplicate["error"] = memo[h]
+                yield run.done(duplicate, run.record(duplicate, run.finish(duplicate)))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if index is not None:
+            index.close()
+        if not in_place:
+            log(f"\n已备份{backed_up}个文件到：{bak_dir}\n")
+        metrics.finish()
+        counters = metrics.summary()["counters"]
+        if counters.get("prompt_tokens_full"):
+            full, sent = counters["prompt_tokens_full"], counters.get("prompt_tokens_sent", 0)
+            log(f"\n发给大模型的发票文本约 {sent} tokens（全文约 {full} tokens），"
+                f"裁剪节省约 {full - sent} tokens（{(full - sent) / full:.0%}）\n")
+        log(metrics.report())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 程序的模块都在上一级目录，直接 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import os
+
+import rename_core
+
+
+class FakeOcr:
+    def extract_from_path(self, file_path, fields=None):
+        return "销售方名称：某公司 合计 94.34"
+
+
+class FakeAi:
+    max_concurrency = 1
+
+    def __init__(self, results):
+        self.results = results
+        self.stats = {"requests": 0, "retries": 0, "failed": 0, "batch_splits": 0}
+
+    def extract_partial(self, texts, field_lists):
+        return [self.results(fields) for fields in field_lists]
+
+
+def run(monkeypatch, folder, ai):
+    monkeypatch.setattr(rename_core._Extractors, "ai", property(lambda self: ai))
+    monkeypatch.setattr(rename_core._Extractors, "ocr", property(lambda self: FakeOcr()))
+    return list(rename_core.process_folder(folder, ["销方名称", "合计"], "_", in_place=True,
+                                           log=lambda msg: None))
+
+
+def make_scans(folder, names):
+    for name in names:
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(name.encode())
+
+
+def test_failed_request_is_not_renamed(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    make_scans(folder, ["a.png", "b.png"])
+    results = run(monkeypatch, folder, FakeAi(lambda fields: None))
+
+    assert [r["status"] for r in results] == ["failed", "failed"]
+    assert all("AI处理失败" in r["error"] for r in results)
+    assert {"a.png", "b.png"} <= set(os.listdir(folder))
+
+
+def test_all_fields_empty_is_failed(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    make_scans(folder, ["a.png"])
+    results = run(monkeypatch, folder, FakeAi(lambda fields: {key: None for key in fields}))
+
+    assert results[0]["status"] == "failed"
+    assert results[0]["new_name"] is None
+    assert os.path.exists(os.path.join(folder, "a.png"))
+
+
+def test_extracted_fields_are_renamed(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    make_scans(folder, ["a.png"])
+    results = run(monkeypatch, folder, FakeAi(lambda fields: {"销方名称": "某公司", "合计": "94.34"}))
+
+    assert results[0]["status"] == "renamed"
+    assert os.path.exists(os.path.join(folder, "某公司_94.34.png"))
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+from langchain_core.exceptions import OutputParserException
+
+from chat_ai_rename import InvoiceExtractor
+
+
+def make_extractor(error):
+    extractor = InvoiceExtractor.__new__(InvoiceExtractor)
+    extractor.stats = {"requests": 0, "retries": 0, "failed": 0, "batch_splits": 0}
+    extractor._chains = lambda keys: (None, None)
+    extractor.calls = 0
+
+    async def invoke(chain, payload):
+        extractor.calls += 1
+        raise error
+    extractor._ainvoke = invoke
+    return extractor
+
+
+def test_transport_error_fails_batch_once():
+    extractor = make_extractor(ConnectionError("连不上"))
+    results = asyncio.run(extractor.aextract_batch(["a", "b", "c", "d"]))
+    assert results == [None] * 4
+    assert extractor.calls == 1
+    assert extractor.stats["failed"] == 4
+    assert extractor.stats["batch_splits"] == 0
+
+
+def test_malformed_output_splits_batch():
+    extractor = make_extractor(OutputParserException("不是 JSON"))
+    results = asyncio.run(extractor.aextract_batch(["a", "b", "c", "d"]))
+    assert results == [None] * 4
+    assert extractor.stats["batch_splits"] == 3
+    assert extractor.stats["failed"] == 4
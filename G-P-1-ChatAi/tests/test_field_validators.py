@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+import pytest
+
+from field_validators import (
+    check_fields, credit_code_check_char, failed_fields, parse_amount, parse_date, tax_id_valid, words_to_amount
+)
+
+
+def test_tax_id_check_char():
+    prefix = "91420100MA4K2Y3B0"
+    code = prefix + credit_code_check_char(prefix)
+    assert tax_id_valid(code)
+    assert tax_id_valid(code.lower())
+    wrong = "1" if code[-1] != "1" else "2"
+    assert not tax_id_valid(prefix + wrong)
+
+
+@pytest.mark.parametrize("code", [
+    # 公开的真实统一社会信用代码，校验码算法要和它们一致
+    "91440300708461136T",
+    "914403001922038216",
+    "91330100799655058B",
+    "91110108558521630L",
+    "91110302562134916R",
+])
+def test_tax_id_known_good(code):
+    assert tax_id_valid(code)
+    assert credit_code_check_char(code) == code[-1]
+
+
+def test_tax_id_wrong_check_char():
+    # 提示词示例里曾用过的税号，校验码应为 C
+    assert not tax_id_valid("52420000123406283N")
+    assert tax_id_valid("52420000123406283C")
+
+
+def test_tax_id_old_formats():
+    assert tax_id_valid("420100123456789")
+    assert not tax_id_valid("4201001234")
+    assert not tax_id_valid("")
+
+
+def test_invoice_number_lengths():
+    assert failed_fields({"发票号码": "12345678"}, ["发票号码"]) == []
+    assert failed_fields({"发票号码": "25117000000321326035"}, ["发票号码"]) == []
+    assert failed_fields({"发票号码": "2511700000321326035"}, ["发票号码"]) == ["发票号码"]
+    assert failed_fields({"发票号码": "2511700000321326O35"}, ["发票号码"]) == ["发票号码"]
+
+
+def test_parse_date():
+    assert str(parse_date("2025年07月15日")) == "2025-07-15"
+    assert str(parse_date("2025-7-5")) == "2025-07-05"
+    assert parse_date("2025年02月30日") is None
+    assert parse_date("不是日期") is None
+
+
+def test_parse_amount():
+    assert parse_amount("¥1,234.50") == Decimal("1234.50")
+    assert parse_amount("-5.66") == Decimal("-5.66")
+    assert parse_amount("1.234") is None
+    assert parse_amount(None) is None
+
+
+def test_words_to_amount():
+    assert words_to_amount("壹佰圆整") == Decimal("100")
+    assert words_to_amount("壹佰零伍元叁角") == Decimal("105.3")
+    assert words_to_amount("壹万贰仟叁佰肆拾伍圆陆角柒分") == Decimal("12345.67")
+    assert words_to_amount("负壹拾圆整") == Decimal("-10")
+    assert words_to_amount("100") is None
+
+
+def test_missing_and_malformed_fields():
+    values = {"开票日期": "2025年13月01日", "销方名称": "  "}
+    assert failed_fields(values, ["开票日期", "销方名称", "开票人"]) == ["开票日期", "销方名称", "开票人"]
+
+
+def test_amount_cross_check():
+    values = {"合计": "94.34", "总税额": "5.66", "价税合计": "100.00", "价税合计大写": "壹佰圆整"}
+    assert failed_fields(values, ["合计"]) == []
+    values["总税额"] = "6.66"
+    assert failed_fields(values, ["合计"]) == ["合计", "总税额", "价税合计"]
+    # 不一致的一组不涉及要提取的字段时不用重新提取
+    assert failed_fields(values, ["开票人"]) == ["开票人"]
+
+
+def test_words_cross_check():
+    values = {"合计": "94.34", "总税额": "5.66", "价税合计": "100.00", "价税合计大写": "壹佰壹拾圆整"}
+    assert failed_fields(values, ["价税合计大写"]) == ["价税合计", "价税合计大写"]
+
+
+def test_check_fields():
+    assert check_fields(["销方名称", "开票日期"]) == []
+    assert check_fields(["销方名称", "合计"]) == ["总税额", "价税合计", "价税合计大写"]
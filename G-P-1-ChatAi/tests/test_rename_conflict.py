@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import rename_core
+from metrics import RunMetrics
+from rename_journal import RenameJournal
+
+
+def make_run(journal=None):
+    return rename_core._RenameRun(["销方名称", "合计"], "_", journal, None, "ai", None, RunMetrics(),
+                                  lambda msg: None)
+
+
+def apply(run, folder, name, values, content_hash=None):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(name.encode())
+    result = {"file": path, "status": "failed", "new_name": None, "fields": None, "error": None,
+              "source": "extract", "duplicate_of": None}
+    return run.apply(name, path, folder, values, result, content_hash)
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    # 同一秒内处理完的文件时间戳相同
+    monkeypatch.setattr(rename_core.time, "strftime", lambda fmt, *args: "20250101120000")
+
+
+def test_rename(tmp_path):
+    result = apply(make_run(), str(tmp_path), "a.pdf", {"销方名称": "某公司", "合计": "94.34"})
+    assert result["status"] == "renamed"
+    assert result["new_name"] == "某公司_94.34.pdf"
+    assert os.listdir(tmp_path) == ["某公司_94.34.pdf"]
+
+
+def test_conflicts_in_same_second_never_overwrite(tmp_path, fixed_time):
+    run, folder = make_run(), str(tmp_path)
+    values = {"销方名称": "某公司", "合计": "94.34"}
+    results = [apply(run, folder, f"{i}.pdf", values) for i in range(4)]
+
+    assert [r["status"] for r in results] == ["renamed", "conflict", "conflict", "conflict"]
+    assert [r["new_name"] for r in results] == [
+        "某公司_94.34.pdf",
+        "某公司_94.3420250101120000.pdf",
+        "某公司_94.3420250101120000_1.pdf",
+        "某公司_94.3420250101120000_2.pdf",
+    ]
+    # 每个文件都还在，内容没有被覆盖
+    for i, r in enumerate(results):
+        with open(os.path.join(folder, r["new_name"]), "rb") as f:
+            assert f.read() == f"{i}.pdf".encode()
+
+
+def test_conflict_with_journal(tmp_path, fixed_time):
+    folder = str(tmp_path)
+    values = {"销方名称": "某公司", "合计": "94.34"}
+    with RenameJournal(folder) as journal:
+        run = make_run(journal)
+        first = apply(run, folder, "a.pdf", values, "hash-a")
+        second = apply(run, folder, "b.pdf", values, "hash-b")
+    assert first["status"] == "renamed"
+    assert second["status"] == "conflict"
+    assert second["new_name"] == "某公司_94.3420250101120000.pdf"
+
+
+def test_rename_error_marks_failed(tmp_path, monkeypatch):
+    def broken_rename(src, dst):
+        raise PermissionError("文件被占用")
+    monkeypatch.setattr(rename_core.os, "rename", broken_rename)
+
+    result = apply(make_run(), str(tmp_path), "a.pdf", {"销方名称": "某公司", "合计": "94.34"})
+    assert result["status"] == "failed"
+    assert "文件被占用" in result["error"]
+    assert os.path.exists(os.path.join(tmp_path, "a.pdf"))
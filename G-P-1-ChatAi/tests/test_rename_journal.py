@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from rename_journal import JOURNAL_FILENAME, RenameJournal, list_runs, read_journal, undo
+
+
+def make_file(folder, name, data=b"%PDF-1.4 invoice"):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_rename_and_undo(tmp_path):
+    folder = str(tmp_path)
+    a = make_file(folder, "a.pdf", b"a")
+    b = make_file(folder, "b.pdf", b"b")
+    with RenameJournal(folder, run_id="run1") as journal:
+        journal.rename(a, os.path.join(folder, "销方A.pdf"))
+        journal.rename(b, os.path.join(folder, "销方B.pdf"))
+    assert sorted(os.listdir(folder)) == sorted([JOURNAL_FILENAME, "销方A.pdf", "销方B.pdf"])
+    assert list_runs(folder) == [("run1", 2)]
+
+    assert undo(folder, log=lambda msg: None) == (2, 0)
+    assert sorted(os.listdir(folder)) == sorted([JOURNAL_FILENAME, "a.pdf", "b.pdf"])
+    assert list_runs(folder) == [("run1", 0)]
+    # 已回滚的记录不会再回滚一次
+    assert undo(folder, log=lambda msg: None) == (0, 0)
+
+
+def test_undo_latest_run_only(tmp_path):
+    folder = str(tmp_path)
+    with RenameJournal(folder, run_id="run1") as journal:
+        journal.rename(make_file(folder, "a.pdf", b"a"), os.path.join(folder, "A.pdf"))
+    with RenameJournal(folder, run_id="run2") as journal:
+        journal.rename(make_file(folder, "b.pdf", b"b"), os.path.join(folder, "B.pdf"))
+
+    assert undo(folder, log=lambda msg: None) == (1, 0)
+    assert os.path.exists(os.path.join(folder, "A.pdf"))
+    assert os.path.exists(os.path.join(folder, "b.pdf"))
+
+
+def test_rename_never_overwrites(tmp_path):
+    folder = str(tmp_path)
+    a = make_file(folder, "a.pdf", b"a")
+    target = make_file(folder, "已存在.pdf", b"other")
+    with RenameJournal(folder) as journal:
+        with pytest.raises(FileExistsError):
+            journal.rename(a, target)
+    with open(target, "rb") as f:
+        assert f.read() == b"other"
+    assert read_journal(folder) == ([], {})
+
+
+def test_undo_skips_modified_file(tmp_path):
+    folder = str(tmp_path)
+    new_path = os.path.join(folder, "A.pdf")
+    with RenameJournal(folder) as journal:
+        journal.rename(make_file(folder, "a.pdf", b"a"), new_path)
+    with open(new_path, "ab") as f:
+        f.write(b"changed")
+
+    assert undo(folder, log=lambda msg: None) == (0, 1)
+    assert os.path.exists(new_path)
+    assert undo(folder, verify=False, log=lambda msg: None) == (1, 0)
+    assert os.path.exists(os.path.join(folder, "a.pdf"))
+
+
+def test_undo_pending_rename_that_never_happened(tmp_path):
+    # 写了日志但改名前崩溃：文件还是原名，回滚时只记为 abort
+    folder = str(tmp_path)
+    make_file(folder, "a.pdf", b"a")
+    with open(os.path.join(folder, JOURNAL_FILENAME), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "rename", "id": "r:1", "run": "r", "old": "a.pdf", "new": "A.pdf",
+                            "hash": None, "time": 0}) + "\n")
+
+    assert undo(folder, log=lambda msg: None) == (0, 0)
+    assert os.path.exists(os.path.join(folder, "a.pdf"))
+    assert read_journal(folder)[1] == {"r:1": "abort"}
+
+
+def test_uses_given_content_hash(tmp_path):
+    folder = str(tmp_path)
+    with RenameJournal(folder) as journal:
+        journal.rename(make_file(folder, "a.pdf", b"a"), os.path.join(folder, "A.pdf"), content_hash="abc")
+    renames, _ = read_journal(folder)
+    assert renames[0]["hash"] == "abc"
@@ -0,0 +1,102 @@
+"""
+界面日志：工作线程只把日志放进队列，由 Tk 主线程用 after 定时批量写入文本框。
+tkinter 控件只能在主线程操作；文本框只保留最近 MAX_LINES 行，完整日志同时写到日志文件。
+
+用法：
+    ui_log = UiLog(text_area)
+    threading.Thread(target=lambda: work(log=ui_log)).start()   # 工作线程中 ui_log("一行日志\n")
+    ui_log.call(messagebox.showinfo, "处理完成", "...")          # 需要操作界面时交给主线程执行
+    root.mainloop()
+    ui_log.close()
+"""
+import os
+import queue
+import sys
+import time
+import tkinter as tk
+
+MAX_LINES = 2000          # 文本框最多保留的行数
+FLUSH_INTERVAL_MS = 100   # 主线程刷新间隔
+MAX_BATCH = 5000          # 每次刷新最多取出的日志条数，避免一次刷新太久卡住界面
+
+
+def default_log_dir():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, "logs")
+
+
+class UiLog:
+    """可在任意线程调用的日志函数，写入 text_area 和日志文件。"""
+
+    def __init__(self, text_area, log_path=None, max_lines=MAX_LINES, interval_ms=FLUSH_INTERVAL_MS):
+        self.text_area = text_area
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.queue = queue.SimpleQueue()
+        if log_path is None:
+            log_path = os.path.join(default_log_dir(), time.strftime("rename_%Y%m%d_%H%M%S.log"))
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        self.log_path = log_path
+        self.file = open(log_path, "a", encoding="utf-8")
+        text_area.after(interval_ms, self._flush)
+
+    def __call__(self, msg):
+        self.queue.put(msg)
+
+    def call(self, func, *args):
+        """让主线程在写完此前的日志后执行 func(*args)，如弹出 messagebox、关闭窗口。"""
+        self.queue.put((func, args))
+
+    def _drain(self):
+        """取出队列中现有的内容，文本合并成一段，遇到 call 时先把前面的文本交出去。"""
+        parts = []
+        for _ in range(MAX_BATCH):
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                yield "".join(parts), item
+                parts = []
+            else:
+                parts.append(item)
+        yield "".join(parts), None
+
+    def _write(self, text):
+        if not text:
+            return
+        self.file.write(text)
+        self.text_area.insert(tk.END, text)
+        lines = int(self.text_area.index("end-1c").split(".")[0])
+        if lines > self.max_lines:
+            self.text_area.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        self.text_area.see(tk.END)
+
+    def _flush(self):
+        try:
+            for text, item in self._drain():
+                self._write(text)
+                if item is not None:
+                    func, args = item
+                    func(*args)
+            self.file.flush()
+            self.text_area.after(self.interval_ms, self._flush)
+        except tk.TclError:
+            pass  # 窗口已关闭
+
+    def close(self):
+        """窗口关闭后调用：把还没显示的日志写进文件。"""
+        if self.file.closed:
+            return
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(item, tuple):
+                self.file.write(item)
+        self.file.close()
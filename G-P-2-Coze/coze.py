@@ -1,43 +1,49 @@
-import hashlib
 import os
 import re
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
-import requests
 import json
+import queue
 import shutil
 import threading
 
+from coze_cache import DEFAULT_FILE_ID_TTL, CozeCache, default_cache_path, file_hash
+from coze_client import DEFAULT_POLL_INTERVAL, CozeClient, CozeError
+from dedup import find_duplicates, remove_duplicates
+from pipeline import Stage, run_pipeline
+from ui_log import UiLog
+
+UPLOAD_WORKERS = 4    # 同时上传的文件数
+RUN_QUEUE_SIZE = 16   # 已上传、等待执行工作流的文件数上限，上传不会跑得太靠前
+MAX_IN_FLIGHT = 0     # 大于 0 时异步执行工作流，同时执行的上限
+FORBIDDEN_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+_clients = {}
+
+def _default_client(ACCESS_TOKEN):
+    # 函数式接口按凭证共用同一个连接池
+    client = _clients.get(ACCESS_TOKEN)
+    if client is None:
+        client = _clients[ACCESS_TOKEN] = CozeClient(ACCESS_TOKEN)
+    return client
+
+def workflow_parameters(file_id, system):
+    return {"system": system, "image": json.dumps({"file_id": file_id})}
+
 def run_play(file_id, ACCESS_TOKEN, WORKFLOW_ID, system):
-    url = 'https://api.coze.cn/v1/workflow/run'
-    headers = {
-        'Authorization': f'Bearer {ACCESS_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    data = {
-        "workflow_id": WORKFLOW_ID,
-        "parameters": {
-            "system": system,
-            "image": "{\"file_id\": \"" + file_id + "\"}"
-        }
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    return response.json()
+    return _default_client(ACCESS_TOKEN).request(
+        "POST", "/v1/workflow/run", json={"workflow_id": WORKFLOW_ID, "parameters": workflow_parameters(file_id, system)})
 
 def upload_file(file_path, ACCESS_TOKEN):
-    upload_url = "https://api.coze.cn/v1/files/upload"
-    headers = {
-        'Authorization': f'Bearer {ACCESS_TOKEN}'
-    }
-    with open(file_path, "rb") as file:
-        files = {"file": file}
-        print(files)
-        resp = requests.post(upload_url, headers=headers, files=files).json()
-        if resp.get("data") and resp["data"].get("id"):
-            print(resp['data']['id'])
-            return resp["data"]["id"]
-        else:
-            return None
+    try:
+        return _default_client(ACCESS_TOKEN).upload_file(file_path)
+    except CozeError:
+        return None
+
+def parse_new_name(run_result):
+    """工作流输出（JSON 字符串）-> 新文件名，文件名里不能用的字符替换成 FORBIDDEN_CHARS。"""
+    output_dict = json.loads(run_result)
+    return FORBIDDEN_CHARS.sub('FORBIDDEN_CHARS', output_dict['output'] + '.pdf')
 
 def get_backup_dir(pdf_dir):
     parent_dir = os.path.dirname(pdf_dir.rstrip(os.sep))
@@ -53,7 +59,19 @@ def get_backup_dir(pdf_dir):
     os.makedirs(bak_dir, exist_ok=True)
     return bak_dir
 
-def process_files(text_area, ACCESS_TOKEN, pdf_dir, WORKFLOW_ID, field_list, split, rename_rule):
+def process_files(log, ACCESS_TOKEN, pdf_dir, WORKFLOW_ID, field_list, split, rename_rule, client=None,
+                  upload_workers=UPLOAD_WORKERS, max_in_flight=MAX_IN_FLIGHT, poll_interval=DEFAULT_POLL_INTERVAL,
+                  cache_path=None, file_id_ttl=DEFAULT_FILE_ID_TTL):
+    """
+    备份 pdf_dir 下的 PDF 后逐个上传到 Coze、执行工作流得到新文件名并重命名备份文件。
+
+    :param client: 共用的 CozeClient，不传时按 ACCESS_TOKEN 新建一个，处理完关闭。
+    :param upload_workers: 同时上传的文件数。
+    :param max_in_flight: 大于 0 时异步执行工作流，最多这么多个同时执行，按完成顺序重命名；为 0 时逐个同步执行。
+    :param poll_interval: 异步执行时查询结果的间隔，秒。
+    :param cache_path: 上传和工作流结果缓存（SQLite）路径，None 表示不使用缓存。
+    :param file_id_ttl: 缓存的 file_id 有效秒数，过期后重新上传。
+    """
     with open('发票命名规则.txt', 'r', encoding='utf-8') as f:
         system = f.read()
     fields = "、".join(field_list)
@@ -61,14 +79,13 @@ def process_files(text_area, ACCESS_TOKEN, pdf_dir, WORKFLOW_ID, field_list, spl
     system = system.replace('split', "'" + split + "'")
     system = system.replace('rename', rename_rule)
     # print(system)
-    text_area.insert(tk.INSERT, "AI 系统提示词如下：\n")
-    text_area.insert(tk.END, system + '\n\n')
+    log("AI 系统提示词如下：\n")
+    log(system + '\n\n')
     bak_dir = get_backup_dir(pdf_dir)
-    text_area.insert(tk.END, f"你选择的文件夹是：{pdf_dir}\n")
-    text_area.insert(tk.END, f"命名规则：{rename_rule}\n")
-    text_area.insert(tk.END, "开始处理...\n")
-    text_area.insert(tk.END, f"\n正在备份PDF文件到：{bak_dir}\n")
-    text_area.see(tk.END)
+    log(f"你选择的文件夹是：{pdf_dir}\n")
+    log(f"命名规则：{rename_rule}\n")
+    log("开始处理...\n")
+    log(f"\n正在备份PDF文件到：{bak_dir}\n")
     count = 0
     for filename in os.listdir(pdf_dir):
         if filename.lower().endswith('.pdf'):
@@ -76,47 +93,146 @@ def process_files(text_area, ACCESS_TOKEN, pdf_dir, WORKFLOW_ID, field_list, spl
             dst = os.path.join(bak_dir, filename)
             shutil.copy2(src, dst)
             count += 1
-    text_area.insert(tk.END, f"已备份{count}个PDF文件到 {bak_dir}\n")
-    text_area.see(tk.END)
+    log(f"已备份{count}个PDF文件到 {bak_dir}\n")
 
-    total = 0
-    for filename in os.listdir(bak_dir):
-        if not filename.lower().endswith('.pdf'):
-            continue
-        old_path = os.path.join(bak_dir, filename)
-        text_area.insert(tk.END, f"\n正在上传：{filename} ...\n")
-        text_area.see(tk.END)
-        file_id = upload_file(old_path, ACCESS_TOKEN)
-        if not file_id:
-            text_area.insert(tk.END, f"上传失败：{filename}\n")
-            text_area.see(tk.END)
-            continue
+    own_client = client is None
+    if own_client:
+        client = CozeClient(ACCESS_TOKEN, pool_size=upload_workers + 1)
+
+    cache = CozeCache(cache_path, file_id_ttl) if cache_path else None
+    hash_locks = {}   # 内容哈希 -> 锁，在 hash_locks_guard 下创建，保证同一哈希只有一把锁
+    hash_locks_guard = threading.Lock()
+
+    def upload_fresh(item):
+        log(f"正在上传：{item['filename']} ...\n")
         try:
-            run_result = run_play(file_id, ACCESS_TOKEN, WORKFLOW_ID, system).get("data")
-            if run_result is None:
-                raise ValueError("API未返回预期字符串")
-            if not isinstance(run_result, str):
-                raise ValueError("API未返回预期字符串")
-            output_dict = json.loads(run_result)
-            new_name = output_dict['output'] + '.pdf'
-            new_name = re.sub(r'[\\/:*?"<>|]', 'FORBIDDEN_CHARS', new_name)
-        except Exception as e:
-            text_area.insert(tk.END, f"获取新文件名失败：{filename}，错误：{e}\n")
-            text_area.see(tk.END)
-            continue
-        new_path = os.path.join(bak_dir, new_name)
-        if os.path.exists(new_path):
-            text_area.insert(tk.END, f"文件名冲突：{new_name}，跳过\n")
-            text_area.see(tk.END)
-            continue
-        os.rename(old_path, new_path)
-        text_area.insert(tk.END, f"重命名：{filename} -> {new_name}\n")
-        text_area.see(tk.END)
-        total += 1
-
-    text_area.insert(tk.END, f"\n全部处理完成！共成功处理{total}个PDF。\n")
-    text_area.see(tk.END)
-    messagebox.showinfo("处理完成", f"全部处理完成！共成功处理{total}个PDF。")
+            item["file_id"] = client.upload_file(item["path"])
+        except (OSError, CozeError) as e:
+            log(f"上传失败：{item['filename']}，错误：{e}\n")
+            return None
+        item["source"] = "upload"
+        if cache is not None:
+            cache.put_file_id(item["hash"], item["file_id"])
+        return item
+
+    def upload(item):
+        if cache is None:
+            return upload_fresh(item)
+        try:
+            item["hash"] = file_hash(item["path"])
+        except OSError as e:
+            log(f"读取失败：{item['filename']}，错误：{e}\n")
+            return None
+        output = cache.get_output(item["hash"], WORKFLOW_ID, system)
+        if output is not None:
+            item["source"] = "cache"
+            return set_new_name(item, output)
+        # 同一批里内容相同的文件排队，前一个传完后一个直接用它的 file_id
+        with hash_locks_guard:
+            lock = hash_locks.setdefault(item["hash"], threading.Lock())
+        with lock:
+            item["file_id"] = cache.get_file_id(item["hash"])
+            if item["file_id"]:
+                item["source"] = "file_id"
+                return item
+            return upload_fresh(item)
+
+    def set_new_name(item, run_result=None, error=None):
+        if error is None:
+            try:
+                item["new_name"] = parse_new_name(run_result)
+            except (ValueError, KeyError, TypeError) as e:
+                error = e
+            else:
+                if cache is not None and item["source"] != "cache":
+                    cache.put_output(item["hash"], WORKFLOW_ID, system, run_result)
+        if error is not None:
+            item["error"] = f"获取新文件名失败：{item['filename']}，错误：{error}"
+        return item
+
+    def run(item):
+        if item["new_name"] is not None or item["error"] is not None:
+            return item
+        if cache is not None:
+            output = cache.get_output(item["hash"], WORKFLOW_ID, system)
+            if output is not None:
+                item["source"] = "cache"
+                return set_new_name(item, output)
+        try:
+            run_result = client.run_workflow(WORKFLOW_ID, workflow_parameters(item["file_id"], system))
+        except CozeError as e:
+            return retry_uploaded(item, e)
+        return set_new_name(item, run_result)
+
+    def retry_uploaded(item, error):
+        # 缓存的 file_id 可能已在 Coze 上失效，删掉后重新上传、同步执行一次
+        if item["source"] != "file_id":
+            return set_new_name(item, error=error)
+        cache.forget_file_id(item["hash"])
+        if upload_fresh(item) is None:
+            return set_new_name(item, error=error)
+        return run(item)
+
+    def run_async():
+        # 已上传的文件立即异步提交，最多 max_in_flight 个同时执行，谁先执行完先重命名谁
+        ready = queue.SimpleQueue()   # 命中输出缓存、不用执行工作流的文件
+
+        def jobs():
+            for item in run_pipeline(items, [Stage("upload", upload, workers=upload_workers)]):
+                if item["new_name"] is not None or item["error"] is not None:
+                    ready.put(item)
+                else:
+                    yield item, workflow_parameters(item["file_id"], system)
+
+        def drain():
+            while not ready.empty():
+                yield ready.get()
+
+        for item, run_result, error in client.run_workflows(WORKFLOW_ID, jobs(), max_in_flight, poll_interval):
+            yield from drain()
+            yield set_new_name(item, run_result) if error is None else retry_uploaded(item, error)
+        yield from drain()
+
+    items = [{"filename": filename, "path": os.path.join(bak_dir, filename), "hash": None, "file_id": None,
+              "source": None, "new_name": None, "error": None}
+             for filename in sorted(os.listdir(bak_dir)) if filename.lower().endswith('.pdf')]
+    if max_in_flight > 0:
+        results = run_async()
+    else:
+        # 上传在线程池里并发进行，工作流紧跟在后面逐个执行，重命名在本线程按完成顺序进行
+        results = run_pipeline(items, [Stage("upload", upload, workers=upload_workers),
+                                       Stage("run", run, workers=1, queue_size=RUN_QUEUE_SIZE)])
+    total = 0
+    sources = {}
+    try:
+        for item in results:
+            filename, new_name = item["filename"], item["new_name"]
+            sources[item["source"]] = sources.get(item["source"], 0) + 1
+            if item["error"]:
+                log(item["error"] + "\n")
+                continue
+            new_path = os.path.join(bak_dir, new_name)
+            if os.path.exists(new_path):
+                log(f"文件名冲突：{new_name}，跳过\n")
+                continue
+            try:
+                os.rename(item["path"], new_path)
+            except OSError as e:
+                log(f"重命名失败：{filename}，错误：{e}\n")
+                continue
+            log(f"重命名：{filename} -> {new_name}\n")
+            total += 1
+    finally:
+        if own_client:
+            client.close()
+        if cache is not None:
+            cache.close()
+
+    if cache is not None:
+        log(f"\n缓存：{sources.get('cache', 0)}个文件直接使用了上次的工作流结果，"
+            f"{sources.get('file_id', 0)}个文件复用了已上传的文件，{sources.get('upload', 0)}个文件重新上传。\n")
+    log(f"\n全部处理完成！共成功处理{total}个PDF。\n")
+    log.call(messagebox.showinfo, "处理完成", f"全部处理完成！共成功处理{total}个PDF。")
 
 def run_main_ui(cfg, on_done=None):
     root = tk.Tk()
@@ -137,11 +253,21 @@ def run_main_ui(cfg, on_done=None):
 
     access_token = config["access_token"]
     workflow_id = config.get("workflow_id", "")
+    # 可选：api_base 换成本地替身服务测试，upload_workers 同时上传的文件数
+    upload_workers = int(config.get("upload_workers", UPLOAD_WORKERS))
+    # 可选：max_in_flight 大于 0 时异步执行工作流，同时执行这么多个
+    max_in_flight = int(config.get("max_in_flight", MAX_IN_FLIGHT))
+    # 可选：cache 为 false 时不用缓存，file_id_ttl_days 已上传文件的复用天数
+    cache_path = default_cache_path() if config.get("cache", True) else None
+    file_id_ttl = float(config.get("file_id_ttl_days", DEFAULT_FILE_ID_TTL / 86400)) * 86400
+    client = CozeClient(access_token, base_url=config.get("api_base"), pool_size=upload_workers + 1)
 
     text_area = scrolledtext.ScrolledText(root, width=80, height=24, font=("微软雅黑", 11))
     text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-    text_area.see(tk.END)
     text_area.insert(tk.INSERT, "文件名中若出现 FORBIDDEN_CHARS 字符串说明 字段 中有不符合文件名规则的符合......\n")
+    ui_log = UiLog(text_area)
+    text_area.insert(tk.END, f"完整日志：{ui_log.log_path}\n")
+    text_area.see(tk.END)
 
     def finish_and_return():
         try:
@@ -153,45 +279,36 @@ def run_main_ui(cfg, on_done=None):
             on_done()
 
     def threaded_process():
-        process_files(text_area, access_token, pdf_dir, workflow_id, fields, split, rename_rule)
-        finish_and_return()
+        try:
+            process_files(ui_log, access_token, pdf_dir, workflow_id, fields, split, rename_rule,
+                          client=client, upload_workers=upload_workers, max_in_flight=max_in_flight,
+                          cache_path=cache_path, file_id_ttl=file_id_ttl)
+        finally:
+            client.close()
+        ui_log.call(finish_and_return)
 
     threading.Thread(target=threaded_process, daemon=True).start()
     root.mainloop()
+    ui_log.close()
 
 
-def filter_duplicate_files(folder):
+def filter_duplicate_files(folder, recursive=False, include=None, exclude=None):
     """
-    检查folder下所有文件，按内容去重（保留一个，删除其它重复的）。
+    检查folder下所有文件，按内容去重（保留一个，删除其它重复的），recursive 为 True 时包含子文件夹，
+    include / exclude 为只检查 / 跳过的文件通配符（见 file_walk）。
     """
     if not os.path.isdir(folder):
         messagebox.showerror("错误", f"目录不存在: {folder}")
         return
 
-    hash_map = {}  # hash值 -> 文件路径
-    removed = []
-    total = 0
-
-    for fname in os.listdir(folder):
-        path = os.path.join(folder, fname)
-        if not os.path.isfile(path):
-            continue
-        with open(path, "rb") as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        if file_hash in hash_map:
-            # 已存在相同内容，删除当前文件
-            try:
-                os.remove(path)
-                removed.append(fname)
-            except Exception as e:
-                messagebox.showerror("删除失败", f"{fname} 删除失败: {e}")
-        else:
-            hash_map[file_hash] = path
-        total += 1
+    total, groups = find_duplicates(folder, recursive=recursive, include=include, exclude=exclude)
+    removed, failed = remove_duplicates(groups)
+    for path, e in failed:
+        messagebox.showerror("删除失败", f"{os.path.relpath(path, folder)} 删除失败: {e}")
 
     msg = f"共检测到{total}个文件，已删除{len(removed)}个重复文件。"
     if removed:
-        msg += "\n已删除文件:\n" + "\n".join(removed)
+        msg += "\n已删除文件:\n" + "\n".join(os.path.relpath(path, folder) for path in removed)
     messagebox.showinfo("过滤完成", msg)
 
 
@@ -0,0 +1,146 @@
+"""
+Coze 上传和工作流结果缓存（SQLite，默认放在程序同目录的 coze_cache.sqlite3）。
+
+- 文件内容 sha256 -> 上传得到的 file_id，超过 file_id_ttl 秒后失效，同样的文件不再重复上传；
+- (文件内容 sha256, 工作流 ID, 提示词) -> 工作流输出，命名规则没变时连工作流也不用再执行。
+
+用法：
+    with CozeCache() as cache:
+        output = cache.get_output(content_hash, workflow_id, system)
+        file_id = cache.get_file_id(content_hash)
+        cache.put_file_id(content_hash, file_id)
+        cache.put_output(content_hash, workflow_id, system, output)
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+CACHE_FILENAME = "coze_cache.sqlite3"
+DEFAULT_FILE_ID_TTL = 30 * 24 * 3600     # 上传的文件在 Coze 上保留的时间有限，file_id 超过 30 天不再复用
+OUTPUT_MAX_AGE = 180 * 24 * 3600         # 工作流输出超过 180 天没用过就删除
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def default_cache_path():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, CACHE_FILENAME)
+
+
+def file_hash(file_path):
+    """分块计算文件内容的 sha256，不把整个文件读进内存。"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _prompt_hash(system):
+    return hashlib.sha256(system.encode("utf-8")).hexdigest()
+
+
+class CozeCache:
+    """可在多个线程中共用（内部加锁）。"""
+
+    def __init__(self, path=None, file_id_ttl=DEFAULT_FILE_ID_TTL):
+        self.path = path or default_cache_path()
+        self.file_id_ttl = file_id_ttl
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS uploaded_file ("
+            " content_hash TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " uploaded REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS workflow_output ("
+            " content_hash TEXT NOT NULL,"
+            " workflow_id TEXT NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " output TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, workflow_id, prompt_hash));"
+            "CREATE INDEX IF NOT EXISTS idx_workflow_output_last_used ON workflow_output (last_used);"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_file_id(self, content_hash):
+        """返回未过期的 file_id，没有时返回 None。"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT file_id FROM uploaded_file WHERE content_hash = ? AND uploaded > ?",
+                (content_hash, time.time() - self.file_id_ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_file_id(self, content_hash, file_id):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploaded_file (content_hash, file_id, uploaded) VALUES (?, ?, ?)",
+                (content_hash, file_id, time.time()),
+            )
+            self.conn.commit()
+
+    def forget_file_id(self, content_hash):
+        """file_id 在 Coze 上已失效时删除，下次重新上传。"""
+        with self.lock:
+            self.conn.execute("DELETE FROM uploaded_file WHERE content_hash = ?", (content_hash,))
+            self.conn.commit()
+
+    def get_output(self, content_hash, workflow_id, system):
+        key = (content_hash, workflow_id, _prompt_hash(system))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT output FROM workflow_output WHERE content_hash = ? AND workflow_id = ? AND prompt_hash = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE workflow_output SET last_used = ?"
+                " WHERE content_hash = ? AND workflow_id = ? AND prompt_hash = ?",
+                (time.time(), *key),
+            )
+        return row[0]
+
+    def put_output(self, content_hash, workflow_id, system, output):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workflow_output"
+                " (content_hash, workflow_id, prompt_hash, output, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, workflow_id, _prompt_hash(system), output, now, now),
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """删除过期的 file_id 和很久没用过的工作流输出，返回删除条数。"""
+        now = time.time()
+        with self.lock:
+            removed = self.conn.execute(
+                "DELETE FROM uploaded_file WHERE uploaded <= ?", (now - self.file_id_ttl,)).rowcount
+            removed += self.conn.execute(
+                "DELETE FROM workflow_output WHERE last_used <= ?", (now - OUTPUT_MAX_AGE,)).rowcount
+            self.conn.commit()
+        return removed
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.evict()
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
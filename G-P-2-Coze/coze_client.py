@@ -0,0 +1,208 @@
+"""
+Coze API 客户端：所有请求共用一个带连接池的 requests.Session，连接保持 keep-alive 复用，
+每个请求都有连接 / 读取超时，连接失败、429、5xx 时按指数退避自动重试（服务端给了 Retry-After 就按它等）。
+执行工作流（POST /v1/workflow/run）只在连接失败和 429 时重试：读取超时、网关 502/504 时服务端可能已经收下请求，
+重发会把工作流再执行一遍、重复消耗额度。
+
+API 地址默认 https://api.coze.cn，可用 config.json 的 api_base 或环境变量 COZE_API_BASE 换成本地替身服务
+（benchmarks/coze_stub_server.py），不花额度也能测并发、超时和重试。
+
+用法：
+    client = CozeClient(access_token, pool_size=8)
+    file_id = client.upload_file(path)
+    data = client.run_workflow(workflow_id, {"system": system, "image": json.dumps({"file_id": file_id})})
+    # 异步执行，最多 8 个同时在跑，按完成顺序拿结果
+    for job, data, error in client.run_workflows(workflow_id, jobs, max_in_flight=8):
+        ...
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "https://api.coze.cn"
+DEFAULT_TIMEOUT = (10, 180)   # (连接, 读取) 秒，工作流同步执行较慢，读取超时放宽
+DEFAULT_RETRIES = 3
+DEFAULT_POOL_SIZE = 8
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RUN_RETRY_STATUS = (429,)   # 执行工作流时只有限流能确定请求没被执行
+WORKFLOW_RUN_PATH = "/v1/workflow/run"
+DEFAULT_POLL_INTERVAL = 1.0   # 异步执行时查询结果的间隔，秒
+_DONE = object()
+
+
+class CozeError(Exception):
+    """请求失败（重试后仍失败、超时、返回的不是 JSON 或 code 不为 0）。"""
+
+
+def default_base_url(base_url=None):
+    return (base_url or os.environ.get("COZE_API_BASE") or DEFAULT_BASE_URL).rstrip("/")
+
+
+class CozeClient:
+    """可在多个线程中共用，连接池最多保持 pool_size 个连接。"""
+
+    def __init__(self, access_token, base_url=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = default_base_url(base_url)
+        self.timeout = timeout
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=0.5,
+                      status_forcelist=RETRY_STATUS, allowed_methods=None, respect_retry_after_header=True,
+                      raise_on_status=False)
+        # pool_block：线程数多于连接数时等待空闲连接，而不是临时新建再丢掉
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        run_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry.new(read=0, status_forcelist=RUN_RETRY_STATUS),
+                                  pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # requests 按最长前缀选 adapter，执行工作流的请求只在连接失败和 429 时重试
+        self.session.mount(self.base_url + WORKFLOW_RUN_PATH, run_adapter)
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def request(self, method, path, **kwargs):
+        """发请求并返回解析后的 JSON，失败时抛出 CozeError。"""
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException as e:
+            raise CozeError(f"请求失败：{e}") from e
+        try:
+            body = response.json()
+        except ValueError:
+            raise CozeError(f"HTTP {response.status_code}，返回的不是 JSON：{response.text[:200]}") from None
+        if response.status_code >= 400 or body.get("code", 0) != 0:
+            raise CozeError(f"HTTP {response.status_code}，code={body.get('code')}：{body.get('msg', '')}")
+        return body
+
+    def upload_file(self, file_path):
+        """上传文件，返回 file_id。"""
+        with open(file_path, "rb") as f:
+            body = self.request("POST", "/v1/files/upload", files={"file": (os.path.basename(file_path), f)})
+        file_id = (body.get("data") or {}).get("id")
+        if not file_id:
+            raise CozeError("上传接口未返回 file_id")
+        return file_id
+
+    def run_workflow(self, workflow_id, parameters):
+        """同步执行工作流，返回 data（工作流输出的 JSON 字符串）。"""
+        body = self.request("POST", WORKFLOW_RUN_PATH, json={"workflow_id": workflow_id, "parameters": parameters})
+        data = body.get("data")
+        if not isinstance(data, str):
+            raise CozeError("API未返回预期字符串")
+        return data
+
+    def run_workflow_async(self, workflow_id, parameters):
+        """异步执行工作流，立即返回 execute_id。"""
+        body = self.request("POST", WORKFLOW_RUN_PATH,
+                            json={"workflow_id": workflow_id, "parameters": parameters, "is_async": True})
+        execute_id = body.get("execute_id")
+        if not execute_id:
+            raise CozeError("异步执行未返回 execute_id")
+        return execute_id
+
+    def workflow_result(self, workflow_id, execute_id):
+        """查询异步执行的结果，还在执行时返回 None，成功时返回与同步执行相同格式的 data，失败时抛出 CozeError。"""
+        body = self.request("GET", f"/v1/workflows/{workflow_id}/run_histories/{execute_id}")
+        history = (body.get("data") or [{}])[0]
+        status = history.get("execute_status")
+        if status == "Running":
+            return None
+        if status != "Success":
+            raise CozeError(f"工作流执行失败：{history.get('error_message') or status}")
+        return _unwrap_output(history.get("output"))
+
+    def run_workflows(self, workflow_id, jobs, max_in_flight, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        异步执行一批工作流，同时最多 max_in_flight 个，按完成顺序产出 (job, data, error)，error 不为 None 时 data 为 None。
+
+        :param jobs: (job, parameters) 的可迭代对象，可以是边上传边产出的流水线；
+                     由后台线程读取，等待下一个文件上传时不耽误查询已提交的结果。
+        """
+        pending = queue.Queue(max(1, max_in_flight))
+        stop = threading.Event()
+        errors = []
+
+        def put(item):
+            # 调用方提前结束时不会一直卡在满队列上
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def feed():
+            try:
+                for job in jobs:
+                    if not put(job):
+                        return
+            except Exception as e:
+                errors.append(e)
+            put(_DONE)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        running = []   # [(job, execute_id)]
+        exhausted = False
+        try:
+            while running or not exhausted:
+                # 有空位就提交；没有在执行的任务时阻塞等下一个，否则只取已经到的
+                while not exhausted and len(running) < max_in_flight:
+                    try:
+                        item = pending.get(block=not running)
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        exhausted = True
+                        break
+                    job, parameters = item
+                    try:
+                        running.append((job, self.run_workflow_async(workflow_id, parameters)))
+                    except CozeError as e:
+                        yield job, None, e
+                if not running:
+                    continue
+                time.sleep(poll_interval)
+                still_running = []
+                for job, execute_id in running:
+                    try:
+                        data = self.workflow_result(workflow_id, execute_id)
+                    except CozeError as e:
+                        yield job, None, e
+                        continue
+                    if data is None:
+                        still_running.append((job, execute_id))
+                    else:
+                        yield job, data, None
+                running = still_running
+        finally:
+            stop.set()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        self.session.close()
+
+
+def _unwrap_output(output):
+    """异步执行记录里的 output 外面多包了一层 {"Output": "..."}，去掉后与同步执行的 data 一致。"""
+    try:
+        value = json.loads(output)
+    except (TypeError, ValueError):
+        raise CozeError("API未返回预期字符串") from None
+    if isinstance(value, dict) and set(value) == {"Output"} and isinstance(value["Output"], str):
+        return value["Output"]
+    return output
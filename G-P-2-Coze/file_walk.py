@@ -0,0 +1,70 @@
+"""
+遍历目录中的文件：基于 os.scandir，边遍历边产出，不先把整棵目录树的清单读进内存，
+按 年/月/部门 分文件夹存放的几十万个文件也能直接处理。
+
+- 每个文件只 stat 一次（scandir 返回的 DirEntry 会缓存，Windows 上目录清单里就带了，不用再访问文件），
+  结果里的 size / mtime_ns 直接给后面的步骤用；
+- include / exclude 为通配符列表（fnmatch）：不含 "/" 的匹配文件名或目录名，含 "/" 的匹配相对路径，
+  如 "*.pdf"、"草稿"、"2024/*/财务部/*"；exclude 匹配到的目录整个跳过，不再往下遍历；
+- 跳过符号链接，读不了的目录跳过。
+
+用法：
+    for entry in walk_files(folder, recursive=True, include=["*.pdf"], exclude=["草稿"]):
+        entry.path, entry.rel_path, entry.size, entry.mtime_ns
+"""
+import fnmatch
+import os
+from collections import namedtuple
+
+# path：完整路径；rel_path：相对 root 的路径（分隔符统一为 "/"）
+FileEntry = namedtuple("FileEntry", "path rel_path size mtime_ns")
+
+
+def parse_patterns(value):
+    """把命令行 / 配置里逗号分隔的通配符拆成列表，空字符串或 None 返回 None。"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.replace("，", ",").split(",")
+    patterns = [p.strip().replace("\\", "/") for p in value if p.strip()]
+    return patterns or None
+
+
+def _matches(rel_path, name, patterns):
+    return any(fnmatch.fnmatch(rel_path if "/" in p else name, p) for p in patterns)
+
+
+def walk_files(root, recursive=False, include=None, exclude=None):
+    """
+    按目录深度优先产出 root 下的 FileEntry，同一目录内按名称排序，先文件后子目录。
+
+    一次只读一个目录的清单（读完再产出，调用方边遍历边重命名这个目录里的文件也不会读到改名后的文件），
+    内存占用取决于最大的单个目录，而不是整棵树。
+    """
+    pending = [(root, "")]
+    while pending:
+        current, rel_dir = pending.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not (exclude and _matches(rel_path, entry.name, exclude)):
+                        subdirs.append((entry.path, rel_path + "/"))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if include and not _matches(rel_path, entry.name, include):
+                    continue
+                if exclude and _matches(rel_path, entry.name, exclude):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            yield FileEntry(entry.path, rel_path, st.st_size, st.st_mtime_ns)
+        pending.extend(reversed(subdirs))
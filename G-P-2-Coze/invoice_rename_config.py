@@ -96,9 +96,14 @@ class FieldSelector(tk.Tk):
         ToolTip(
             filter_tip_label,
             "一键过滤并删除当前文件夹下内容完全相同的重复文件，仅保留每组中的一个。\n"
-            "仅比较文件内容（不比对文件名），不会遍历子文件夹。"
+            "仅比较文件内容（不比对文件名），勾选“含子文件夹”时一并检查所有子文件夹。"
         )
         filter_btn.pack(side="right", padx=8, pady=2)
+        self.recursive_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            hint_frame, text="含子文件夹", variable=self.recursive_var,
+            font=("微软雅黑", 10), bg="#f4f4f9"
+        ).pack(side="right", pady=2)
 
         tk.Button(
             hint_frame, text="确认",
@@ -183,7 +188,7 @@ class FieldSelector(tk.Tk):
     def filter_files(self):
         folder = self.folder_var.get()
         from coze import filter_duplicate_files
-        filter_duplicate_files(folder)
+        filter_duplicate_files(folder, recursive=self.recursive_var.get())
 
     def relayout_fields(self):
         # 动态计算列数
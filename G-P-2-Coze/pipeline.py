@@ -0,0 +1,145 @@
+"""
+分阶段流水线：每个阶段有自己的线程数，阶段之间用有界队列连接。
+读盘、pdf 解析、OCR、网络请求可以同时进行；下游处理不过来时队列写满，上游自动等待，
+所以不管文件夹里有多少文件，在途的文件数都不超过各队列容量之和，内存占用保持平稳。
+
+用法：
+    stages = [Stage("hash", hash_file, workers=4), Stage("extract", parse_pdf, workers=8)]
+    for item in run_pipeline(iter_files(), stages):
+        rename(item)          # 最后一步在调用方线程中串行执行
+"""
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 64
+_POLL_SECONDS = 0.1
+_DONE = object()
+
+
+class Stage:
+    """
+    流水线中的一个阶段。
+
+    :param func: 处理函数，batch_size 为 1 时 func(item) -> item，否则 func(items) -> items。
+                 返回 None 表示该文件不再往下游传递。
+    :param workers: 并行执行 func 的线程数。
+    :param batch_size: 大于 1 时每次从队列取出已有的（最多 batch_size 个）文件一起处理，适合批量请求大模型。
+    :param queue_size: 本阶段输入队列的容量。
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+
+
+class _Runner:
+    def __init__(self, stages, output_queue_size):
+        self.stages = stages
+        self.queues = [queue.Queue(stage.queue_size) for stage in stages] + [queue.Queue(output_queue_size)]
+        self.stop = threading.Event()
+        self.errors = []
+        self.lock = threading.Lock()
+        self.alive = [stage.workers for stage in stages]
+        self.threads = []
+
+    def put(self, q, item):
+        # 带超时轮询，调用方提前结束时不会一直卡在满队列上
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def feed(self, source):
+        try:
+            for item in source:
+                if not self.put(self.queues[0], item):
+                    return
+        except Exception as e:
+            self.fail(e)
+            return
+        self.put(self.queues[0], _DONE)
+
+    def fail(self, error):
+        self.errors.append(error)
+        self.stop.set()
+
+    def work(self, index):
+        stage = self.stages[index]
+        q_in, q_out = self.queues[index], self.queues[index + 1]
+        done = False
+        while not done and not self.stop.is_set():
+            item = self.get(q_in)
+            if item is _DONE:
+                break
+            batch = [item]
+            while len(batch) < stage.batch_size:
+                try:
+                    item = q_in.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+            try:
+                results = stage.func(batch) if stage.batch_size > 1 else [stage.func(batch[0])]
+            except Exception as e:
+                self.fail(e)
+                return
+            for result in results:
+                if result is not None and not self.put(q_out, result):
+                    return
+        # 把结束标记留给同阶段的其他线程，最后一个退出的线程通知下游
+        self.put(q_in, _DONE)
+        with self.lock:
+            self.alive[index] -= 1
+            last = self.alive[index] == 0
+        if last:
+            self.put(q_out, _DONE)
+
+    def start(self, source):
+        self.threads.append(threading.Thread(target=self.feed, args=(source,), daemon=True))
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                self.threads.append(threading.Thread(target=self.work, args=(index,), daemon=True,
+                                                     name=f"{stage.name}-{n}"))
+        for thread in self.threads:
+            thread.start()
+
+    def close(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+
+
+def run_pipeline(source, stages, output_queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    在后台线程中让 source 的每一项依次经过 stages，按完成顺序产出最后一个阶段的结果。
+    任一阶段抛出异常时停止整条流水线，并在调用方重新抛出该异常。
+    """
+    runner = _Runner(stages, output_queue_size)
+    runner.start(source)
+    try:
+        while True:
+            item = runner.get(runner.queues[-1])
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        runner.close()
+    if runner.errors:
+        raise runner.errors[0]
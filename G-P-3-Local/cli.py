@@ -0,0 +1,311 @@
+"""
+命令行批量重命名（无界面，不导入 tkinter），适合在服务器 / cron 中运行。
+
+示例：
+    python cli.py rename D:/发票/pdfs --fields 销方名称,开票日期,合计 --split _
+    python cli.py rename D:/发票/pdfs --in-place
+    python cli.py rename D:/发票/归档 --recursive --include *.pdf --exclude 草稿
+    python cli.py watch D:/发票/收件箱 --fields 销方名称,开票日期,合计
+    python cli.py undo D:/发票/pdfs
+    python cli.py cache stats
+    python cli.py cache clear
+    python cli.py cache invalidate D:/发票/pdfs/a.pdf
+    python cli.py dedup D:/发票 --recursive --dry-run
+    python cli.py rename D:/发票/pdfs --index
+    python cli.py index query --seller 某某公司 --quarter 2025Q3
+
+每处理完一个 PDF 向 stdout 输出一行 JSON，状态日志写到 stderr。
+退出码：0 全部重命名成功；1 有文件未能重命名；2 参数或目录错误。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from dedup import DEFAULT_WORKERS as DEDUP_WORKERS, default_index_path, find_duplicates, remove_duplicates
+from extract_cache import ExtractCache, default_cache_path, file_hash
+from file_walk import parse_patterns
+from invoice_index import InvoiceIndex, default_invoice_index_path, quarter_range
+from metrics import RunMetrics
+from rename_journal import list_runs, undo
+from rename_core import DEFAULT_MAX_PAGES, DEFAULT_WORKERS, FIELD_KEYS, process_folder
+from watch_folder import POLL_INTERVAL, SETTLE_SECONDS, WatchState, default_state_path, watch_folder
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+
+
+def parse_fields(value):
+    fields = [f.strip() for f in value.replace("，", ",").split(",") if f.strip()]
+    unknown = [f for f in fields if f not in FIELD_KEYS]
+    if not fields:
+        raise argparse.ArgumentTypeError("请至少选择一个字段")
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知字段: {'、'.join(unknown)}，可选：{'、'.join(FIELD_KEYS)}")
+    return fields
+
+
+def add_extract_arguments(parser):
+    """rename 和 watch 共用的参数：命名字段、提取方式、缓存和台账。"""
+    parser.add_argument("folder", help="目标文件夹")
+    parser.add_argument("--fields", type=parse_fields, default=["销方名称", "开票日期", "合计"],
+                        help="逗号分隔的命名字段，按顺序拼接（默认：销方名称,开票日期,合计）")
+    parser.add_argument("--split", default="_", help="分隔符（默认：_）")
+    parser.add_argument("--backend", choices=["local"], default="local",
+                        help="提取方式，本地版只支持 pdf 文本解析")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"pdf 解析进程数（默认：CPU 核数 {DEFAULT_WORKERS}，1 表示不开进程池）")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES,
+                        help=f"每个 PDF 最多读取的页数，字段找全后提前停止（默认：{DEFAULT_MAX_PAGES}，0 表示不限制）")
+    parser.add_argument("--cache", default=default_cache_path(),
+                        help="提取结果缓存文件（默认：程序同目录的 extract_cache.sqlite3）")
+    parser.add_argument("--no-cache", action="store_true", help="不读写缓存")
+    parser.add_argument("--index", action="store_true", help="写发票台账（默认不写）")
+    parser.add_argument("--index-path", default=default_invoice_index_path(),
+                        help="发票台账文件（默认：程序同目录的 invoice_index.sqlite3）")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地PDF发票批量重命名")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_rename = sub.add_parser("rename", help="备份目录后按字段重命名其中的PDF")
+    add_extract_arguments(p_rename)
+    p_rename.add_argument("--in-place", action="store_true",
+                          help="不复制备份目录，直接在原目录重命名并写入日志（可用 undo 回滚）")
+    p_rename.add_argument("--recursive", action="store_true", help="包含子文件夹（边遍历边处理，适合按年/月/部门分文件夹的归档）")
+    p_rename.add_argument("--include", type=parse_patterns,
+                          help="逗号分隔的通配符，只处理匹配的文件，如 *.pdf；含 / 时匹配相对路径，如 2025/*/财务部/*")
+    p_rename.add_argument("--exclude", type=parse_patterns, help="逗号分隔的通配符，跳过匹配的文件和子文件夹")
+    p_rename.add_argument("--flatten", action="store_true",
+                          help="子文件夹中的文件重命名后都放到输出目录顶层（默认保持子文件夹结构）")
+    p_rename.add_argument("--metrics-csv", help="把每个文件各步骤的耗时写到这个 CSV 文件")
+    p_rename.add_argument("--metrics-json", help="把各步骤耗时分位数和计数汇总写到这个 JSON 文件")
+    p_rename.add_argument("--prometheus",
+                          help="把汇总写成 Prometheus textfile（放在 node_exporter textfile collector 目录下的 .prom 文件）")
+
+    p_watch = sub.add_parser("watch", help="常驻监视文件夹，新文件写完后自动原地重命名（可用 undo 回滚）")
+    add_extract_arguments(p_watch)
+    p_watch.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                         help=f"文件大小和修改时间多少秒不变算写完（默认：{SETTLE_SECONDS:g}）")
+    p_watch.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                         help=f"没有文件变化通知时扫描目录的间隔，秒（默认：{POLL_INTERVAL:g}）")
+    p_watch.add_argument("--polling", action="store_true", help="不用文件变化通知（如网络共享目录），只定时扫描")
+    p_watch.add_argument("--include-existing", action="store_true",
+                         help="第一次监视时也处理目录中已有的文件（默认只处理之后新到的）")
+    p_watch.add_argument("--state", default=default_state_path(),
+                         help="已处理文件记录（默认：程序同目录的 watch_state.sqlite3）")
+
+    p_undo = sub.add_parser("undo", help="按原地重命名日志回滚")
+    p_undo.add_argument("folder", help="目标文件夹")
+    p_undo.add_argument("--run", help="要回滚的运行编号，默认最近一次；all 表示全部")
+    p_undo.add_argument("--list", action="store_true", help="只列出日志中的运行编号")
+    p_undo.add_argument("--no-verify", action="store_true", help="回滚前不校验文件内容哈希")
+    p_undo.add_argument("--index-path", default=default_invoice_index_path(),
+                        help="发票台账文件，存在时把其中的文件路径一并改回（默认：程序同目录的 invoice_index.sqlite3）")
+
+    p_cache = sub.add_parser("cache", help="查看或清理提取结果缓存")
+    p_cache.add_argument("action", choices=["stats", "clear", "invalidate"],
+                         help="stats 查看统计；clear 清空；invalidate 删除指定文件的缓存")
+    p_cache.add_argument("files", nargs="*", help="invalidate 时要删除缓存的文件")
+    p_cache.add_argument("--backend", help="只处理以此开头的后端版本，如 local")
+    p_cache.add_argument("--cache", default=default_cache_path(), help="缓存文件路径")
+
+    p_dedup = sub.add_parser("dedup", help="删除内容完全相同的重复文件，每组保留一个")
+    p_dedup.add_argument("folder", help="目标文件夹")
+    p_dedup.add_argument("--recursive", action="store_true", help="包含子文件夹")
+    p_dedup.add_argument("--include", type=parse_patterns, help="逗号分隔的通配符，只检查匹配的文件")
+    p_dedup.add_argument("--exclude", type=parse_patterns, help="逗号分隔的通配符，跳过匹配的文件和子文件夹")
+    p_dedup.add_argument("--dry-run", action="store_true", help="只列出重复文件，不删除")
+    p_dedup.add_argument("--workers", type=int, default=DEDUP_WORKERS,
+                         help=f"并行计算哈希的线程数（默认：{DEDUP_WORKERS}）")
+    p_dedup.add_argument("--index", default=default_index_path(),
+                         help="文件哈希索引（默认：程序同目录的 hash_index.sqlite3）")
+    p_dedup.add_argument("--no-index", action="store_true", help="不读写哈希索引")
+
+    p_index = sub.add_parser("index", help="查询发票台账，不用打开 PDF")
+    p_index.add_argument("action", choices=["query", "duplicates", "stats"],
+                         help="query 按条件查询；duplicates 列出对应多个文件的发票；stats 查看统计")
+    p_index.add_argument("--seller", help="销方名称或税号，含 %% 时模糊匹配")
+    p_index.add_argument("--buyer", help="购方名称或税号，含 %% 时模糊匹配")
+    p_index.add_argument("--number", help="发票号码")
+    p_index.add_argument("--from", dest="date_from", help="开票日期起，如 2025-07-01")
+    p_index.add_argument("--to", dest="date_to", help="开票日期止（含）")
+    p_index.add_argument("--quarter", help="开票季度，如 2025Q3，与 --from/--to 二选一")
+    p_index.add_argument("--limit", type=int, help="最多输出条数")
+    p_index.add_argument("--index", default=default_invoice_index_path(), help="发票台账文件路径")
+    return parser
+
+
+def log_stderr(msg):
+    sys.stderr.write(msg)
+    sys.stderr.flush()
+
+
+def cmd_rename(args):
+    if not os.path.isdir(args.folder):
+        log_stderr(f"目录不存在: {args.folder}\n")
+        return EXIT_USAGE
+
+    total = 0
+    success_count = 0
+    metrics = RunMetrics(csv_path=args.metrics_csv)
+    for result in process_folder(args.folder, args.fields, args.split,
+                                 workers=args.workers, cache_path=None if args.no_cache else args.cache,
+                                 index_path=args.index_path if args.index else None,
+                                 max_pages=args.max_pages, in_place=args.in_place,
+                                 recursive=args.recursive, include=args.include, exclude=args.exclude,
+                                 flatten=args.flatten, metrics=metrics, log=log_stderr):
+        total += 1
+        if result["status"] == "renamed":
+            success_count += 1
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+    log_stderr(f"\n全部处理完成。共处理{total}个PDF，成功重命名{success_count}个。\n")
+    return EXIT_OK if success_count == total else EXIT_PARTIAL
+
+
+def cmd_watch(args):
+    if not os.path.isdir(args.folder):
+        log_stderr(f"目录不存在: {args.folder}\n")
+        return EXIT_USAGE
+
+    def process_batch(filenames):
+        # 每批新文件一次原地重命名运行（各有日志编号，可按批 undo）
+        return process_folder(args.folder, args.fields, args.split, workers=args.workers,
+                              cache_path=None if args.no_cache else args.cache,
+                              index_path=args.index_path if args.index else None,
+                              max_pages=args.max_pages, in_place=True, filenames=filenames, log=log_stderr)
+
+    total = 0
+    success_count = 0
+    with WatchState(args.state) as state:
+        try:
+            for result in watch_folder(args.folder, process_batch, state, settle=args.settle,
+                                       poll_interval=args.poll_interval, use_events=not args.polling,
+                                       include_existing=args.include_existing, log=log_stderr):
+                total += 1
+                if result["status"] == "renamed":
+                    success_count += 1
+                sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+    log_stderr(f"\n已停止监视。共处理{total}个文件，成功重命名{success_count}个。\n")
+    return EXIT_OK
+
+
+def cmd_undo(args):
+    if not os.path.isdir(args.folder):
+        log_stderr(f"目录不存在: {args.folder}\n")
+        return EXIT_USAGE
+    if args.list:
+        for run_id, count in list_runs(args.folder):
+            print(json.dumps({"run": run_id, "pending_undo": count}, ensure_ascii=False))
+        return EXIT_OK
+    index = InvoiceIndex(args.index_path) if os.path.isfile(args.index_path) else None
+    try:
+        restored, skipped = undo(args.folder, run_id=args.run, verify=not args.no_verify, index=index,
+                                 log=log_stderr)
+    finally:
+        if index is not None:
+            index.close()
+    log_stderr(f"回滚完成。已恢复{restored}个文件，跳过{skipped}个。\n")
+    return EXIT_OK if skipped == 0 else EXIT_PARTIAL
+
+
+def cmd_cache(args):
+    with ExtractCache(args.cache) as cache:
+        if args.action == "stats":
+            print(json.dumps(cache.stats(), ensure_ascii=False))
+            return EXIT_OK
+        if args.action == "clear":
+            removed = cache.invalidate(backend=args.backend)
+        else:
+            if not args.files:
+                log_stderr("invalidate 需要指定至少一个文件\n")
+                return EXIT_USAGE
+            removed = 0
+            for file_path in args.files:
+                if not os.path.isfile(file_path):
+                    log_stderr(f"文件不存在: {file_path}\n")
+                    return EXIT_USAGE
+                removed += cache.invalidate(content_hash=file_hash(file_path), backend=args.backend)
+    log_stderr(f"已删除{removed}条缓存记录。\n")
+    return EXIT_OK
+
+
+def cmd_dedup(args):
+    if not os.path.isdir(args.folder):
+        log_stderr(f"目录不存在: {args.folder}\n")
+        return EXIT_USAGE
+    use_index = not args.no_index
+    total, groups = find_duplicates(args.folder, recursive=args.recursive, workers=max(1, args.workers),
+                                    index_path=args.index, use_index=use_index,
+                                    include=args.include, exclude=args.exclude)
+    for group in groups:
+        print(json.dumps({"keep": group[0], "duplicates": group[1:]}, ensure_ascii=False))
+    if args.dry_run:
+        log_stderr(f"共检测到{total}个文件，发现{sum(len(g) - 1 for g in groups)}个重复文件（未删除）。\n")
+        return EXIT_OK
+    removed, failed = remove_duplicates(groups, index_path=args.index, use_index=use_index)
+    for path, e in failed:
+        log_stderr(f"{path} 删除失败: {e}\n")
+    log_stderr(f"共检测到{total}个文件，已删除{len(removed)}个重复文件。\n")
+    return EXIT_OK if not failed else EXIT_PARTIAL
+
+
+def cmd_index(args):
+    if not os.path.isfile(args.index):
+        log_stderr(f"发票台账不存在: {args.index}\n")
+        return EXIT_USAGE
+    date_from, date_to = args.date_from, args.date_to
+    if args.quarter:
+        try:
+            date_from, date_to = quarter_range(args.quarter)
+        except ValueError as e:
+            log_stderr(f"{e}\n")
+            return EXIT_USAGE
+    # 只读打开，查询时不会新建或修改台账
+    with InvoiceIndex(args.index, read_only=True) as index:
+        if args.action == "stats":
+            print(json.dumps(index.stats(), ensure_ascii=False))
+            return EXIT_OK
+        if args.action == "duplicates":
+            rows = index.duplicates()
+        else:
+            rows = index.query(seller=args.seller, buyer=args.buyer, invoice_number=args.number,
+                               date_from=date_from, date_to=date_to, limit=args.limit)
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    log_stderr(f"共{len(rows)}张发票。\n")
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "rename":
+        return cmd_rename(args)
+    if args.command == "watch":
+        return cmd_watch(args)
+    if args.command == "undo":
+        return cmd_undo(args)
+    if args.command == "cache":
+        return cmd_cache(args)
+    if args.command == "dedup":
+        return cmd_dedup(args)
+    if args.command == "index":
+        return cmd_index(args)
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包成 exe 后进程池需要
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+查找内容完全相同的重复文件，文件再多、再大也不用整个读进内存。
+
+1. 按文件大小分组，大小唯一的文件不可能重复，直接跳过；
+2. 大小相同的文件只读开头和结尾各 64KB 计算局部哈希，进一步分组；
+3. 局部哈希仍相同的才分块读完整个文件计算全文哈希。
+
+哈希用标准库的 blake2b（比 md5 / sha256 快），多个文件用线程池并行计算。
+算过的哈希按 (路径, 大小, 修改时间) 记在 hash_index.sqlite3 里，文件没变时下次直接复用。
+
+用法：
+    total, groups = find_duplicates(folder, recursive=True)
+    for group in groups:      # 每组第一个保留，其余是它的重复文件
+        keep, duplicates = group[0], group[1:]
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from file_walk import walk_files
+
+INDEX_FILENAME = "hash_index.sqlite3"
+PARTIAL_BYTES = 64 * 1024         # 局部哈希读取开头、结尾各这么多字节
+HASH_CHUNK_SIZE = 1024 * 1024     # 全文哈希每次读取的块大小
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+
+def default_index_path():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, INDEX_FILENAME)
+
+
+def partial_hash(file_path, size):
+    """文件开头和结尾各 PARTIAL_BYTES 字节的哈希；文件不超过 2*PARTIAL_BYTES 时等于全文哈希。"""
+    h = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        if size <= 2 * PARTIAL_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_BYTES))
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def full_hash(file_path):
+    """分块计算全文哈希。"""
+    h = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashIndex:
+    """
+    持久化的文件哈希索引，可在多个线程中共用（内部加锁）。
+    文件大小或修改时间变了，记录自动失效。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hash ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " partial TEXT,"
+            " full TEXT)"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, path, size, mtime_ns):
+        """返回 (局部哈希, 全文哈希)，没有记录或文件已变化时返回 (None, None)。"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT partial, full FROM file_hash WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns),
+            ).fetchone()
+        return row or (None, None)
+
+    def put(self, path, size, mtime_ns, partial=None, full=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO file_hash (path, size, mtime_ns, partial, full) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET"
+                " partial = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns"
+                "   THEN COALESCE(excluded.partial, partial) ELSE excluded.partial END,"
+                " full = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns"
+                "   THEN COALESCE(excluded.full, full) ELSE excluded.full END,"
+                " size = excluded.size, mtime_ns = excluded.mtime_ns",
+                (path, size, mtime_ns, partial, full),
+            )
+
+    def forget(self, path):
+        with self.lock:
+            self.conn.execute("DELETE FROM file_hash WHERE path = ?", (path,))
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+
+
+def scan_files(folder, recursive=False, include=None, exclude=None):
+    """返回 [(路径, 大小, 修改时间ns)]，跳过符号链接；recursive 为 True 时包含子文件夹，include / exclude 见 file_walk。"""
+    files = [(entry.path, entry.size, entry.mtime_ns)
+             for entry in walk_files(os.path.abspath(folder), recursive, include, exclude)]
+    files.sort()
+    return files
+
+
+def _group(files, key_func, workers):
+    """对 files 并行计算 key_func，只保留两个及以上文件的分组。"""
+    groups = defaultdict(list)
+    with ThreadPoolExecutor(workers) as pool:
+        for item, key in zip(files, pool.map(key_func, files)):
+            if key is not None:
+                groups[key].append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(folder, recursive=False, workers=DEFAULT_WORKERS, index_path=None, use_index=True,
+                    include=None, exclude=None):
+    """
+    查找 folder 下内容完全相同的文件。
+
+    :return: (检查的文件数, 重复分组列表)，每组是按路径排序的文件路径列表，至少两个。
+    """
+    files = scan_files(folder, recursive, include, exclude)
+    index = HashIndex(index_path) if use_index else None
+
+    def cached(item, column):
+        if index is None:
+            return None
+        return index.get(*item)[column]
+
+    def partial_key(item):
+        path, size, mtime_ns = item
+        value = cached(item, 0)
+        if value is None:
+            try:
+                value = partial_hash(path, size)
+            except OSError:
+                return None
+            if index is not None:
+                index.put(path, size, mtime_ns, partial=value)
+        return value
+
+    def full_key(item):
+        path, size, mtime_ns = item
+        if size <= 2 * PARTIAL_BYTES:
+            return "partial"  # 局部哈希已经覆盖整个文件
+        value = cached(item, 1)
+        if value is None:
+            try:
+                value = full_hash(path)
+            except OSError:
+                return None
+            if index is not None:
+                index.put(path, size, mtime_ns, full=value)
+        return value
+
+    try:
+        by_size = defaultdict(list)
+        for item in files:
+            by_size[item[1]].append(item)
+        candidates = [item for group in by_size.values() if len(group) > 1 for item in group]
+
+        duplicates = []
+        for group in _group(candidates, partial_key, workers):
+            duplicates.extend(_group(group, full_key, workers))
+    finally:
+        if index is not None:
+            index.close()
+    groups = sorted(sorted(path for path, _, _ in group) for group in duplicates)
+    return len(files), groups
+
+
+def remove_duplicates(groups, index_path=None, use_index=True):
+    """
+    删除每组中除第一个以外的文件，并从哈希索引中移除它们。
+
+    :return: (已删除的路径列表, [(删除失败的路径, 异常)])
+    """
+    removed, failed = [], []
+    index = HashIndex(index_path) if use_index else None
+    try:
+        for group in groups:
+            for path in group[1:]:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    failed.append((path, e))
+                    continue
+                removed.append(path)
+                if index is not None:
+                    index.forget(path)
+    finally:
+        if index is not None:
+            index.close()
+    return removed, failed
@@ -96,9 +96,20 @@ class FieldSelector(tk.Tk):
         ToolTip(
             filter_tip_label,
             "一键过滤并删除当前文件夹下内容完全相同的重复文件，仅保留每组中的一个。\n"
-            "仅比较文件内容（不比对文件名），不会遍历子文件夹。"
+            "仅比较文件内容（不比对文件名），勾选“含子文件夹”时一并检查所有子文件夹。\n"
+            "勾选“含子文件夹”后点确认，子文件夹中的发票也会重命名（保持原来的子文件夹结构）。"
         )
         filter_btn.pack(side="right", padx=8, pady=2)
+        self.recursive_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            hint_frame, text="含子文件夹", variable=self.recursive_var,
+            font=("微软雅黑", 10), bg="#f4f4f9"
+        ).pack(side="right", pady=2)
+        self.index_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            hint_frame, text="写发票台账", variable=self.index_var,
+            font=("微软雅黑", 10), bg="#f4f4f9"
+        ).pack(side="right", pady=2)
 
         tk.Button(
             hint_frame, text="确认",
@@ -183,7 +194,7 @@ class FieldSelector(tk.Tk):
     def filter_files(self):
         folder = self.folder_var.get()
         from rename_function import filter_duplicate_files
-        filter_duplicate_files(folder)
+        filter_duplicate_files(folder, recursive=self.recursive_var.get())
 
     def relayout_fields(self):
         # 动态计算列数
@@ -259,7 +270,9 @@ class FieldSelector(tk.Tk):
             "fields": self.selected_order,
             "split": self.split_var.get(),
             "rename": self.rename_preview.get(),
-            "folder": self.folder_var.get()
+            "folder": self.folder_var.get(),
+            "recursive": self.recursive_var.get(),
+            "index": self.index_var.get(),
         }
         if self.on_confirm:
             self.on_confirm(cfg)  # 调用外部回调，把配置数据传出去
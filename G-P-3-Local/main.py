@@ -1,3 +1,4 @@
+import multiprocessing
 import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
@@ -26,4 +27,5 @@ def start_config():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包成 exe 后进程池需要
     start_config()
@@ -0,0 +1,152 @@
+"""
+运行耗时统计：记录每个文件在每个步骤（读 pdf、解析、OCR、大模型、重命名……）上花的时间和结果计数，
+运行结束时输出各步骤的 p50 / p95 / p99，并可导出 CSV（逐文件明细）、JSON（汇总）和 Prometheus textfile。
+
+用法：
+    metrics = RunMetrics(csv_path="run.csv")
+    with metrics.time("rename", file_path):
+        os.rename(src, dst)
+    metrics.count("renamed")
+    log(metrics.report())
+    metrics.write_json("run.json")
+    metrics.write_prometheus("/var/lib/node_exporter/textfile/invoice_rename.prom")
+"""
+import csv
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = "invoice_rename"
+
+
+def percentiles(durations):
+    """返回 (p50, p95, p99)，单位与输入相同。"""
+    if not durations:
+        return None, None, None
+    if len(durations) == 1:
+        return durations[0], durations[0], durations[0]
+    cuts = statistics.quantiles(durations, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+class RunMetrics:
+    """一次运行的步骤耗时和计数，可在流水线的多个线程中共用（内部加锁）。"""
+
+    def __init__(self, csv_path=None):
+        self.lock = threading.Lock()
+        self.durations = {}     # 步骤 -> [秒]
+        self.errors = {}        # 步骤 -> 出错次数
+        self.counters = {}      # 名称 -> 计数
+        self.started = time.time()
+        self.finished = None
+        self.csv_file = None
+        self.csv_writer = None
+        if csv_path:
+            os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+            self.csv_file = open(csv_path, "w", encoding="utf-8-sig", newline="")
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(["time", "file", "stage", "seconds", "outcome"])
+
+    def add(self, stage, seconds, file=None, outcome="ok"):
+        """记录一次步骤耗时；outcome 不是 ok 时同时计入该步骤的出错次数。"""
+        with self.lock:
+            self.durations.setdefault(stage, []).append(seconds)
+            if outcome != "ok":
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+            if self.csv_writer is not None:
+                self.csv_writer.writerow([f"{time.time():.3f}", file or "", stage, f"{seconds:.6f}", outcome])
+
+    @contextmanager
+    def time(self, stage, file=None):
+        """计时上下文，块内抛出异常时 outcome 记为 error 并继续抛出。"""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - start, file, outcome)
+
+    def count(self, name, n=1):
+        if not n:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.time()
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = self.csv_writer = None
+
+    def summary(self):
+        """{"wall_seconds", "stages": {步骤: {count, errors, total_s, p50_s, p95_s, p99_s, max_s}}, "counters"}"""
+        with self.lock:
+            stages = {}
+            for stage, durations in self.durations.items():
+                p50, p95, p99 = percentiles(durations)
+                stages[stage] = {"count": len(durations), "errors": self.errors.get(stage, 0),
+                                 "total_s": round(sum(durations), 6), "p50_s": round(p50, 6),
+                                 "p95_s": round(p95, 6), "p99_s": round(p99, 6), "max_s": round(max(durations), 6)}
+            counters = dict(self.counters)
+        wall = (self.finished or time.time()) - self.started
+        return {"started": self.started, "wall_seconds": round(wall, 3), "stages": stages, "counters": counters}
+
+    def report(self):
+        """各步骤耗时表（毫秒），写进日志用。"""
+        summary = self.summary()
+        # 表头的中文在等宽字体里占两格，宽度相应减小
+        lines = [f"\n耗时统计（总耗时 {summary['wall_seconds']:.1f} 秒）：",
+                 f"{'步骤':<10}{'次数':>6}{'出错':>4}{'合计(s)':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"]
+        for stage, s in summary["stages"].items():
+            lines.append(f"{stage:<12}{s['count']:>8}{s['errors']:>6}{s['total_s']:>10.2f}"
+                         f"{s['p50_s'] * 1000:>10.1f}{s['p95_s'] * 1000:>10.1f}{s['p99_s'] * 1000:>10.1f}")
+        if summary["counters"]:
+            lines.append("计数：" + "，".join(f"{k} {v}" for k, v in sorted(summary["counters"].items())))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), ensure_ascii=False, indent=2) + "\n")
+
+    def write_prometheus(self, path, prefix=PROMETHEUS_PREFIX):
+        """
+        写 node_exporter textfile collector 格式：各步骤的分位数（summary 类型）、次数、出错次数和计数器。
+        先写临时文件再改名，node_exporter 不会读到一半的文件。
+        """
+        summary = self.summary()
+        lines = [f"# HELP {prefix}_stage_seconds Per-file duration of each processing stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, s in summary["stages"].items():
+            for quantile, key in (("0.5", "p50_s"), ("0.95", "p95_s"), ("0.99", "p99_s")):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {s[key]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {s["total_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        lines += [f"# HELP {prefix}_stage_errors Stage invocations that ended in an error.",
+                  f"# TYPE {prefix}_stage_errors gauge"]
+        for stage, s in summary["stages"].items():
+            lines.append(f'{prefix}_stage_errors{{stage="{stage}"}} {s["errors"]}')
+        lines += [f"# HELP {prefix}_events Outcome counters of the last run.",
+                  f"# TYPE {prefix}_events gauge"]
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f'{prefix}_events{{name="{name}"}} {value}')
+        lines += [f"# HELP {prefix}_run_seconds Wall time of the last run.",
+                  f"# TYPE {prefix}_run_seconds gauge",
+                  f"{prefix}_run_seconds {summary['wall_seconds']}",
+                  f"# HELP {prefix}_run_timestamp_seconds Start time of the last run.",
+                  f"# TYPE {prefix}_run_timestamp_seconds gauge",
+                  f"{prefix}_run_timestamp_seconds {summary['started']:.0f}"]
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
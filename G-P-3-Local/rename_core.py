@@ -0,0 +1,476 @@
+"""
+发票重命名核心逻辑，不依赖 tkinter。
+界面（rename_function.py）和命令行（cli.py）共用这里的提取与重命名流程。
+"""
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_cache import ExtractCache, file_hash
+from file_walk import FileEntry, walk_files
+from invoice_index import INDEX_FIELDS, InvoiceIndex
+from metrics import RunMetrics
+from pipeline import Stage, run_pipeline
+from rename_journal import RenameJournal
+
+# extract_fields_from_text 支持的字段
+FIELD_KEYS = [
+    "发票号码", "开票日期", "购方名称", "购方税号", "销方名称", "销方税号",
+    "合计", "总税额", "价税合计", "价税合计大写", "开票人",
+]
+
+# 默认并行进程数：pdf 文本提取是纯 Python 的 CPU 密集任务，按核数开进程
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# 流水线中计算内容哈希、查缓存（磁盘 I/O）的线程数
+IO_WORKERS = 4
+
+# 每个 PDF 默认最多读取的页数，发票抬头字段都在第 1 页，后面多是明细附件
+DEFAULT_MAX_PAGES = 5
+
+# 字段解析规则的版本，修改 extract_fields_from_text 后递增，使旧的缓存结果失效
+EXTRACTOR_VERSION = "2"
+
+
+def get_backup_dir(pdf_dir):
+    parent_dir = os.path.dirname(pdf_dir.rstrip(os.sep))
+    base_bak_dir = os.path.join(parent_dir, 'rename')
+
+    # 生成随机后缀，取uuid的前8位，确保唯一
+    random_suffix = uuid.uuid4().hex[:8]
+
+    bak_dir = base_bak_dir + "_" + random_suffix
+
+    # 如果刚好存在（概率极低），循环生成新的
+    while os.path.abspath(bak_dir) == os.path.abspath(pdf_dir) or os.path.exists(bak_dir):
+        random_suffix = uuid.uuid4().hex[:8]
+        bak_dir = base_bak_dir + "_" + random_suffix
+
+    os.makedirs(bak_dir, exist_ok=True)
+    return bak_dir
+
+def sanitize_filename(name):
+    # 替换Windows文件名非法字符为下划线
+    return re.sub(r'[\\/:*?"<>|]', '_', name)
+
+
+def extract_projects(text):
+    # 先定位“项目名称”后面跟的项目数据起始位置
+    # 这里假设“项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额”是表头
+    table_header_pattern = r"项目名称\s*规格型号\s*单\s*位\s*数\s*量\s*单\s*价\s*金\s*额\s*税率/征收率\s*税\s*额"
+
+    header_match = re.search(table_header_pattern, text)
+    if not header_match:
+        return []  # 找不到表头，返回空列表
+
+    start_pos = header_match.end()  # 表头结束位置
+    # 截取表头之后的文本，假设项目行以换行或“合计”之类结束
+    project_text = text[start_pos:]
+    # 一般项目以“合计”开始或者“价税合计”开始结束
+    end_match = re.search(r"合\s*计|价税合计", project_text)
+    end_pos = end_match.start() if end_match else len(project_text)
+    project_text = project_text[:end_pos]
+
+    # 定义项目行的正则，按字段顺序捕获，假设字段间空格或星号分隔
+    # 这里示范一条项目行匹配：项目名称、规格型号、单位、数量、单价、金额、税率、税额
+    # 注意项目名称可能包含空格和星号，我们用非贪婪匹配
+    project_line_pattern = re.compile(
+        r"(\*?.*?\*?)\s+"      # 项目名称，可能带*号
+        r"(\S*?)\s+"           # 规格型号，允许为空
+        r"(\S+)\s+"            # 单位
+        r"([\d\.]+)\s+"        # 数量
+        r"([\d\.]+)\s+"        # 单价
+        r"([\d\.]+)\s+"        # 金额
+        r"([\d\*%]+)\s+"       # 税率或征收率，允许*或%
+        r"([\d\*\.]+)"         # 税额，允许*或数字
+    )
+
+    projects = []
+    for match in project_line_pattern.finditer(project_text):
+        project = {
+            "项目名称": match.group(1).strip(),
+            "规格型号": match.group(2).strip(),
+            "单位": match.group(3).strip(),
+            "数量": match.group(4).strip(),
+            "单价": match.group(5).strip(),
+            "金额": match.group(6).strip(),
+            "税率": match.group(7).strip(),
+            "税额": match.group(8).strip(),
+        }
+        projects.append(project)
+
+    return projects
+
+
+# 超长文本只解析前面这部分，限制病态输入下的最坏耗时（发票抬头字段都在前几千字内）
+MAX_TEXT_CHARS = 50000
+
+# 字段规则表，导入时编译一次：规则名 -> (正则, 先用 in 快速判断的锚点文字, 是否 findall)
+# 原先的 .* / .*? 都改成了有上限的 .{0,N}?，避免找不到时在整篇文本上回溯
+_RULES = {
+    # 统一提取所有“统一社会信用代码/纳税人识别号”后的号码（按顺序），第一个是购方，第二个是销方
+    "tax_id": (re.compile(r"统一社会信用代码/纳税人识别号[：:]\s*(\w+)"), "纳税人识别号", True),
+    # 购方名称 + 销方名称 （一行内）
+    "party_name": (re.compile(r"购\s*名称[：:]\s*(.{0,200}?)\s+销\s*名称[：:]\s*(.{0,200}?)\s"), "名称", False),
+    "invoice_number": (re.compile(r"发票号码[：:]\s*(\w+)"), "发票号码", False),
+    "issue_date": (re.compile(r"开票日期[：:]\s*([\d年月日\-]+)"), "开票日期", False),
+    "total_amount": (re.compile(r"合\s*计\s*¥?([\d\.]+)"), "计", False),
+    # 合计行后紧跟的两个金额，第二个是总税额
+    "total_tax": (re.compile(r"合\s*计.{0,100}?¥?([\d\.]+)\s*\*?\s*¥?([\d\.]+)"), "计", False),
+    "total_with_tax": (re.compile(r"价税合计.{0,200}?（小写）¥([\d\.]+)"), "（小写）", False),
+    "total_with_tax_words": (re.compile(r"价税合计（大写）\s*(\S+)"), "价税合计（大写）", False),
+    "preparer": (re.compile(r"开票人[:：]\s*(\S+)"), "开票人", False),
+}
+
+
+def _group(n):
+    return lambda m: m.group(n).strip() if m else ""
+
+
+def _nth(n):
+    return lambda found: found[n] if len(found) > n else ""
+
+
+# 字段 -> (规则名, 从匹配结果取值的函数)，共用一条规则的字段只匹配一次
+FIELD_SPECS = {
+    "购方税号": ("tax_id", _nth(0)),
+    "销方税号": ("tax_id", _nth(1)),
+    "购方名称": ("party_name", _group(1)),
+    "销方名称": ("party_name", _group(2)),
+    "发票号码": ("invoice_number", _group(1)),
+    "开票日期": ("issue_date", _group(1)),
+    "合计": ("total_amount", _group(1)),
+    "总税额": ("total_tax", _group(2)),
+    "价税合计": ("total_with_tax", _group(1)),
+    "价税合计大写": ("total_with_tax_words", _group(1)),
+    "开票人": ("preparer", _group(1)),
+}
+
+
+def extract_fields_from_text(text, fields):
+    """
+    按 FIELD_SPECS 只解析 fields 里选中的字段，返回 {字段: 值}，找不到的字段值为空字符串。
+    """
+    # 合并多余空白，比 re.sub(r'\s+', ' ', text) 快
+    text = " ".join(text[:MAX_TEXT_CHARS].split())
+
+    matched = {}
+    results = {}
+    for key in fields:
+        spec = FIELD_SPECS.get(key)
+        if spec is None:
+            continue
+        rule_name, getter = spec
+        if rule_name not in matched:
+            pattern, anchor, find_all = _RULES[rule_name]
+            if anchor not in text:
+                matched[rule_name] = [] if find_all else None
+            elif find_all:
+                matched[rule_name] = pattern.findall(text)
+            else:
+                matched[rule_name] = pattern.search(text)
+        results[key] = getter(matched[rule_name])
+    return results
+
+
+def read_pdf_text(file_path, fields=None, max_pages=DEFAULT_MAX_PAGES, timings=None):
+    """
+    逐页提取 PDF 文本，打不开时抛出异常。
+
+    :param fields: 传入时每读完一页就解析一次，选中的字段都找到后不再读后面的页。
+    :param max_pages: 最多读取的页数，None 或 0 表示不限制。
+    :param timings: 传入字典时写入打开文件（pdf_open）和提取文本（pdf_text）的耗时（秒）。
+    """
+    import pdfplumber  # 导入较慢，第一次解析 PDF 时再导入，配置窗口可以立即弹出
+
+    page_numbers = range(1, max_pages + 1) if max_pages else None
+    parts = []
+    start = time.perf_counter()
+    with pdfplumber.open(file_path, pages=page_numbers) as pdf:
+        opened = time.perf_counter()
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            page.close()  # 释放这一页解析出的对象，长附件不会越读越占内存
+            if not page_text:
+                continue
+            parts.append(page_text)
+            if fields and all(extract_fields_from_text("\n".join(parts), fields).values()):
+                break
+    if timings is not None:
+        timings["pdf_open"] = opened - start
+        timings["pdf_text"] = time.perf_counter() - opened
+    return "".join(part + "\n" for part in parts)
+
+
+def extract_file(file_path, fields, max_pages=DEFAULT_MAX_PAGES):
+    """
+    读取单个 PDF 并解析字段，可在子进程中执行（不写日志、不抛异常）。
+    先读第 1 页，字段不全时才继续读后面的页，最多读 max_pages 页。
+
+    :return: (field_values, error, timings)，打开失败时 field_values 为 None，error 为错误信息；
+             timings 为各步骤耗时（秒）：pdf_open / pdf_text / parse。
+    """
+    timings = {}
+    try:
+        full_text = read_pdf_text(file_path, fields, max_pages, timings)
+    except Exception as e:
+        return None, f"打开PDF失败: {e}", timings
+    start = time.perf_counter()
+    field_values = extract_fields_from_text(full_text, fields)
+    timings["parse"] = time.perf_counter() - start
+    return field_values, None, timings
+
+
+def backup_file(entry, bak_dir, flatten=False):
+    """
+    把一个文件复制到 bak_dir 中，返回副本路径。默认保持相对 pdf_dir 的子文件夹结构，
+    flatten 时都放在 bak_dir 顶层，与已有文件重名时加序号。
+    """
+    if flatten:
+        name = os.path.basename(entry.path)
+        base, ext = os.path.splitext(name)
+        dst = os.path.join(bak_dir, name)
+        n = 1
+        while os.path.exists(dst):
+            dst = os.path.join(bak_dir, f"{base}_{n}{ext}")
+            n += 1
+    else:
+        dst = os.path.join(bak_dir, *entry.rel_path.split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copy2(entry.path, dst)
+    return dst
+
+
+def process_folder(pdf_dir, fields, split, workers=1, cache_path=None, max_pages=DEFAULT_MAX_PAGES,
+                   in_place=False, index_path=None, metrics=None, filenames=None,
+                   recursive=False, include=None, exclude=None, flatten=False, log=print):
+    """
+    把 pdf_dir 中的 PDF 复制到备份目录后在备份目录中重命名（in_place 时直接在 pdf_dir 中重命名）。
+
+    处理过程是一条流水线：扫描 → 计算内容哈希/查缓存（IO_WORKERS 个线程）→ 读取 PDF 并解析字段
+    （workers 个进程）→ 重命名（当前线程串行执行，保证冲突判断正确），各阶段之间用有界队列连接。
+
+    :param workers: 提取文本和解析字段的进程数。
+    :param cache_path: 提取结果缓存（SQLite）路径，None 表示不使用缓存。
+    :param max_pages: 每个 PDF 最多读取的页数，选中的字段在前面的页找全后就不再往后读。
+    :param in_place: 不复制备份目录，直接在 pdf_dir 中重命名，并写入 rename_journal 日志，可用 undo 回滚。
+    :param index_path: 发票台账（SQLite）路径，None 表示不写台账。写台账时会额外提取 INDEX_FIELDS，
+                       内容不同但发票号码相同的文件在结果的 duplicate_of 中给出已有文件的路径。
+    :param metrics: RunMetrics，记录各步骤耗时和结果计数，不传时新建一个；运行结束时把各步骤的 p50/p95/p99 写进日志。
+    :param filenames: 只处理 pdf_dir 中的这些文件（watch 模式每次只处理新到的文件），None 表示全部。
+    :param recursive: 包含子文件夹（如按 年/月/部门 分文件夹存放的归档），边遍历边处理，不先列出整棵目录树。
+    :param include: 通配符列表，只处理匹配的文件，如 ["*.pdf"]；exclude：跳过匹配的文件和子文件夹（见 file_walk）。
+    :param flatten: 子文件夹中的文件重命名后都放到输出目录（备份目录，in_place 时为 pdf_dir）的顶层；
+                    默认保持原来的子文件夹结构，在各自的子文件夹中重命名。
+    :param log: 接收一行状态文本的回调，界面传入 UiLog，命令行传入写 stderr 的函数。
+    :return: 生成器，每处理完一个 PDF 产出一个结果字典（按处理完成的顺序）：
+             {"file", "status", "new_name", "fields", "error", "source", "duplicate_of"}，
+             status 取值 renamed / skipped / conflict / failed，source 取值 extract / cache / duplicate。
+    """
+    log(f"开始处理目录：{pdf_dir}\n")
+    metrics = metrics or RunMetrics()
+
+    journal = None
+    if in_place:
+        bak_dir = pdf_dir
+        journal = RenameJournal(pdf_dir)
+        log(f"原地重命名，日志编号：{journal.run_id}\n")
+    else:
+        bak_dir = get_backup_dir(pdf_dir)
+        log(f"备份目录为：{bak_dir}\n")
+
+    cache = ExtractCache(cache_path) if cache_path else None
+    index = InvoiceIndex(index_path) if index_path else None
+    # 写台账时命名字段之外再提取台账需要的字段
+    extract_fields = fields + [k for k in INDEX_FIELDS if k not in fields] if index is not None else fields
+    backend = f"local:{EXTRACTOR_VERSION}"
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    seen = set()
+    seen_lock = threading.Lock()
+
+    backed_up = 0
+
+    def scan():
+        # 边遍历边备份、边交给后面的步骤，不先列出整个目录；walk_files 每次读完一个目录的清单才产出，
+        # 重命名过程中目录内容会变，也不会读到改名后的文件
+        nonlocal backed_up
+        if filenames is not None:
+            entries = (FileEntry(os.path.join(pdf_dir, f), f, None, None) for f in filenames)
+        else:
+            entries = walk_files(pdf_dir, recursive, include, exclude)
+        for entry in entries:
+            if not entry.path.lower().endswith('.pdf'):
+                continue
+            if in_place:
+                file_path = entry.path
+            else:
+                file_path = backup_file(entry, bak_dir, flatten)
+                backed_up += 1
+            yield {"filename": entry.rel_path, "file_path": file_path,
+                   "out_dir": bak_dir if flatten else os.path.dirname(file_path), "hash": None,
+                   "values": None, "error": None, "source": "extract", "stored": {}, "start": time.perf_counter()}
+
+    def lookup(item):
+        if cache is None and index is None:
+            return item
+        with metrics.time("hash", item["file_path"]):
+            h = item["hash"] = file_hash(item["file_path"])
+        with seen_lock:
+            if h in seen:
+                item["source"] = "duplicate"
+                return item
+            seen.add(h)
+        if cache is None:
+            return item
+        with metrics.time("cache", item["file_path"]):
+            values = cache.get(h, backend)
+        if values is not None and all(k in values for k in extract_fields):
+            item["values"] = values
+            item["source"] = "cache"
+        else:
+            item["stored"] = values or {}
+        return item
+
+    def per_file(step, func):
+        # 单个文件在某一步出错（文件读不了、解析进程崩溃等）只把这个文件记为失败，
+        # 其余文件继续处理；流水线本身的错误仍由 run_pipeline 抛出
+        def run(item):
+            try:
+                return func(item)
+            except Exception as e:
+                metrics.count(f"{step}_error")
+                item["values"], item["error"] = None, f"{step}失败: {e}"
+                return item
+        return run
+
+    def extract(item):
+        if item["source"] != "extract" or item["error"] is not None:
+            return item
+        if executor is not None:
+            future = executor.submit(extract_file, item["file_path"], extract_fields, max_pages)
+            item["values"], item["error"], timings = future.result()
+        else:
+            item["values"], item["error"], timings = extract_file(item["file_path"], extract_fields, max_pages)
+        for stage, seconds in timings.items():
+            metrics.add(stage, seconds, item["file_path"])
+        if item["error"]:
+            metrics.count("pdf_error")
+        return item
+
+    def finish(item):
+        result = _rename_item(item["out_dir"], item, fields, split, journal, metrics, log)
+        if index is not None:
+            with metrics.time("index", item["file_path"]):
+                result = _index_result(index, item, result, log)
+        metrics.count(f"status_{result['status']}")
+        metrics.count("invoice_duplicate", result["duplicate_of"] is not None)
+        metrics.count(f"source_{result['source']}")
+        metrics.add("total", time.perf_counter() - item["start"], item["file_path"],
+                    "error" if result["status"] == "failed" else "ok")
+        return result
+
+    stages = [Stage("lookup", per_file("读取文件", lookup), workers=IO_WORKERS),
+              Stage("extract", per_file("解析PDF", extract), workers=workers)]
+    memo = {}       # 内容哈希 -> (字段, error)，供后面内容相同的文件复用
+    waiting = {}    # 内容哈希 -> 先于原文件到达的重复文件
+    try:
+        for item in run_pipeline(scan(), stages):
+            h = item["hash"]
+            if item["source"] == "duplicate":
+                if h not in memo:
+                    waiting.setdefault(h, []).append(item)
+                    continue
+                item["values"], item["error"] = memo[h]
+            elif h is not None:
+                if cache is not None and item["source"] == "extract" and item["error"] is None:
+                    # 与缓存中已有的字段合并，换一个命名模板时也能继续复用
+                    merged = dict(item.pop("stored"))
+                    merged.update({k: item["values"].get(k, "") for k in extract_fields})
+                    cache.put(h, backend, merged)
+                memo[h] = (item["values"], item["error"])
+            yield finish(item)
+            for duplicate in waiting.pop(h, []):
+                duplicate["values"], duplicate["error"] = memo[h]
+                yield finish(duplicate)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if index is not None:
+            index.close()
+        if not in_place:
+            log(f"\n已备份{backed_up}个PDF文件到：{bak_dir}\n")
+        metrics.finish()
+        log(metrics.report())
+
+
+def _index_result(index, item, result, log):
+    """把提取结果写进发票台账，是已有发票的另一个文件时填上 duplicate_of。"""
+    if index is None or item["values"] is None or item["source"] == "duplicate":
+        return result
+    path = result["file"]
+    if result["new_name"] and not os.path.exists(path):
+        path = os.path.join(item["out_dir"], result["new_name"])
+    result["duplicate_of"] = index.record(item["hash"], item["values"], path)
+    if result["duplicate_of"]:
+        log(f"与已处理过的发票重复（发票号码 {item['values'].get('发票号码')}）：{result['duplicate_of']}\n")
+    return result
+
+
+def _rename_item(out_dir, item, fields, split, journal, metrics, log):
+    filename, file_path, source, error = item["filename"], item["file_path"], item["source"], item["error"]
+    log(f"\n处理文件：{filename}\n")
+    result = {"file": file_path, "status": "failed", "new_name": None, "fields": None, "error": None,
+              "source": source, "duplicate_of": None}
+    if source == "cache":
+        log("命中缓存，跳过解析\n")
+    elif source == "duplicate":
+        log("与前面的文件内容相同，复用解析结果\n")
+
+    if error:
+        log(error + "\n")
+        result["error"] = error
+        return result
+
+    field_values = {k: v for k, v in item["values"].items() if k in fields}
+    result["fields"] = field_values
+
+    if not any(field_values.values()):
+        log("未提取到有效字段，跳过重命名\n")
+        result["status"] = "skipped"
+        return result
+
+    parts = []
+    for key in fields:
+        val = field_values.get(key, "")
+        parts.append(val)
+    new_name_base = split.join(parts)
+
+    new_name = sanitize_filename(new_name_base) + ".pdf"
+    new_path = os.path.join(out_dir, new_name)
+    result["new_name"] = new_name
+
+    if os.path.exists(new_path):
+        log(f"文件名冲突，跳过: {new_name}\n")
+        result["status"] = "conflict"
+        return result
+
+    try:
+        with metrics.time("rename", file_path):
+            if journal is not None:
+                journal.rename(file_path, new_path, content_hash=item["hash"])
+            else:
+                os.rename(file_path, new_path)
+        log(f"重命名成功: {filename} -> {new_name}\n")
+        result["status"] = "renamed"
+    except Exception as e:
+        log(f"重命名失败: {e}\n")
+        result["error"] = f"重命名失败: {e}"
+    return result
@@ -0,0 +1,156 @@
+"""
+原地重命名日志：不复制备份目录，而是在目标文件夹里追加写一份重命名日志，
+需要回滚时按日志倒序把文件名改回去。
+
+日志文件为目标文件夹下的 .rename_journal.jsonl，每行一条 JSON 记录：
+    {"op": "rename", "id": ..., "run": ..., "old": 原文件名, "new": 新文件名, "hash": 内容sha256, "time": ...}
+    {"op": "commit", "id": ...}   重命名成功
+    {"op": "abort", "id": ...}    重命名失败，文件未改动
+    {"op": "undo", "id": ...}     已回滚
+rename 记录在真正改名之前写入并落盘，程序中途崩溃时 undo 也能根据磁盘上的实际文件判断是否需要回滚。
+"""
+import json
+import os
+import time
+import uuid
+
+from extract_cache import file_hash
+
+JOURNAL_FILENAME = ".rename_journal.jsonl"
+
+
+def journal_path(folder):
+    return os.path.join(folder, JOURNAL_FILENAME)
+
+
+class RenameJournal:
+    """
+    在 folder 中按日志执行重命名。
+
+    用法：
+        with RenameJournal(folder) as journal:
+            journal.rename(old_path, new_path)
+    """
+
+    def __init__(self, folder, run_id=None):
+        self.folder = folder
+        self.run_id = run_id or time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.seq = 0
+        self.f = open(journal_path(folder), "a", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, record, sync=False):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+
+    def rename(self, old_path, new_path, content_hash=None):
+        """
+        先写日志再改名。目标已存在时抛出 FileExistsError，不会覆盖已有文件。
+        """
+        if os.path.exists(new_path):
+            raise FileExistsError(f"目标文件已存在: {os.path.basename(new_path)}")
+        self.seq += 1
+        record_id = f"{self.run_id}:{self.seq}"
+        self._write({
+            "op": "rename", "id": record_id, "run": self.run_id,
+            "old": os.path.relpath(old_path, self.folder), "new": os.path.relpath(new_path, self.folder),
+            "hash": content_hash or file_hash(old_path), "time": time.time(),
+        }, sync=True)
+        try:
+            # 同一文件系统内 os.rename 是原子操作
+            os.rename(old_path, new_path)
+        except Exception:
+            self._write({"op": "abort", "id": record_id})
+            raise
+        self._write({"op": "commit", "id": record_id})
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def read_journal(folder):
+    """读取日志，返回 (rename 记录列表, {id: 最终状态})，状态为 pending / commit / abort / undo。"""
+    path = journal_path(folder)
+    renames, status = [], {}
+    if not os.path.exists(path):
+        return renames, status
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 崩溃时可能留下写了一半的最后一行
+            if record["op"] == "rename":
+                renames.append(record)
+                status[record["id"]] = "pending"
+            elif record["id"] in status:
+                status[record["id"]] = record["op"]
+    return renames, status
+
+
+def list_runs(folder):
+    """按时间顺序返回 [(run_id, 未回滚的重命名条数)]。"""
+    renames, status = read_journal(folder)
+    runs = {}
+    for record in renames:
+        count = runs.setdefault(record["run"], 0)
+        runs[record["run"]] = count + (status[record["id"]] in ("pending", "commit"))
+    return list(runs.items())
+
+
+def undo(folder, run_id=None, verify=True, index=None, log=print):
+    """
+    按日志倒序把文件名改回去。
+
+    :param run_id: 只回滚这一次运行，None 表示回滚最近一次仍有未回滚记录的运行，"all" 表示全部。
+    :param verify: 改回前校验内容哈希，文件内容已被修改时跳过。
+    :param index: InvoiceIndex，传入时把台账里记的新文件名一并改回原文件名。
+    :return: (已回滚数, 跳过数)
+    """
+    renames, status = read_journal(folder)
+    if run_id is None:
+        runs = [run for run, count in list_runs(folder) if count]
+        if not runs:
+            return 0, 0
+        run_id = runs[-1]
+    targets = [r for r in renames if run_id == "all" or r["run"] == run_id]
+
+    restored = skipped = 0
+    with open(journal_path(folder), "a", encoding="utf-8") as f:
+        for record in reversed(targets):
+            if status[record["id"]] not in ("pending", "commit"):
+                continue
+            old_path = os.path.join(folder, record["old"])
+            new_path = os.path.join(folder, record["new"])
+            if status[record["id"]] == "pending" and os.path.exists(old_path) and not os.path.exists(new_path):
+                # 写了日志但没来得及改名
+                f.write(json.dumps({"op": "abort", "id": record["id"]}) + "\n")
+                continue
+            if not os.path.exists(new_path) or os.path.exists(old_path):
+                log(f"无法回滚（文件已被移动或原文件名被占用）: {record['new']} -> {record['old']}\n")
+                skipped += 1
+                continue
+            if verify and record.get("hash") and file_hash(new_path) != record["hash"]:
+                log(f"文件内容已变化，跳过回滚: {record['new']}\n")
+                skipped += 1
+                continue
+            os.rename(new_path, old_path)
+            f.write(json.dumps({"op": "undo", "id": record["id"]}) + "\n")
+            f.flush()
+            if index is not None:
+                index.move(new_path, old_path)
+            log(f"已回滚: {record['new']} -> {record['old']}\n")
+            restored += 1
+    return restored, skipped
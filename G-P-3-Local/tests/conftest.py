@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# 程序的模块都在上一级目录，直接 import；合成发票用 benchmarks/invoice_gen.py 生成
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(os.path.dirname(ROOT), "benchmarks"))
+
+
+@pytest.fixture
+def invoices(tmp_path):
+    """生成 3 张带文本层的发票，返回 (目录, [(路径, 字段)])。"""
+    import invoice_gen
+    folder = str(tmp_path / "pdfs")
+    files = invoice_gen.generate(folder, 3)
+    os.remove(os.path.join(folder, "truth.jsonl"))
+    return folder, [(path, fields) for path, kind, fields in files]
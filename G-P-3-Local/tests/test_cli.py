@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+
+import cli
+
+FIELDS = "销方名称,开票日期,合计"
+
+
+def rename(folder, *extra):
+    return cli.main(["rename", folder, "--fields", FIELDS, "--in-place", "--no-cache", "--workers", "1", *extra])
+
+
+def test_all_renamed_exits_ok(invoices, capsys):
+    folder, files = invoices
+    assert rename(folder) == cli.EXIT_OK
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["status"] for r in lines] == ["renamed"] * 3
+
+
+def test_conflict_is_skipped_and_exits_partial(invoices, capsys):
+    folder, files = invoices
+    # 同一张发票的另一个文件，字段相同，新文件名冲突
+    copy = os.path.join(folder, "copy.pdf")
+    shutil.copy(files[0][0], copy)
+    assert rename(folder) == cli.EXIT_PARTIAL
+
+    results = {os.path.basename(r["file"]): r
+               for r in map(json.loads, capsys.readouterr().out.splitlines())}
+    statuses = sorted(r["status"] for r in results.values())
+    assert statuses == ["conflict", "renamed", "renamed", "renamed"]
+    conflict = next(r for r in results.values() if r["status"] == "conflict")
+    # 冲突的文件不改名，已有的文件不被覆盖
+    assert os.path.exists(conflict["file"])
+    assert os.path.exists(os.path.join(folder, conflict["new_name"]))
+
+
+def test_unparsable_file_exits_partial(invoices, capsys):
+    folder, files = invoices
+    with open(os.path.join(folder, "broken.pdf"), "wb") as f:
+        f.write(b"not a pdf")
+    assert rename(folder) == cli.EXIT_PARTIAL
+    statuses = sorted(json.loads(line)["status"] for line in capsys.readouterr().out.splitlines())
+    assert statuses == ["failed", "renamed", "renamed", "renamed"]
+
+
+def test_missing_folder_exits_usage(tmp_path, capsys):
+    assert rename(str(tmp_path / "missing")) == cli.EXIT_USAGE
+
+
+def test_undo_exit_codes(invoices, capsys):
+    folder, files = invoices
+    assert rename(folder) == cli.EXIT_OK
+    assert cli.main(["undo", folder]) == cli.EXIT_OK
+    restored = sorted(name for name in os.listdir(folder) if not name.startswith("."))
+    assert restored == sorted(os.path.basename(path) for path, _ in files)
+    assert cli.main(["undo", str(os.path.join(folder, "missing"))]) == cli.EXIT_USAGE
@@ -0,0 +1,45 @@
+import sqlite3
+
+import extract_cache
+from extract_cache import ExtractCache
+
+
+def test_get_commits_last_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ExtractCache(path)
+    cache.put("h1", "local:2", {"销方名称": "某公司"})
+    cache.conn.execute("UPDATE extraction SET last_used = 0")
+    cache.conn.commit()
+    assert cache.get("h1", "local:2") == {"销方名称": "某公司"}
+
+    # 不经过 close()，另一个连接也能看到更新后的使用时间
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT last_used FROM extraction").fetchone()[0] > 0
+    other.close()
+    cache.close()
+
+
+def test_evicts_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_cache, "EVICT_EVERY", 5)
+    cache = ExtractCache(str(tmp_path / "cache.sqlite3"), max_bytes=200)
+    for i in range(20):
+        cache.put(f"h{i}", "local:2", {"销方名称": "某公司" * 5})
+    assert cache.stats()["bytes"] <= 200
+    # 最近写入的还在，最早的已被淘汰
+    assert cache.get("h19", "local:2") is not None
+    assert cache.get("h0", "local:2") is None
+    cache.close()
+
+
+def test_invalidate_backend_prefix_is_literal(tmp_path):
+    with ExtractCache(str(tmp_path / "cache.sqlite3")) as cache:
+        cache.put("h1", "ai:gpt-4o:2", {})
+        cache.put("h1", "ai:gpt_4o:2", {})
+        cache.put("h1", "aix:2", {})
+        cache.put("h1", "local:2", {})
+
+        assert cache.invalidate(backend="ai:gpt_4o") == 1
+        assert cache.invalidate(backend="ai") == 1
+        assert cache.invalidate(backend="%") == 0
+        assert sorted(cache.stats()["backends"]) == ["aix:2", "local:2"]
+        assert cache.invalidate(backend="local:2") == 1
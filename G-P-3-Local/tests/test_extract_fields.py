@@ -0,0 +1,46 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "benchmarks"))
+
+from bench_extract_fields import SAMPLE_TEXT, legacy_extract_fields_from_text  # noqa: E402
+from invoice_gen import invoice_lines, random_invoice  # noqa: E402
+from rename_core import FIELD_KEYS, extract_fields_from_text  # noqa: E402
+
+FIELD_SETS = [FIELD_KEYS, ["销方名称", "开票日期", "合计"], ["发票号码"], ["总税额", "价税合计大写"], ["购方税号", "开票人"]]
+
+
+def assert_same(text, fields):
+    # 改造前没匹配到的字段有的不返回，改造后统一返回空字符串
+    legacy = legacy_extract_fields_from_text(text, fields)
+    assert extract_fields_from_text(text, fields) == {key: legacy.get(key, "") for key in fields}
+
+
+@pytest.mark.parametrize("fields", FIELD_SETS)
+def test_sample_invoice(fields):
+    assert_same(SAMPLE_TEXT, fields)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_generated_invoices(seed):
+    rng = random.Random(seed)
+    text = "\n".join(invoice_lines(random_invoice(rng, seed)))
+    for fields in FIELD_SETS:
+        assert_same(text, fields)
+
+
+@pytest.mark.parametrize("drop", range(14))
+def test_missing_lines(drop):
+    # 缺一行（扫描不全、版式不同）时两者也要一致
+    lines = SAMPLE_TEXT.splitlines()
+    text = "\n".join(lines[:drop] + lines[drop + 1:])
+    for fields in FIELD_SETS:
+        assert_same(text, fields)
+
+
+def test_empty_text():
+    assert extract_fields_from_text("", FIELD_KEYS) == {key: "" for key in FIELD_KEYS}
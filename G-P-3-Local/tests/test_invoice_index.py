@@ -0,0 +1,61 @@
+import os
+import sqlite3
+
+import pytest
+
+import cli
+from invoice_index import InvoiceIndex
+from rename_journal import RenameJournal, undo
+
+FIELDS = {"发票号码": "25117000002480760350", "开票日期": "2025年07月15日", "销方名称": "某公司",
+          "销方税号": "91420100MA4K2Y3B0X", "价税合计": "100.00"}
+
+
+def test_undo_moves_index_paths_back(tmp_path):
+    folder = str(tmp_path / "pdfs")
+    os.mkdir(folder)
+    old_path = os.path.join(folder, "a.pdf")
+    new_path = os.path.join(folder, "某公司.pdf")
+    with open(old_path, "wb") as f:
+        f.write(b"a")
+    with RenameJournal(folder) as journal:
+        journal.rename(old_path, new_path, content_hash="h1")
+
+    with InvoiceIndex(str(tmp_path / "index.sqlite3")) as index:
+        index.record("h1", FIELDS, new_path)
+        assert undo(folder, verify=False, index=index, log=lambda msg: None) == (1, 0)
+        assert index.query(invoice_number=FIELDS["发票号码"])[0]["files"] == [os.path.abspath(old_path)]
+
+
+def test_cli_undo_updates_index(tmp_path, capsys):
+    folder = str(tmp_path)
+    old_path = os.path.join(folder, "a.pdf")
+    new_path = os.path.join(folder, "某公司.pdf")
+    with open(old_path, "wb") as f:
+        f.write(b"a")
+    with RenameJournal(folder) as journal:
+        journal.rename(old_path, new_path)
+    index_path = str(tmp_path / "index.sqlite3")
+    with InvoiceIndex(index_path) as index:
+        index.record("h1", FIELDS, new_path)
+
+    assert cli.main(["undo", folder, "--index-path", index_path]) == cli.EXIT_OK
+    with InvoiceIndex(index_path, read_only=True) as index:
+        assert index.query()[0]["files"] == [os.path.abspath(old_path)]
+
+
+def test_stats_does_not_create_index(tmp_path, capsys):
+    index_path = str(tmp_path / "index.sqlite3")
+    assert cli.main(["index", "stats", "--index", index_path]) == cli.EXIT_USAGE
+    assert not os.path.exists(index_path)
+
+
+def test_read_only_index(tmp_path):
+    index_path = str(tmp_path / "index.sqlite3")
+    with pytest.raises(sqlite3.Error):
+        InvoiceIndex(index_path, read_only=True)
+    assert not os.path.exists(index_path)
+    with InvoiceIndex(index_path) as index:
+        index.record("h1", FIELDS, str(tmp_path / "a.pdf"))
+    with InvoiceIndex(index_path, read_only=True) as index:
+        assert index.stats()["invoices"] == 1
@@ -0,0 +1,34 @@
+import os
+
+from extract_cache import file_hash
+from rename_core import process_folder
+from rename_journal import list_runs, read_journal, undo
+
+FIELDS = ["销方名称", "开票日期", "合计"]
+
+
+def test_in_place_rename_and_undo(invoices):
+    folder, files = invoices
+    originals = sorted(os.listdir(folder))
+    hashes = {os.path.basename(path): file_hash(path) for path, _ in files}
+
+    results = list(process_folder(folder, FIELDS, "_", in_place=True, log=lambda msg: None))
+    assert [r["status"] for r in results] == ["renamed"] * 3
+    for path, fields in files:
+        assert os.path.exists(os.path.join(folder, "_".join(fields[k] for k in FIELDS) + ".pdf"))
+    # 日志里记的是流水线算好的内容哈希
+    renames, status = read_journal(folder)
+    assert {r["old"]: r["hash"] for r in renames} == hashes
+    assert set(status.values()) == {"commit"}
+    assert [count for _, count in list_runs(folder)] == [3]
+
+    assert undo(folder, log=lambda msg: None) == (3, 0)
+    assert sorted(name for name in os.listdir(folder) if not name.startswith(".")) == originals
+
+
+def test_backup_mode_leaves_source_untouched(invoices):
+    folder, files = invoices
+    originals = sorted(os.listdir(folder))
+    results = list(process_folder(folder, FIELDS, "_", log=lambda msg: None))
+    assert [r["status"] for r in results] == ["renamed"] * 3
+    assert sorted(os.listdir(folder)) == originals
@@ -0,0 +1,75 @@
+import os
+import threading
+
+import pytest
+
+from watch_folder import WatchState, watch_folder
+
+
+def make_pdf(folder, name):
+    with open(os.path.join(folder, name), "wb") as f:
+        f.write(b"%PDF-1.4\n" + name.encode() + b"\n%%EOF\n")
+
+
+def rename_batch(folder, calls):
+    """模拟 process_folder：把每个文件改名为 new_<原名>。"""
+    def process_batch(filenames):
+        calls.extend(filenames)
+        for name in filenames:
+            new_name = "new_" + name
+            os.rename(os.path.join(folder, name), os.path.join(folder, new_name))
+            yield {"file": os.path.join(folder, name), "status": "renamed", "new_name": new_name}
+    return process_batch
+
+
+def run(folder, process_batch, state, stop_after):
+    stop = threading.Event()
+    results = []
+    for result in watch_folder(folder, process_batch, state, settle=0, poll_interval=0.01, use_events=False,
+                               include_existing=True, stop=stop, log=lambda msg: None):
+        results.append(result)
+        if len(results) >= stop_after:
+            stop.set()
+    return results
+
+
+def test_restart_after_interrupt_does_not_reprocess(tmp_path):
+    folder = str(tmp_path / "inbox")
+    os.mkdir(folder)
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        make_pdf(folder, name)
+    state_path = str(tmp_path / "state.sqlite3")
+
+    calls = []
+    with WatchState(state_path) as state:
+        results = watch_folder(folder, rename_batch(folder, calls), state, settle=0, poll_interval=0.01,
+                               use_events=False, include_existing=True, log=lambda msg: None)
+        next(results)
+        # 相当于处理完第一个文件后按了 Ctrl+C
+        with pytest.raises(KeyboardInterrupt):
+            results.throw(KeyboardInterrupt)
+    assert sorted(os.listdir(folder)) == ["b.pdf", "c.pdf", "new_a.pdf"]
+
+    calls.clear()
+    with WatchState(state_path) as state:
+        results = run(folder, rename_batch(folder, calls), state, stop_after=2)
+    assert sorted(calls) == ["b.pdf", "c.pdf"]
+    assert [r["new_name"] for r in results] == ["new_b.pdf", "new_c.pdf"]
+
+
+def test_unsupported_files_marked_after_batch(tmp_path):
+    folder = str(tmp_path)
+    make_pdf(folder, "a.pdf")
+    with open(os.path.join(folder, "notes.txt"), "w") as f:
+        f.write("x")
+    state_path = str(tmp_path / "state.sqlite3")
+
+    def process_batch(filenames):
+        for name in filenames:
+            if name.endswith(".pdf"):
+                yield {"file": os.path.join(folder, name), "status": "skipped", "new_name": None}
+
+    with WatchState(state_path) as state:
+        run(folder, process_batch, state, stop_after=1)
+        known = state.known(os.path.abspath(folder))
+    assert "a.pdf" in known and "notes.txt" in known
@@ -0,0 +1,249 @@
+"""
+监视收件文件夹：扫描仪、邮件网关随时往文件夹里放发票，新文件写完后自动原地重命名，不用每次打开界面选目录。
+
+- 装了 watchdog（pip install watchdog）时用系统的文件变化通知（Linux inotify、Windows ReadDirectoryChangesW）唤醒，
+  没装或启动失败时每隔 poll_interval 秒扫描一次目录；
+- 文件大小和修改时间连续 settle 秒不变才算写完，PDF 还要求结尾有 %%EOF，正在写的文件不会被读到一半；
+- 处理过的文件（含重命名后的新文件名）记在 watch_state.sqlite3（程序同目录）中，
+  重启后只处理停机期间新到或被改过的文件，不会重复处理。
+
+用法：
+    with WatchState() as state:
+        for result in watch_folder(folder, process_batch, state):
+            ...   # process_batch(filenames) 返回 process_folder 的结果生成器
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+STATE_FILENAME = "watch_state.sqlite3"
+SETTLE_SECONDS = 2.0      # 文件大小和修改时间多久不变算写完
+POLL_INTERVAL = 5.0       # 轮询模式扫描目录的间隔，秒
+RESCAN_INTERVAL = 60.0    # 用文件变化通知时也定期全量扫描一次，防止漏掉通知
+EVENT_DEBOUNCE = 0.5      # 收到通知后再等一会儿，大文件写入时的一串通知只扫描一次
+PDF_TAIL_SIZE = 1024
+INCOMPLETE_TIMEOUT = 60.0   # PDF 结尾没有 %%EOF 但这么久没变过，当作写完（可能本身就是坏文件），交给处理流程报错
+# 下载工具、Office、同步盘写入过程中的临时文件
+TEMP_SUFFIXES = (".tmp", ".part", ".crdownload", ".download", ".partial")
+
+
+def default_state_path():
+    # 打包成 exe 时放在 exe 旁边，源码运行时放在脚本旁边
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, STATE_FILENAME)
+
+
+class WatchState:
+    """
+    监视过的目录，以及已处理文件表：(目录, 文件名) -> (大小, 修改时间, 结果)。大小或修改时间变了说明是新文件，会重新处理。
+    只在 watch_folder 所在的线程中使用。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_state_path()
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS watched_folder ("
+            " folder TEXT PRIMARY KEY,"
+            " started REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS watched_file ("
+            " folder TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " processed REAL NOT NULL,"
+            " PRIMARY KEY (folder, name));"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def register(self, folder):
+        """记下开始监视 folder，第一次监视这个目录时返回 True。"""
+        cur = self.conn.execute("INSERT OR IGNORE INTO watched_folder (folder, started) VALUES (?, ?)",
+                                (folder, time.time()))
+        self.conn.commit()
+        return cur.rowcount == 1
+
+    def known(self, folder):
+        """返回 folder 中已处理过的文件：文件名 -> (大小, 修改时间)。"""
+        rows = self.conn.execute(
+            "SELECT name, size, mtime_ns FROM watched_file WHERE folder = ?", (folder,)).fetchall()
+        return {name: (size, mtime_ns) for name, size, mtime_ns in rows}
+
+    def mark(self, folder, entries):
+        """entries：(文件名, 大小, 修改时间, 结果) 的列表。"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO watched_file (folder, name, size, mtime_ns, status, processed)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(folder, name, size, mtime_ns, status, now) for name, size, mtime_ns, status in entries],
+        )
+        self.conn.commit()
+
+    def prune(self, folder, names):
+        """删除目录中已不存在的文件的记录（被改名、移走或删除）。"""
+        gone = set(self.known(folder)) - set(names)
+        self.conn.executemany("DELETE FROM watched_file WHERE folder = ? AND name = ?",
+                              [(folder, name) for name in gone])
+        self.conn.commit()
+        return len(gone)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def _candidate(name):
+    lower = name.lower()
+    return not name.startswith((".", "~$")) and not lower.endswith(TEMP_SUFFIXES)
+
+
+def _complete(path):
+    """PDF 写完后最后一部分里有 %%EOF；其他文件（图片）只靠大小和修改时间不变判断。"""
+    if not path.lower().endswith(".pdf"):
+        return True
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - PDF_TAIL_SIZE))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+def _scan(folder):
+    """文件名 -> (大小, 修改时间)，只含普通文件。"""
+    files = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not _candidate(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            files[entry.name] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def _start_observer(folder, wake, log):
+    """用 watchdog 订阅目录变化，有变化时 wake.set()；没装 watchdog 或启动失败时返回 None。"""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        log("未安装 watchdog，改为定时扫描目录\n")
+        return None
+
+    class _Wake(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    observer = Observer()
+    try:
+        observer.schedule(_Wake(), folder, recursive=False)
+        observer.start()
+    except Exception as e:
+        log(f"文件变化通知启动失败（{e}），改为定时扫描目录\n")
+        return None
+    return observer
+
+
+def watch_folder(folder, process_batch, state, settle=SETTLE_SECONDS, poll_interval=POLL_INTERVAL,
+                 use_events=True, include_existing=False, stop=None, log=print):
+    """
+    监视 folder，把写完的新文件交给 process_batch 处理，产出 process_batch 给出的结果，直到 stop 被设置。
+
+    :param process_batch: process_batch(filenames) -> 结果字典的可迭代对象（process_folder 的结果格式），
+                          结果中的 file / new_name 用来记下处理后的文件，重命名后的文件不会再被当成新文件。
+    :param state: WatchState。
+    :param include_existing: 第一次监视这个目录时是否处理目录中已有的文件；默认只记下它们，之后新到的才处理。
+    :param stop: threading.Event，设置后处理完当前这批就返回；None 时一直运行（命令行用 Ctrl+C 结束）。
+    """
+    folder = os.path.abspath(folder)
+    stop = stop or threading.Event()
+    wake = threading.Event()
+    observer = _start_observer(folder, wake, log) if use_events else None
+    log(f"开始监视目录：{folder}（{'文件变化通知' if observer is not None else f'每 {poll_interval:g} 秒扫描'}）\n")
+
+    if state.register(folder) and not include_existing:
+        existing = _scan(folder)
+        state.mark(folder, [(name, size, mtime, "existing") for name, (size, mtime) in existing.items()])
+        known = state.known(folder)
+        log(f"首次监视，目录中已有的{len(existing)}个文件不处理\n")
+    else:
+        removed = state.prune(folder, _scan(folder))
+        known = state.known(folder)
+        if removed:
+            log(f"已清理{removed}条不存在的文件记录\n")
+
+    pending = {}   # 文件名 -> ((大小, 修改时间), 开始不变的时刻)
+    try:
+        while not stop.is_set():
+            wake.clear()
+            now = time.monotonic()
+            files = _scan(folder)
+            ready = []
+            for name, stat in files.items():
+                if known.get(name) == stat:
+                    continue
+                seen = pending.get(name)
+                if seen is None or seen[0] != stat:
+                    pending[name] = (stat, now)
+                elif now - seen[1] >= settle and stat[0] > 0 and (
+                        _complete(os.path.join(folder, name)) or now - seen[1] >= INCOMPLETE_TIMEOUT):
+                    ready.append(name)
+            for name in list(pending):
+                if name not in files:
+                    del pending[name]
+
+            if ready:
+                ready.sort()
+                log(f"\n新到{len(ready)}个文件\n")
+                unprocessed = set(ready)
+                for result in process_batch(ready):
+                    # 每个结果先记下再交给调用方：中途 Ctrl+C 或崩溃时，已改名的文件重启后也不会再处理一遍；
+                    # 没能重命名的文件也记下，文件不变就不会每次扫描都重试
+                    name = os.path.basename(result["file"])
+                    unprocessed.discard(name)
+                    entries = [(name, *files.get(name, (0, 0)), result["status"])]
+                    if result["new_name"]:
+                        new_path = os.path.join(folder, result["new_name"])
+                        try:
+                            st = os.stat(new_path)
+                        except OSError:
+                            pass
+                        else:
+                            entries.append((result["new_name"], st.st_size, st.st_mtime_ns, result["status"]))
+                    state.mark(folder, entries)
+                    yield result
+                # 整批处理完还没有结果的是不支持的文件
+                state.mark(folder, [(name, *files[name], "ignored") for name in unprocessed])
+                known = state.known(folder)
+                for name in ready:
+                    pending.pop(name, None)
+                continue
+
+            if pending:
+                timeout = min(settle, poll_interval) if observer is None else settle
+            else:
+                timeout = poll_interval if observer is None else RESCAN_INTERVAL
+            if wake.wait(timeout):
+                stop.wait(EVENT_DEBOUNCE)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
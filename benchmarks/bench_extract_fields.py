@@ -0,0 +1,129 @@
+"""
+extract_fields_from_text 微基准：对比改造前（每次传正则字符串、9 次独立匹配）和
+改造后（导入时编译的字段规则表、只匹配选中的字段、有上限的量词）的单张发票解析耗时。
+
+运行：
+    python benchmarks/bench_extract_fields.py
+    python benchmarks/bench_extract_fields.py --number 2000 --json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "G-P-3-Local"))
+
+from rename_core import FIELD_KEYS, extract_fields_from_text  # noqa: E402
+
+SAMPLE_TEXT = """电子发票（普通发票） 发票号码：25117000002480760350
+开票日期：2025年02月27日
+购 名称：武汉东湖学院 销 名称：腾讯云计算（北京）有限责任公司
+买 售
+方 方
+信 统一社会信用代码/纳税人识别号：52420000123406283N 信 统一社会信用代码/纳税人识别号：91110108MA01KP2T4J
+息 息
+项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额
+*信息技术服务*云服务费 套 1 94.34 94.34 6% 5.66
+合 计 ¥94.34 ¥5.66
+价税合计（大写） 壹佰元整 （小写）¥100.00
+备
+注
+开票人：王丽丽
+"""
+
+# 病态输入：大量“合计 / 价税合计”标签但后面没有金额，旧正则每个位置都要扫到文末再回溯
+PATHOLOGICAL_TEXT = "价税合计 合 计 说明 " * 2000
+
+
+def legacy_extract_fields_from_text(text, fields):
+    """改造前的实现，原样保留用于对比。"""
+    results = {}
+    text = re.sub(r'\s+', ' ', text)
+
+    tax_numbers = re.findall(r"统一社会信用代码/纳税人识别号[：:]\s*([\w\d]+)", text)
+    buy_tax_number = tax_numbers[0] if len(tax_numbers) > 0 else ""
+    sell_tax_number = tax_numbers[1] if len(tax_numbers) > 1 else ""
+    if "购方税号" in fields:
+        results["购方税号"] = buy_tax_number
+    if "销方税号" in fields:
+        results["销方税号"] = sell_tax_number
+
+    m = re.search(r"购\s*名称[：:]\s*(.*?)\s+销\s*名称[：:]\s*(.*?)\s", text)
+    if m:
+        if "购方名称" in fields:
+            results["购方名称"] = m.group(1).strip()
+        if "销方名称" in fields:
+            results["销方名称"] = m.group(2).strip()
+
+    m = re.search(r"发票号码[：:]\s*([\d\w]+)", text)
+    if "发票号码" in fields:
+        results["发票号码"] = m.group(1).strip() if m else ""
+
+    m = re.search(r"开票日期[：:]\s*([\d年月日\-]+)", text)
+    if "开票日期" in fields:
+        results["开票日期"] = m.group(1).strip() if m else ""
+
+    m = re.search(r"合\s*计\s*¥?([\d\.]+)", text)
+    if "合计" in fields:
+        results["合计"] = m.group(1).strip() if m else ""
+
+    m = re.search(r"合\s*计.*?¥?([\d\.]+)\s*\*?\s*¥?([\d\.]+)", text)
+    if m and "总税额" in fields:
+        results["总税额"] = m.group(2).strip()
+
+    m = re.search(r"价税合计.*（小写）¥([\d\.]+)", text, re.DOTALL)
+    if "价税合计" in fields:
+        results["价税合计"] = m.group(1).strip() if m else ""
+
+    m = re.search(r"价税合计（大写）\s*([\S]+)", text)
+    if "价税合计大写" in fields:
+        results["价税合计大写"] = m.group(1).strip() if m else ""
+
+    m = re.search(r"开票人[:：]\s*([\S]+)", text)
+    if "开票人" in fields:
+        results["开票人"] = m.group(1).strip() if m else ""
+
+    return results
+
+
+def per_call_us(func, text, fields, number):
+    seconds = min(timeit.repeat(lambda: func(text, fields), number=number, repeat=3))
+    return seconds / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extract_fields_from_text 改造前后耗时对比")
+    parser.add_argument("--number", type=int, default=5000, help="每组重复次数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    default_fields = ["销方名称", "开票日期", "合计"]
+    # 两种实现在样例发票上结果必须一致
+    for fields in (FIELD_KEYS, default_fields):
+        legacy = legacy_extract_fields_from_text(SAMPLE_TEXT, fields)
+        assert extract_fields_from_text(SAMPLE_TEXT, fields) == {k: legacy.get(k, "") for k in fields}
+
+    cases = [
+        ("sample/all_fields", SAMPLE_TEXT, FIELD_KEYS, args.number),
+        ("sample/default_template", SAMPLE_TEXT, default_fields, args.number),
+        ("pathological/all_fields", PATHOLOGICAL_TEXT, FIELD_KEYS, 1),
+    ]
+    rows = []
+    for name, text, fields, number in cases:
+        before = per_call_us(legacy_extract_fields_from_text, text, fields, number)
+        after = per_call_us(extract_fields_from_text, text, fields, number)
+        rows.append({"case": name, "chars": len(text), "before_us": round(before, 2),
+                     "after_us": round(after, 2), "speedup": round(before / after, 1)})
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'case':<26}{'chars':>8}{'before(us)':>14}{'after(us)':>12}{'speedup':>9}")
+    for r in rows:
+        print(f"{r['case']:<26}{r['chars']:>8}{r['before_us']:>14.2f}{r['after_us']:>12.2f}{r['speedup']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
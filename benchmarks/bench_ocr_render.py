@@ -0,0 +1,146 @@
+"""
+扫描件 PDF 渲染基准：对比改造前（pdf2image 每个文件起一个 poppler 子进程，所有页一次性转成 300DPI 图片）
+和改造后（pdfium 在本进程内逐页渲染，先用 150DPI，识别到发票主体后不再渲染后面的页）的耗时和峰值内存。
+
+每种方式在独立子进程中运行，峰值内存取子进程的 VmHWM（Linux）或 ru_maxrss。
+没有安装 pdf2image / poppler 时，改造前的方式用 pdfium 300DPI 一次性渲染全部页代替（内存占用模式相同）。
+加 --ocr 时渲染后再调用 PaddleOCR 识别（需要安装 paddleocr），否则只统计渲染部分。
+
+运行：
+    python benchmarks/bench_ocr_render.py
+    python benchmarks/bench_ocr_render.py --files 10 --pages 3 --json
+    python benchmarks/bench_ocr_render.py --folder D:/发票/扫描件 --ocr
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "G-P-1-ChatAi")
+
+# 与 chat_ai_rename.OCR_DPI_STEPS[0] 一致；只测渲染时不导入 chat_ai_rename（依赖 langchain）
+FIRST_DPI = 150
+
+# 子进程里执行的脚本：处理完所有文件后打印一行 JSON
+PROBE = r"""
+import json, os, sys, time
+sys.path.insert(0, %(app_dir)r)
+mode, files, ocr = %(mode)r, %(files)r, %(ocr)r
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 会从父进程继承，优先读本进程的 VmHWM
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+extractor = None
+if ocr:
+    from chat_ai_rename import ImageOcrExtractor
+    extractor = ImageOcrExtractor()
+import pypdfium2 as pdfium
+baseline = peak_rss_mb()
+
+start = time.perf_counter()
+pages = 0
+for path in files:
+    if mode == "after":
+        if extractor is not None:
+            extractor._extract_text_from_pdf(path)
+            continue
+        pdf = pdfium.PdfDocument(path)
+        page = pdf[0]
+        page.render(scale=%(dpi)d / 72).to_pil().close()
+        page.close()
+        pdf.close()
+        pages += 1
+    else:
+        try:
+            from pdf2image import convert_from_path
+            images = convert_from_path(path, dpi=300)
+        except ImportError:
+            pdf = pdfium.PdfDocument(path)
+            images = [pdf[i].render(scale=300 / 72).to_pil() for i in range(len(pdf))]
+            pdf.close()
+        pages += len(images)
+        if extractor is not None:
+            for image in images:
+                extractor._extract_text_from_single_image(image)
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "pages": pages, "peak_rss_mb": peak_rss_mb(), "baseline_rss_mb": baseline}))
+"""
+
+
+def make_scanned_pdfs(folder, count, pages):
+    """生成只有图片、没有文本层的 A4 扫描件 PDF（300DPI）。"""
+    from PIL import Image, ImageDraw
+
+    paths = []
+    for n in range(count):
+        images = []
+        for p in range(pages):
+            image = Image.new("L", (2480, 3508), 255)
+            draw = ImageDraw.Draw(image)
+            for row in range(40):
+                draw.text((150, 200 + row * 75), f"INVOICE {n:04d} PAGE {p + 1} LINE {row:02d} 94.34 5.66 100.00",
+                          fill=0)
+            draw.rectangle((120, 150, 2360, 3300), outline=0, width=4)
+            images.append(image.convert("RGB"))
+        path = os.path.join(folder, f"scan_{n:04d}.pdf")
+        images[0].save(path, save_all=True, append_images=images[1:], resolution=300)
+        paths.append(path)
+    return paths
+
+
+def run(mode, files, ocr):
+    code = PROBE % {"app_dir": APP_DIR, "dpi": FIRST_DPI, "mode": mode, "files": files, "ocr": ocr}
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描件 PDF 渲染耗时和峰值内存对比")
+    parser.add_argument("--folder", help="扫描件 PDF 所在目录，不传时生成合成扫描件")
+    parser.add_argument("--files", type=int, default=5, help="合成扫描件数量")
+    parser.add_argument("--pages", type=int, default=3, help="每个合成扫描件的页数")
+    parser.add_argument("--ocr", action="store_true", help="渲染后调用 PaddleOCR 识别")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.folder:
+            files = sorted(glob.glob(os.path.join(args.folder, "*.pdf")))
+        else:
+            files = make_scanned_pdfs(tmp, args.files, args.pages)
+        rows = []
+        for mode in ("before", "after"):
+            r = run(mode, files, args.ocr)
+            rows.append({"mode": mode, "files": len(files), "pages": r["pages"],
+                         "ms_per_file": round(r["seconds"] / len(files) * 1000, 1),
+                         "peak_rss_mb": round(r["peak_rss_mb"], 1) if r["peak_rss_mb"] else None,
+                         "rss_growth_mb": round(r["peak_rss_mb"] - r["baseline_rss_mb"], 1)
+                         if r["peak_rss_mb"] else None})
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    print(f"{'mode':<8}{'files':>7}{'pages':>7}{'ms/file':>10}{'peak RSS(MB)':>14}{'growth(MB)':>12}")
+    for r in rows:
+        print(f"{r['mode']:<8}{r['files']:>7}{r['pages']:>7}{r['ms_per_file']:>10}"
+              f"{str(r['peak_rss_mb']):>14}{str(r['rss_growth_mb']):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+吞吐量基准：用 invoice_gen 生成合成发票，分别统计各步骤的单文件耗时，再按不同文件数跑完整的重命名流程。
+
+分步骤（每步抽 --sample 个文件，单文件耗时与总文件数无关）：
+- pdf_text：pdfplumber 打开 PDF 并提取文本（rename_core.read_pdf_text / get_full_text）；
+- parse：extract_fields_from_text 正则解析；
+- ocr：ImageOcrExtractor.extract_from_path 识别扫描件（加 --ocr 时才测，需要 paddleocr）；
+- rename：拼文件名、判断冲突、os.rename。
+端到端：对 --sizes 中的每个文件数生成一个目录，调用 process_folder（原地重命名、不用缓存）跑完，统计总耗时和每秒文件数。
+
+结果是 JSON，--out 写到文件；--baseline 传入之前保存的结果时逐项比较，变慢超过 --tolerance 时退出码为 1，
+发布新版本前跑一遍即可发现性能回退。
+
+运行：
+    python benchmarks/bench_pipeline.py --sizes 100 --out bench.json
+    python benchmarks/bench_pipeline.py --sizes 100,10000,100000 --workers 8 --baseline bench.json
+    python benchmarks/bench_pipeline.py --app G-P-1-ChatAi --ocr --scanned 0.1 --sizes 100
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, BENCH_DIR)
+
+import invoice_gen  # noqa: E402
+
+DEFAULT_SIZES = "100,10000,100000"
+DEFAULT_FIELDS = ["销方名称", "开票日期", "合计"]
+
+
+def summarize(durations):
+    """单文件耗时列表 -> 毫秒统计。"""
+    if not durations:
+        return None
+    ms = sorted(d * 1000 for d in durations)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {"files": len(ms), "total_s": round(sum(ms) / 1000, 3), "mean_ms": round(statistics.fmean(ms), 3),
+            "p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3), "max_ms": round(ms[-1], 3)}
+
+
+def timed(func, items):
+    durations, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(func(item))
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+def load_app(app):
+    sys.path.insert(0, os.path.join(ROOT, app))
+    core = importlib.import_module("rename_core")
+    if hasattr(core, "read_pdf_text"):
+        read_text = core.read_pdf_text
+    else:
+        def read_text(path, fields=None, max_pages=core.DEFAULT_MAX_PAGES):
+            return core.get_full_text(path, log=lambda msg: None, fields=fields, max_pages=max_pages) or ""
+    return core, read_text
+
+
+def bench_stages(core, read_text, args, workdir):
+    """各步骤的单文件耗时。"""
+    folder = os.path.join(workdir, "stages")
+    files = invoice_gen.generate(folder, args.sample, args.multipage, args.scanned if args.ocr else 0.0, args.seed)
+    text_files = [path for path, kind, _ in files if kind != "scanned"]
+    stages = {}
+
+    durations, texts = timed(lambda p: read_text(p, DEFAULT_FIELDS, core.DEFAULT_MAX_PAGES), text_files)
+    stages["pdf_text"] = summarize(durations)
+    stages["parse"] = summarize(timed(lambda t: core.extract_fields_from_text(t, DEFAULT_FIELDS), texts)[0])
+
+    scanned = [path for path, kind, _ in files if kind == "scanned"]
+    if args.ocr and scanned:
+        from chat_ai_rename import ImageOcrExtractor
+        extractor = ImageOcrExtractor()
+        stages["ocr"] = summarize(timed(lambda p: extractor.extract_from_path(p, DEFAULT_FIELDS), scanned)[0])
+    else:
+        stages["ocr"] = None
+
+    def rename(path):
+        name = core.sanitize_filename(f"发票_{os.path.basename(path)}")
+        new_path = os.path.join(os.path.dirname(path), name)
+        if not os.path.exists(new_path):
+            os.rename(path, new_path)
+    stages["rename"] = summarize(timed(rename, [path for path, _, _ in files])[0])
+    shutil.rmtree(folder, ignore_errors=True)
+    return stages
+
+
+def bench_end_to_end(core, args, workdir, size):
+    folder = os.path.join(workdir, f"e2e_{size}")
+    start = time.perf_counter()
+    invoice_gen.generate(folder, size, args.multipage, args.scanned if args.ocr else 0.0, args.seed)
+    os.remove(os.path.join(folder, "truth.jsonl"))
+    generated = time.perf_counter() - start
+
+    kwargs = {"backend": "ai" if args.ocr else "local"} if "backend" in core.process_folder.__code__.co_varnames \
+        else {}
+    statuses = {}
+    start = time.perf_counter()
+    for result in core.process_folder(folder, DEFAULT_FIELDS, "_", workers=args.workers, cache_path=None,
+                                      in_place=True, log=lambda msg: None, **kwargs):
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(folder, ignore_errors=True)
+    return {"files": size, "seconds": round(elapsed, 3), "files_per_s": round(size / elapsed, 1),
+            "generate_s": round(generated, 3), "statuses": statuses}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """与之前的结果比较，返回变慢的项目列表。"""
+    regressions = []
+    for name, now in report["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if now and before and now["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append({"metric": f"stages.{name}.p50_ms", "baseline": before["p50_ms"],
+                                "current": now["p50_ms"]})
+    before_runs = {r["files"]: r for r in baseline.get("end_to_end", [])}
+    for now in report["end_to_end"]:
+        before = before_runs.get(now["files"])
+        if before and now["files_per_s"] < before["files_per_s"] / (1 + tolerance):
+            regressions.append({"metric": f"end_to_end.{now['files']}.files_per_s",
+                                "baseline": before["files_per_s"], "current": now["files_per_s"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分步骤和端到端吞吐量基准")
+    parser.add_argument("--app", default="G-P-3-Local", help="要测的程序目录（默认：G-P-3-Local）")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"端到端的文件数，逗号分隔（默认：{DEFAULT_SIZES}）")
+    parser.add_argument("--sample", type=int, default=200, help="分步骤统计时抽取的文件数（默认：200）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="pdf 解析进程数（默认：CPU 核数）")
+    parser.add_argument("--multipage", type=float, default=0.2, help="多页发票比例（默认：0.2）")
+    parser.add_argument("--scanned", type=float, default=0.1, help="加 --ocr 时扫描件的比例（默认：0.1）")
+    parser.add_argument("--ocr", action="store_true", help="包含扫描件并统计 OCR（需要 paddleocr，仅 G-P-1-ChatAi）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--workdir", help="生成文件的目录，如要测网络共享盘上的重命名（默认：系统临时目录）")
+    parser.add_argument("--out", help="把 JSON 结果写到文件")
+    parser.add_argument("--baseline", help="之前保存的 JSON 结果，用于检查性能回退")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许变慢的比例（默认：0.2）")
+    args = parser.parse_args()
+
+    core, read_text = load_app(args.app)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        report = {
+            "meta": {"app": args.app, "commit": git_commit(), "python": platform.python_version(),
+                     "platform": platform.platform(), "cpu_count": os.cpu_count(), "workers": args.workers,
+                     "multipage": args.multipage, "scanned": args.scanned if args.ocr else 0.0,
+                     "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+            "stages": bench_stages(core, read_text, args, workdir),
+            "end_to_end": [],
+        }
+        for size in sizes:
+            print(f"端到端 {size} 个文件...", file=sys.stderr)
+            report["end_to_end"].append(bench_end_to_end(core, args, workdir, size))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+启动耗时基准：在全新的子进程里导入界面入口用到的模块（invoice_rename_config、rename_function），
+统计导入耗时、已加载的重量级依赖；有图形环境时再统计配置窗口 FieldSelector 创建并绘制出来的耗时。
+
+重量级依赖（pdfplumber / langchain / openai / numpy / PIL / paddleocr / pdf2image）应当一个都不加载，
+它们要等到第一个需要 pdf 解析、OCR 或大模型的文件时才导入。
+
+运行：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --app G-P-3-Local --repeat 10 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["pdfplumber", "langchain_core", "langchain_openai", "openai", "numpy", "PIL", "paddleocr",
+                 "pdf2image", "chat_ai_rename"]
+
+# 子进程里执行的脚本：只打印一行 JSON
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import invoice_rename_config
+import rename_function
+imported = time.perf_counter()
+window = None
+try:
+    app = invoice_rename_config.FieldSelector(invoice_rename_config.fields)
+    app.update()
+    window = time.perf_counter() - start
+    app.destroy()
+except Exception:
+    pass  # 没有图形环境
+print(json.dumps({
+    "import_s": imported - start,
+    "window_s": window,
+    "heavy": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def probe(app_dir):
+    out = subprocess.run([sys.executable, "-c", PROBE % (HEAVY_MODULES,)], cwd=app_dir,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="配置窗口启动耗时")
+    parser.add_argument("--app", default="G-P-1-ChatAi", help="要测的程序目录（默认：G-P-1-ChatAi）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复启动次数，取中位数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    app_dir = os.path.join(ROOT, args.app)
+    runs = [probe(app_dir) for _ in range(args.repeat)]
+    windows = [r["window_s"] for r in runs if r["window_s"] is not None]
+    row = {
+        "app": args.app,
+        "import_ms": round(statistics.median(r["import_s"] for r in runs) * 1000, 1),
+        "window_ms": round(statistics.median(windows) * 1000, 1) if windows else None,
+        "heavy_modules_loaded": runs[0]["heavy"],
+    }
+
+    if args.json:
+        print(json.dumps(row, ensure_ascii=False, indent=2))
+        return
+    print(f"app: {row['app']}")
+    print(f"导入界面模块: {row['import_ms']} ms")
+    print(f"配置窗口出现: {row['window_ms']} ms" if windows else "配置窗口出现: 无图形环境，未测")
+    print(f"已加载的重量级依赖: {', '.join(row['heavy_modules_loaded']) or '无'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Coze API 的本地替身服务，用来在不花额度、不联网的情况下测试 G-P-2-Coze 的并发上传、超时和重试。
+
+实现了 G-P-2-Coze 用到的接口：
+- POST /v1/files/upload：接收 multipart 上传，返回 {"code": 0, "data": {"id": ...}}；
+- POST /v1/workflow/run：等待 --latency 秒（上下浮动 --jitter）后返回
+  {"code": 0, "data": "{\"output\": \"发票_<原文件名>\"}"}；
+  带 "is_async": true 时立即返回 execute_id，--latency 秒后执行完；
+- GET /v1/workflows/<workflow_id>/run_histories/<execute_id>：异步执行的状态和结果；
+- GET /stats：已处理的请求数、注入的失败数、同时在处理的最大请求数、同时在执行的最大异步工作流数。
+按 --fail-rate 的比例随机返回 503（带 Retry-After: 0），用来验证客户端的重试。
+
+运行：
+    python benchmarks/coze_stub_server.py --port 8089 --latency 0.5 --fail-rate 0.1
+    然后在 G-P-2-Coze/config.json 中加 "api_base": "http://127.0.0.1:8089"（或设置环境变量 COZE_API_BASE）
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_FILENAME = re.compile(rb'filename="([^"]*)"')
+_HISTORY = re.compile(r"^/v1/workflows/[^/]+/run_histories/([^/?]+)$")
+
+
+class StubState:
+    def __init__(self, latency, jitter, fail_rate, seed):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files = {}           # file_id -> 原文件名
+        self.executions = {}      # execute_id -> (完成时间, 输出)
+        self.max_running = 0
+        self.requests = {}        # 接口 -> 次数
+        self.failures = 0
+        self.active = 0
+        self.max_active = 0
+
+    def begin(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            fail = self.rng.random() < self.fail_rate
+            if fail:
+                self.failures += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        return fail, delay
+
+    def end(self):
+        with self.lock:
+            self.active -= 1
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "failures": self.failures, "files": len(self.files),
+                    "max_active": self.max_active, "max_running": self.max_running}
+
+    def submit(self, delay, output):
+        with self.lock:
+            now = time.time()
+            execute_id = str(len(self.executions) + 1)
+            self.executions[execute_id] = (now + delay, output)
+            running = sum(1 for finish, _ in self.executions.values() if finish > now)
+            self.max_running = max(self.max_running, running)
+        return execute_id
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，客户端的连接池才能复用连接
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.reply(200, self.state.stats())
+        elif _HISTORY.match(self.path):
+            self.dispatch("/v1/workflows/run_histories", self.run_history, b"")
+        else:
+            self.reply(404, {"code": 404, "msg": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        handler = {"/v1/files/upload": self.upload, "/v1/workflow/run": self.run_workflow}.get(self.path)
+        if handler is None:
+            self.reply(404, {"code": 404, "msg": "not found"})
+            return
+        self.dispatch(self.path, handler, body)
+
+    def dispatch(self, name, handler, body):
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.reply(401, {"code": 4100, "msg": "missing token"})
+            return
+        fail, delay = self.state.begin(name)
+        try:
+            if fail:
+                self.reply(503, {"code": 503, "msg": "injected failure"}, [("Retry-After", "0")])
+                return
+            handler(body, delay)
+        finally:
+            self.state.end()
+
+    def upload(self, body, delay):
+        m = _FILENAME.search(body)
+        name = m.group(1).decode("utf-8", "replace") if m else "file.pdf"
+        file_id = hashlib.blake2b(body, digest_size=8).hexdigest()
+        with self.state.lock:
+            self.state.files[file_id] = name
+        time.sleep(delay / 10)  # 上传比工作流快得多
+        self.reply(200, {"code": 0, "msg": "", "data": {"id": file_id, "file_name": name, "bytes": len(body)}})
+
+    def run_workflow(self, body, delay):
+        try:
+            request = json.loads(body)
+            image = json.loads(request["parameters"]["image"])
+            name = self.state.files[image["file_id"]]
+        except (ValueError, KeyError, TypeError):
+            self.reply(200, {"code": 4000, "msg": "unknown file_id"})
+            return
+        output = json.dumps({"output": "发票_" + os.path.splitext(name)[0]}, ensure_ascii=False)
+        if request.get("is_async"):
+            execute_id = self.state.submit(delay, output)
+            self.reply(200, {"code": 0, "msg": "", "execute_id": execute_id, "data": ""})
+            return
+        time.sleep(delay)
+        self.reply(200, {"code": 0, "msg": "", "data": output})
+
+    def run_history(self, body, delay):
+        execute_id = _HISTORY.match(self.path).group(1)
+        with self.state.lock:
+            execution = self.state.executions.get(execute_id)
+        if execution is None:
+            self.reply(200, {"code": 4000, "msg": "unknown execute_id"})
+            return
+        finish, output = execution
+        if time.time() < finish:
+            history = {"execute_id": execute_id, "execute_status": "Running", "output": ""}
+        else:
+            # 与 Coze 一致，异步执行记录里的输出外面包了一层 {"Output": ...}
+            history = {"execute_id": execute_id, "execute_status": "Success",
+                       "output": json.dumps({"Output": output}, ensure_ascii=False)}
+        self.reply(200, {"code": 0, "msg": "", "data": [history]})
+
+
+def make_server(host="127.0.0.1", port=0, latency=0.5, jitter=0.2, fail_rate=0.0, seed=0):
+    """创建服务（port 为 0 时随机端口），调用方自己 serve_forever。"""
+    handler = type("Handler", (StubHandler,), {"state": StubState(latency, jitter, fail_rate, seed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coze API 本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="工作流平均耗时，秒（默认：0.5）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="耗时上下浮动，秒（默认：0.2）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机返回 503 的比例（默认：0）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency, args.jitter, args.fail_rate, args.seed)
+    print(f"Coze 替身服务：http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+合成发票 PDF 生成器，供基准测试使用。
+
+生成三种文件，文字排版与 rename_core.extract_fields_from_text 解析的电子发票一致：
+- text：带文本层的电子发票（直接手写 PDF，字体引用阅读器内置的 STSong-Light，不需要 reportlab，十万张也很快）；
+- multipage：第 1 页是发票，后面跟若干页“销售货物或应税劳务清单”；
+- scanned：把 text 发票用 pdfium 渲染成图片再存成只有图片的 PDF（需要 pypdfium2 和 Pillow，
+  系统里没有中文字体时渲染出的字是方块，只能用来测 OCR 耗时，不能测识别率）。
+
+每张发票的字段真值写到输出目录下的 truth.jsonl。
+
+运行：
+    python benchmarks/invoice_gen.py D:/tmp/invoices --count 1000 --multipage 0.2 --scanned 0.1
+"""
+import argparse
+import json
+import os
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+SELLERS = [
+    ("腾讯云计算（北京）有限责任公司", "91110108MA01KP2T4Q"),
+    ("阿里云计算有限公司", "91330106673959654P"),
+    ("北京京东世纪贸易有限公司", "911103026605038954"),
+    ("中国石化销售股份有限公司湖北武汉石油分公司", "91420100717918134N"),
+    ("武汉市汉阳区小李餐饮店", "92420105MA4KXY1238"),
+    ("深圳市顺丰速运有限公司", "91440300279421875G"),
+    ("华为技术有限公司", "914403001922038216"),
+    ("上海携程商务有限公司", "91310000717894522L"),
+]
+BUYERS = [
+    ("武汉东湖学院", "52420000123406283C"),
+    ("湖北某某科技有限公司", "91420100MA4F2ABC14"),
+    ("个人", ""),
+]
+ITEMS = [
+    ("*信息技术服务*云服务费", "套", "6%"),
+    ("*餐饮服务*餐饮服务", "次", "1%"),
+    ("*汽油*92号车用汽油(VIB)", "升", "13%"),
+    ("*物流辅助服务*收派服务费", "件", "6%"),
+    ("*计算机外部设备*移动硬盘", "个", "13%"),
+]
+PREPARERS = ["王丽丽", "张伟", "李娜", "刘洋", "陈静"]
+
+KINDS = ("text", "multipage", "scanned")
+
+_DIGITS = "零壹贰叁肆伍陆柒捌玖"
+_UNITS = ["", "拾", "佰", "仟"]
+_SECTIONS = ["", "万", "亿"]
+
+
+def amount_in_words(amount):
+    """金额转中文大写，如 Decimal("100.00") -> "壹佰圆整"。"""
+    amount = Decimal(amount).quantize(Decimal("0.01"), ROUND_HALF_UP)
+    integer, fraction = divmod(int(amount * 100), 100)
+    words = ""
+    if integer:
+        sections = []
+        while integer:
+            integer, section = divmod(integer, 10000)
+            sections.append(section)
+        zero = False
+        for i in range(len(sections) - 1, -1, -1):
+            section = sections[i]
+            if section == 0:
+                zero = bool(words)
+                continue
+            part = ""
+            for pos in range(3, -1, -1):
+                digit = section // 10 ** pos % 10
+                if digit == 0:
+                    zero = bool(words or part)
+                    continue
+                if zero:
+                    part += "零"
+                    zero = False
+                part += _DIGITS[digit] + _UNITS[pos]
+            words += part + _SECTIONS[i]
+        words += "圆"
+    jiao, fen = divmod(fraction, 10)
+    if not jiao and not fen:
+        return (words or "零圆") + "整"
+    if jiao:
+        words += _DIGITS[jiao] + "角"
+    elif words:
+        words += "零"
+    if fen:
+        words += _DIGITS[fen] + "分"
+    else:
+        words += "整"
+    return words
+
+
+def random_invoice(rng, index):
+    """随机生成一张发票的字段。"""
+    seller_name, seller_tax = rng.choice(SELLERS)
+    buyer_name, buyer_tax = rng.choice(BUYERS)
+    item, unit, rate = rng.choice(ITEMS)
+    quantity = rng.randint(1, 20)
+    price = Decimal(rng.randint(100, 200000)) / 100
+    amount = (price * quantity).quantize(Decimal("0.01"))
+    tax = (amount * Decimal(rate.rstrip("%")) / 100).quantize(Decimal("0.01"), ROUND_HALF_UP)
+    total = amount + tax
+    month, day = rng.randint(1, 12), rng.randint(1, 28)
+    return {
+        "发票号码": f"25{rng.randint(10 ** 9, 10 ** 10 - 1)}{index:08d}",
+        "开票日期": f"2025年{month:02d}月{day:02d}日",
+        "购方名称": buyer_name,
+        "购方税号": buyer_tax,
+        "销方名称": seller_name,
+        "销方税号": seller_tax,
+        "合计": f"{amount}",
+        "总税额": f"{tax}",
+        "价税合计": f"{total}",
+        "价税合计大写": amount_in_words(total),
+        "开票人": rng.choice(PREPARERS),
+        "_item": (item, unit, quantity, price, rate),
+    }
+
+
+def invoice_lines(inv):
+    """发票第 1 页的文字行，排版与 pdfplumber 从真实电子发票提取出的文本一致。"""
+    item, unit, quantity, price, rate = inv["_item"]
+    return [
+        f"电子发票（普通发票） 发票号码：{inv['发票号码']}",
+        f"开票日期：{inv['开票日期']}",
+        f"购 名称：{inv['购方名称']} 销 名称：{inv['销方名称']}",
+        "买 售",
+        "方 方",
+        f"信 统一社会信用代码/纳税人识别号：{inv['购方税号']} 信 统一社会信用代码/纳税人识别号：{inv['销方税号']}",
+        "息 息",
+        "项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额",
+        f"{item} {unit} {quantity} {price} {inv['合计']} {rate} {inv['总税额']}",
+        f"合 计 ¥{inv['合计']} ¥{inv['总税额']}",
+        f"价税合计（大写） {inv['价税合计大写']} （小写）¥{inv['价税合计']}",
+        "备",
+        "注",
+        f"开票人：{inv['开票人']}",
+    ]
+
+
+def detail_lines(inv, page, rows=40):
+    item, unit, _, price, rate = inv["_item"]
+    lines = [f"销售货物或应税劳务、服务清单 第{page}页", f"发票号码：{inv['发票号码']}",
+             "序号 货物（劳务）名称 规格型号 单位 数量 单价 金额 税率 税额"]
+    for row in range(rows):
+        lines.append(f"{row + 1} {item} 型号{row:03d} {unit} 1 {price} {price} {rate} 0.00")
+    return lines
+
+
+def _pdf_string(text):
+    return "<" + text.encode("utf-16-be").hex().upper() + ">"
+
+
+def text_pdf(pages):
+    """
+    手写一个只含文字的 PDF，pages 为每页的文字行列表。
+    字体用 Adobe-GB1 的 STSong-Light（阅读器 / pdfminer 内置，不嵌入字体文件），编码 UniGB-UCS2-H。
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # 页面树，最后填写
+        "<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H"
+        " /DescendantFonts [4 0 R] >>",
+        "<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light"
+        " /CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >>"
+        " /FontDescriptor 5 0 R /DW 1000 /W [1 95 500] >>",
+        "<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880]"
+        " /ItalicAngle 0 /Ascent 752 /Descent -271 /CapHeight 737 /StemV 58 >>",
+    ]
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "14 TL", "30 800 Td"]
+        for line in lines:
+            ops.append(f"{_pdf_string(line)} Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("ascii")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode("ascii") + stream + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842]"
+                       f" /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        if isinstance(body, str):
+            body = body.encode("ascii")
+        out += f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("ascii")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(out)
+
+
+def scanned_pdf(pdf_bytes, path, dpi=200):
+    """把文字 PDF 渲染成灰度图片，再存成只有图片、没有文本层的 PDF。"""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    images = []
+    for page in pdf:
+        images.append(page.render(scale=dpi / 72, grayscale=True).to_pil().convert("RGB"))
+        page.close()
+    pdf.close()
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=dpi)
+
+
+def generate(folder, count, multipage=0.0, scanned=0.0, seed=0, start=0):
+    """
+    在 folder 下生成 count 张发票，按比例混合三种文件，返回 [(路径, 种类, 字段)]。
+
+    :param multipage: 多页发票的比例。
+    :param scanned: 扫描件的比例。
+    :param start: 文件编号起点，往同一目录追加时使用。
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed * 1000003 + start)
+    files = []
+    with open(os.path.join(folder, "truth.jsonl"), "a", encoding="utf-8") as truth:
+        for n in range(start, start + count):
+            inv = random_invoice(rng, n)
+            r = rng.random()
+            kind = "scanned" if r < scanned else "multipage" if r < scanned + multipage else "text"
+            pages = [invoice_lines(inv)]
+            if kind == "multipage":
+                pages += [detail_lines(inv, p) for p in range(2, rng.randint(2, 6) + 1)]
+            path = os.path.join(folder, f"invoice_{n:06d}.pdf")
+            data = text_pdf(pages)
+            if kind == "scanned":
+                scanned_pdf(data, path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(data)
+            fields = {k: v for k, v in inv.items() if not k.startswith("_")}
+            truth.write(json.dumps({"file": os.path.basename(path), "kind": kind, "fields": fields},
+                                   ensure_ascii=False) + "\n")
+            files.append((path, kind, fields))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成发票 PDF")
+    parser.add_argument("folder", help="输出目录")
+    parser.add_argument("--count", type=int, default=100, help="发票数量")
+    parser.add_argument("--multipage", type=float, default=0.2, help="多页发票比例（默认：0.2）")
+    parser.add_argument("--scanned", type=float, default=0.0, help="扫描件比例（默认：0）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+    files = generate(args.folder, args.count, args.multipage, args.scanned, args.seed)
+    kinds = {kind: sum(1 for _, k, _ in files if k == kind) for kind in KINDS}
+    print(json.dumps({"folder": args.folder, "files": len(files), "kinds": kinds}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()